@@ -1,7 +1,9 @@
 # src/api.py
-import os, json, uuid
+import os, json, uuid, hashlib, asyncio
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -12,15 +14,33 @@ load_dotenv()
 # import your functions (adjust import paths if needed)
 from recommender import recommend_ticket_with_chunks
 from rag_chain import rag_answer_openai, summarize_ticket
+from vector_store import SimpleVectorStore, get_store, index_write_lock, bump_generation, EMB_PATH, META_PATH
+from single_flight import coalescing_stats
+from model_engine import get_batcher
+from prompt_builder import prompt_stats
+from llm_guard import chat_guard
+import retrieval_context
+import suggestion_worker
+from similar_tickets import similar_tickets, index as similar_index
+from chunk_dedup import dedup_stats
+from http_encoding import FastJSONResponse, CompressionMiddleware, compression_stats, dumps
 import db
+import warmup
+
+# per-ticket retrieval state follows every add_message / delete
+db.add_listener(retrieval_context.on_ticket_event)
 
 ROOT = os.path.join(os.path.dirname(__file__), "..")
-META_PATH = os.path.join(ROOT, "models", "chunk_meta.json")
+
+# "full" inlines chunk_text in evidence; "ref" sends ids and titles, and clients fetch
+# (and cache) the text from GET /knowledge/{chunk_id}. ?evidence= overrides per request.
+EVIDENCE_MODE = os.getenv("EVIDENCE_MODE", "full")
 
 # ------- Pydantic models -------
 class RecommendRequest(BaseModel):
     ticket_text: str
     top_k: Optional[int] = 5
+    evidence: Optional[str] = None  # "full" | "ref" (default EVIDENCE_MODE)
 
 class EvidenceItem(BaseModel):
     chunk_id: str
@@ -58,7 +78,17 @@ class SuggestionResponse(BaseModel):
 
 
 # ------- app -------
-app = FastAPI(title="AI Support Engine API")
+@asynccontextmanager
+async def lifespan(app):
+    # index, store connection, ticket indexes and API clients load in the background;
+    # /health reports 503 until they are ready
+    warmup.start()
+    yield
+
+app = FastAPI(title="AI Support Engine API", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# gzip/brotli above COMPRESS_MIN_BYTES, negotiated per request (see http_encoding.py)
+app.add_middleware(CompressionMiddleware)
 
 # CORS (allow local dev frontend)
 app.add_middleware(
@@ -70,56 +100,109 @@ app.add_middleware(
     ],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# load chunk metadata into memory (simple)
-def load_chunk_meta():
-    if not os.path.exists(META_PATH):
-        return []
-    with open(META_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-_chunk_meta = load_chunk_meta()
-_by_chunk = {m["chunk_id"]: m for m in _chunk_meta}
+# chunk metadata comes from the shared per-process store, which reloads itself
+# whenever any worker bumps the index generation (upload / delete / rebuild)
+def evidence_mode(requested):
+    mode = requested or EVIDENCE_MODE
+    if mode not in ("full", "ref"):
+        raise HTTPException(status_code=400, detail="evidence must be full or ref")
+    return mode
 
-def expand_citations(citation_list):
+def expand_citations(citation_list, mode="full"):
+    by_chunk = get_store().by_chunk
     out = []
     for c in citation_list:
-        info = _by_chunk.get(c)
+        info = by_chunk.get(c)
         if info:
             print(f"DEBUG: expand_citations {c} -> title='{info.get('title')}'")
             # optional: set file_url if your article has a file path in metadata
             file_url = info.get("file_url")  # if you added this during ingestion
             # developer instruction: if you want to expose uploaded file, here's the local path:
             # /mnt/data/Ruthvik Gurrala (2).pdf
-            out.append({
+            item = {
                 "chunk_id": c,
                 "article_id": info.get("article_id"),
                 "title": info.get("title"),
                 "chunk_text": info.get("chunk_text"),
                 "file_url": file_url or None
-            })
+            }
+            if mode == "ref":
+                del item["chunk_text"]  # by reference: GET /knowledge/{chunk_id}
+            out.append(item)
         else:
             print(f"DEBUG: expand_citations {c} -> MISSING")
             out.append({"chunk_id": c, "missing": True})
     return out
 
 @app.get("/health")
-def health():
-    return {"status": "ok"}
+def health(response: Response):
+    """200 once the startup warm-up has finished (see warmup.py), 503 while it runs."""
+    status = warmup.status()
+    if not status["ready"]:
+        response.status_code = 503
+    return {"status": "ok" if status["ready"] else "warming", **status}
+
+@app.get("/stats/prompts")
+def prompts():
+    """Prompt tokens sent vs. the legacy prompt layout, summed over generation requests."""
+    return prompt_stats()
+
+@app.get("/stats/llm")
+def llm_stats():
+    """Upstream LLM call outcomes: retries, hedges, breaker state and latency percentiles."""
+    return chat_guard.stats()
+
+@app.get("/stats/context")
+def context_stats():
+    """Per-ticket retrieval contexts: cache hits, messages embedded, warm re-ranks vs full searches."""
+    return retrieval_context.context_stats()
+
+@app.get("/stats/precompute")
+def precompute_stats():
+    return suggestion_worker.queue.snapshot()
+
+@app.get("/stats/similar")
+def similar_stats():
+    return similar_index.snapshot()
+
+@app.get("/stats/dedup")
+def dedup():
+    return dedup_stats()
+
+@app.get("/stats/compression")
+def compression():
+    return compression_stats()
+
+@app.get("/stats/coalescing")
+def coalescing():
+    """
+    Per-stage single-flight counters (calls received, upstream executions, calls saved)
+    and the query-embedding micro-batcher's request/API-call counts.
+    """
+    stats = coalescing_stats()
+    return {
+        "stages": stats,
+        "saved_total": sum(s["saved"] for s in stats.values()),
+        "embedding_batches": get_batcher().stats(),
+    }
 
 @app.post("/recommend", response_model=RecommendResponse)
 def recommend(req: RecommendRequest):
     if not req.ticket_text.strip():
         raise HTTPException(status_code=400, detail="ticket_text is empty")
+    mode = evidence_mode(req.evidence)
 
     # call your RAG wrapper which already returns parsed JSON
     resp = rag_answer_openai(req.ticket_text, top_k_chunks=req.top_k, max_prompt_chunks=3, threshold=0.25)
 
     # expand citations
-    evidence = expand_citations(resp.get("citations", []))
+    evidence = expand_citations(resp.get("citations", []), mode)
 
-    return RecommendResponse(
+    # validated here, so it is rendered as is rather than validated and encoded again
+    return FastJSONResponse(RecommendResponse(
         answer=resp.get("answer"),
         steps=resp.get("steps", []),
         citations=resp.get("citations", []),
@@ -127,7 +210,7 @@ def recommend(req: RecommendRequest):
         evidence=evidence,
         raw_model_output=resp.get("raw_model_output"),
         note=resp.get("note")
-    )
+    ).model_dump(exclude={"evidence": {"__all__": {"chunk_text"}}} if mode == "ref" else None))
 
 # simple feedback endpoint (append to a local file)
 FEEDBACK_PATH = os.path.join(ROOT, "data", "feedback.json")
@@ -165,42 +248,125 @@ def create_new_ticket(req: CreateTicketRequest):
     priority = analysis["priority"]
     
     tid = db.create_ticket(req.customer_id, req.text, tags, sentiment, priority)
-    return {"ticket_id": tid, "tags": tags, "sentiment": sentiment, "priority": priority}
+    # draft a suggestion before an agent opens the ticket
+    suggestion_worker.queue.enqueue(tid, priority)
+    # earlier near-duplicates; resolved ones carry the reply that closed them
+    similar = similar_tickets(req.text, exclude=tid)
+    return {"ticket_id": tid, "tags": tags, "sentiment": sentiment, "priority": priority, "similar": similar}
 
 @app.get("/tickets")
-def list_tickets(status: Optional[str] = None, customer_id: Optional[str] = None):
-    return db.get_tickets(status, customer_id)
+def list_tickets(
+    request: Request,
+    status: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    since: Optional[str] = None
+):
+    """
+    Lists tickets newest first.
+    - fields: comma-separated projection (e.g. "text,status,priority"); leave out "messages" for list views.
+    - limit/cursor: keyset pagination. When paginating the response is
+      {"tickets": [...], "next_cursor": str | None}; without them it is the plain list.
+    - since: change feed. Returns {"tickets": [changed], "deleted": [ids], "cursor": str};
+      pass the returned cursor as `since` on the next poll ("" for a full sync). A response with
+      "reset": true lists every ticket and replaces the client's copy.
+    Every response carries an ETag; a matching If-None-Match gets 304 Not Modified.
+    Ticket dicts are already JSON types, so they are rendered directly (no jsonable_encoder pass).
+    """
+    if limit is not None and not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+    # The marker is read before the data, so a write racing this request only makes the ETag stale (never wrong).
+    marker = db.get_change_marker()
+    etag = 'W/"%s"' % hashlib.sha1(f"{marker}|{request.url.query}".encode("utf-8")).hexdigest()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        if since is not None:
+            return FastJSONResponse(db.get_changes(since, customer_id, limit=limit, fields=field_list), headers=headers)
+        tickets = db.get_tickets(status, customer_id, limit=limit, cursor=cursor, fields=field_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if limit is None and cursor is None:
+        return FastJSONResponse(tickets, headers=headers)
+    next_cursor = db.encode_cursor(tickets[-1].get("created_at"), tickets[-1]["id"]) if limit is not None and len(tickets) == limit else None
+    return FastJSONResponse({"tickets": tickets, "next_cursor": next_cursor}, headers=headers)
+
+from change_feed import feed
+
+@app.get("/tickets/events")
+async def ticket_events(request: Request):
+    """
+    Server-Sent Events push channel. Each event names a changed ticket:
+        data: {"type": "message", "ticket_id": "...", "updated_at": 1700000000.0}
+    Clients then fetch the delta with GET /tickets?since=<cursor>.
+    Only changes made by this server process are pushed.
+    """
+    async def stream():
+        with feed.subscription() as q:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(q.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+from triage_queue import queue as triage
+
+@app.get("/queue/next")
+def queue_next():
+    """The open ticket to work on next: highest priority, most negative sentiment, oldest."""
+    return {"ticket": triage.next()}
+
+@app.get("/queue")
+def queue_list(limit: int = 20):
+    """Open tickets in triage order (see /queue/next), without messages."""
+    if not 1 <= limit <= 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    tickets, total = triage.top(limit)
+    return FastJSONResponse({"tickets": tickets, "total": total})
 
 @app.get("/tickets/{ticket_id}")
 def get_ticket_detail(ticket_id: str):
     t = db.get_ticket(ticket_id)
     if not t:
         raise HTTPException(404, "Ticket not found")
-    return t
-
-    return t
+    return FastJSONResponse(t)
 
 @app.post("/tickets/{ticket_id}/reply")
 def reply_ticket(ticket_id: str, req: ReplyRequest):
-    t = db.get_ticket(ticket_id)
-    if not t:
-        raise HTTPException(404, "Ticket not found")
-    
-    db.add_message(ticket_id, req.role, req.content)
-    
     # Dynamic Analysis: If customer replies, re-evaluate sentiment/priority
+    updates = None
     if req.role == "customer":
         analysis = classify_ticket(req.content)
-        db.update_ticket_metadata(ticket_id, {
+        updates = {
             "sentiment": analysis["sentiment"],
             "priority": analysis["priority"]
-        })
+        }
+
+    # message + metadata go out as a single write; a missing ticket is reported by the write itself
+    if not db.add_message(ticket_id, req.role, req.content, updates=updates):
+        raise HTTPException(404, "Ticket not found")
+    if updates:
+        suggestion_worker.queue.enqueue(ticket_id, updates["priority"])
 
     return {"status": "success"}
 
 @app.post("/tickets/{ticket_id}/suggest")
-def suggest_reply(ticket_id: str):
-    t = db.get_ticket(ticket_id)
+def suggest_reply(ticket_id: str, evidence: Optional[str] = None):
+    """evidence=ref returns evidence without chunk_text; fetch it from GET /knowledge/{chunk_id}."""
+    mode = evidence_mode(evidence)
+    # fresh: another worker may have just appended the customer message this has to answer
+    t = db.get_ticket(ticket_id, fresh=True)
     if not t:
         raise HTTPException(404, "Ticket not found")
     
@@ -211,20 +377,21 @@ def suggest_reply(ticket_id: str):
     if not last_customer_msg:
         return {"answer": "No customer message found to reply to.", "evidence": []}
 
-    # Call RAG with history
-    # We exclude the very last message from history because it's the 'current query'
-    # But rag_chain prompt builder handles it if we pass full history, or we can slice it.
-    # Let's pass the *previous* messages as history.
-    history = [m for m in messages if m["content"] != last_customer_msg] 
-    
-    print(f"DEBUG: suggest_reply query='{last_customer_msg}' history_len={len(history)}")
-    resp = rag_answer_openai(last_customer_msg, history=messages, top_k_chunks=5)
-    evidence = expand_citations(resp.get("citations", []))
+    # Precomputed in the background for the current message version: serve it as is
+    resp = suggestion_worker.fresh_suggestion(t)
+    precomputed = resp is not None
+    if not precomputed:
+        # Stale or not ready yet: run the live path (full history for context) and keep the result
+        print(f"DEBUG: suggest_reply query='{last_customer_msg}' history_len={len(messages)}")
+        resp = suggestion_worker.generate_suggestion(t)
+    evidence = expand_citations(resp.get("citations", []), mode)
     
     return {
         "answer": resp.get("answer"),
         "evidence": evidence,
-        "confidence": resp.get("confidence")
+        "confidence": resp.get("confidence"),
+        "note": resp.get("note"),
+        "precomputed": precomputed
     }
 
 @app.post("/tickets/{ticket_id}/resolve")
@@ -274,14 +441,23 @@ def get_content_gaps():
 # ------- Upload & Ingestion -------
 from fastapi import UploadFile, File
 import shutil
-from pypdf import PdfReader
 import uuid
 from chunker import chunk_text
-from model_engine import load_embedding_model, get_embeddings
+from model_engine import load_embedding_model, get_embeddings, output_dim, embedding_config
+from chunk_dedup import dedupe_chunks, apply_merges, record_dedup, DEDUP_MODE
+from vector_store import read_header, write_header, header_matches, atomic_save, save_meta, read_generation
+from embed_chunks import rebuild_index
 import numpy as np
 
+def _read_chunk_meta():
+    if not os.path.exists(META_PATH):
+        return []
+    with open(META_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+def upload_file(file: UploadFile = File(...)):
+    # sync on purpose: PDF parsing, embedding calls and the index lock run in the threadpool, off the event loop
     # 1. Save file locally
     local_path = os.path.join(ROOT, "data", file.filename)
     os.makedirs(os.path.dirname(local_path), exist_ok=True)
@@ -289,6 +465,7 @@ async def upload_file(file: UploadFile = File(...)):
         shutil.copyfileobj(file.file, buffer)
 
     # 2. Extract text (PDF only for now)
+    from pypdf import PdfReader  # only uploads need the PDF parser
     text = ""
     try:
         reader = PdfReader(local_path)
@@ -315,59 +492,115 @@ async def upload_file(file: UploadFile = File(...)):
             "file_url": f"/files/{file.filename}"
         })
 
-    # 4. Embedding
-    model = load_embedding_model()
-    new_texts = [m["chunk_text"] for m in new_meta]
-    new_embs = get_embeddings(model, new_texts) # numpy array
-
-    # 5. Update Vector Store (Append)
-    # Load existing
-    global _chunk_meta, _by_chunk
-    
-    # Update Metadata
-    _chunk_meta.extend(new_meta)
-    with open(META_PATH, "w", encoding="utf-8") as f:
-        json.dump(_chunk_meta, f, ensure_ascii=False, indent=2)
-    
-    # Update Embeddings
-    EMB_PATH = os.path.join(ROOT, "models", "chunk_embeddings.npy")
-    if os.path.exists(EMB_PATH):
-        try:
-            existing_embs = np.load(EMB_PATH)
-            if existing_embs.shape[1] == new_embs.shape[1]:
+    row_bytes = output_dim() * 4
+    total_chunks = len(new_meta)
+    # 4. Dedup against a snapshot of the index and embed with no lock held: the embedding
+    # call is a network round-trip, and other uploads, deletes and rebuilds must not wait on it
+    snap_gen = read_generation(EMB_PATH)
+    snap_meta = _read_chunk_meta()
+    snap_config = embedding_config()
+    # Near-duplicates of indexed chunks (or of each other) are dropped before paying for embeddings
+    new_meta, duplicates = dedupe_chunks(new_meta, existing=snap_meta, record=False)
+    new_embs = None
+    if new_meta:
+        new_embs = get_embeddings(load_embedding_model(), [m["chunk_text"] for m in new_meta])  # numpy array
+        if new_embs is None:
+            return {"error": "Embedding generation failed"}
+
+    # 5. Append under the cross-worker index lock, starting from what is on disk now
+    with index_write_lock(EMB_PATH):
+        chunk_meta = _read_chunk_meta()
+        if read_generation(EMB_PATH) != snap_gen:
+            # the index moved on while we embedded: re-check only against what changed since
+            snap_ids = {m.get("chunk_id") for m in snap_meta}
+            current_ids = {m.get("chunk_id") for m in chunk_meta}
+            added = [m for m in chunk_meta if m.get("chunk_id") not in snap_ids]
+            if added and new_meta:
+                # e.g. a concurrent upload of the same document got in first
+                kept, late = dedupe_chunks(new_meta, existing=added, record=False)
+                kept_ids = {id(c) for c in kept}
+                new_embs = new_embs[[i for i, c in enumerate(new_meta) if id(c) in kept_ids]]
+                new_meta, duplicates = kept, duplicates + late
+            # a duplicate of a chunk deleted meanwhile is indexed after all (rare: embedded under the lock)
+            targets = current_ids | {c.get("chunk_id") for c in new_meta}
+            orphans = [d for d in duplicates if d.get("duplicate_of") not in targets]
+            if orphans:
+                orphan_ids = {id(d) for d in orphans}
+                duplicates = [d for d in duplicates if id(d) not in orphan_ids]
+                for d in orphans:
+                    d.pop("duplicate_of", None)
+                rescued, still_dup = dedupe_chunks(orphans, existing=chunk_meta + new_meta, record=False)
+                duplicates += still_dup
+                if rescued:
+                    rescued_embs = get_embeddings(load_embedding_model(), [m["chunk_text"] for m in rescued])
+                    if rescued_embs is None:
+                        return {"error": "Embedding generation failed"}
+                    new_embs = rescued_embs if new_embs is None else np.vstack([new_embs, rescued_embs])
+                    new_meta = new_meta + rescued
+        record_dedup(total_chunks, len(duplicates), row_bytes)
+        if duplicates:
+            print(f"[INFO] {file.filename}: skipped {len(duplicates)} near-duplicate chunks of {total_chunks}.")
+        # merge targets may be indexed chunks or chunks of this upload
+        merged = apply_merges(chunk_meta + new_meta, duplicates) if DEDUP_MODE == "merge" else 0
+        if not new_meta:
+            # everything was a duplicate: only the "also_in" links change
+            if merged:
+                save_meta(chunk_meta, META_PATH)
+                bump_generation(EMB_PATH)
+            return {"status": "success", "chunks_added": 0, "duplicates_skipped": len(duplicates),
+                    "index_bytes_saved": len(duplicates) * row_bytes, "article_id": article_id, "filename": file.filename}
+        existing_embs = None
+        if os.path.exists(EMB_PATH):
+            try:
+                existing_embs = np.load(EMB_PATH)
+            except Exception as e:
+                print(f"[ERROR] Failed to load existing embeddings: {e}. Overwriting.")
+                chunk_meta = []
+
+        if embedding_config() != snap_config or (existing_embs is not None and len(existing_embs) and (
+            existing_embs.shape[1] != new_embs.shape[1] or not header_matches(read_header(EMB_PATH))
+        )):
+            # The index was built with other embedding settings (model/dimension/projection), or they
+            # changed while we embedded: re-embed everything consistently instead of dropping the old chunks.
+            print("[WARN] Index settings changed. Rebuilding vector store.")
+            if not rebuild_index(chunk_meta + new_meta, EMB_PATH, META_PATH):
+                return {"error": "Index rebuild failed"}
+        else:
+            if existing_embs is not None and len(existing_embs):
                 combined_embs = np.vstack([existing_embs, new_embs])
             else:
-                print(f"[WARN] Embedding dimension mismatch ({existing_embs.shape[1]} vs {new_embs.shape[1]}). Overwriting vector store.")
                 combined_embs = new_embs
-                # Also reset metadata to match new embeddings only? 
-                # Ideally yes, but for now we appended to _chunk_meta. 
-                # If we overwrite embeddings, we should strictly overwrite metadata to be safe, 
-                # but _chunk_meta was already extended above. 
-                # It's cleaner to let the user know they are resetting. 
-                # For safety/simplicity in this hotfix: we just overwrite the embeddings. 
-                # This results in "ghost" metadata for the old chunks which have no corresponding embeddings.
-                # Actually, if we overwrite embs, we MUST reset meta to `new_meta` only.
-                _chunk_meta = new_meta
-                with open(META_PATH, "w", encoding="utf-8") as f:
-                    json.dump(_chunk_meta, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"[ERROR] Failed to load existing embeddings: {e}. Overwriting.")
-            combined_embs = new_embs
-    else:
-        combined_embs = new_embs
-    
-    np.save(EMB_PATH, combined_embs)
+            save_meta(chunk_meta + new_meta, META_PATH)
+            atomic_save(EMB_PATH, combined_embs)
+            write_header(combined_embs, EMB_PATH)
+            # every worker's get_store() reloads on its next request
+            bump_generation(EMB_PATH)
 
-    # Refresh memory
-    _by_chunk = {m["chunk_id"]: m for m in _chunk_meta}
-    
     return {
         "status": "success", 
         "chunks_added": len(new_meta), 
+        "duplicates_skipped": len(duplicates),
+        "index_bytes_saved": len(duplicates) * row_bytes,
         "article_id": article_id,
         "filename": file.filename
     }
 
+import bulk_import
+
+@app.post("/tickets/import")
+def import_tickets(file: UploadFile = File(...), format: Optional[str] = None, start: int = 0, status: str = "open"):
+    """
+    Bulk import of historical tickets from a CSV/TSV or JSONL upload, streamed in batches.
+    Returns the throughput report; if it carries "error", re-upload with start=next_offset.
+    Classification runs in this worker's threadpool thread: forking a process pool from a
+    server process that already runs background threads can deadlock.
+    """
+    if format not in (None, "csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    if start < 0:
+        raise HTTPException(status_code=400, detail="start must be >= 0")
+    return bulk_import.import_upload(file.file, file.filename, fmt=format, start=start, status=status, workers=1)
+
 # optional: serve local files for dev (maps filename -> /mnt/data/<filename>)
 from fastapi.responses import FileResponse
 @app.get("/files/{filename}")
@@ -403,28 +636,82 @@ def get_canned_responses():
 
 # ------- Knowledge Base Endpoints -------
 
-from vector_store import SimpleVectorStore
 from rag_chain import translate_text
 
+import knowledge_index
+
 @app.get("/knowledge")
-def list_knowledge_chunks():
-    """Returns all chunks in the knowledge base."""
-    vs = SimpleVectorStore()
-    return vs.get_all_chunks()
+def list_knowledge_chunks(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    match: str = "substring",
+    group: Optional[str] = None,
+    article_id: Optional[str] = None,
+    text_chars: int = 0
+):
+    """
+    Browses the knowledge base, metadata only (full chunks: GET /knowledge/{chunk_id}).
+    - limit/cursor: keyset pages ordered by title, article, chunk number (default limit 50).
+      The response is {"chunks": [...], "next_cursor": str | None, "total": int | None}.
+    - q: search titles and text; match=substring (default) or prefix (every word starts a word).
+    - group=article: {"articles": [{article_id, title, file_url, chunks, first_match?}], ...} instead.
+    - article_id: only that article's chunks.
+    - text_chars: include the first N characters of each chunk's text (0 leaves it out).
+    Without any of these the response is the legacy plain list of every chunk.
+    """
+    if limit is None and cursor is None and q is None and group is None and article_id is None:
+        return FastJSONResponse(get_store().get_all_chunks())
+    limit = 50 if limit is None else limit
+    if not 1 <= limit <= knowledge_index.MAX_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {knowledge_index.MAX_PAGE}")
+    if match not in ("substring", "prefix"):
+        raise HTTPException(status_code=400, detail="match must be substring or prefix")
+    if group not in (None, "article"):
+        raise HTTPException(status_code=400, detail="group must be article")
+    if text_chars < 0:
+        raise HTTPException(status_code=400, detail="text_chars must be >= 0")
+
+    index = knowledge_index.get_index()
+    q = q.strip() if q else None
+    try:
+        if group == "article":
+            articles, next_cursor = index.article_page(limit, cursor, q, match)
+            total = None if q else len(index.article_keys)
+            return FastJSONResponse({"articles": articles, "next_cursor": next_cursor, "total": total})
+        rows, next_cursor = index.page(limit, cursor, q, match, article_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    total = None if q else (len(index) if article_id is None else index.article_size(article_id))
+    return FastJSONResponse({"chunks": [knowledge_index.list_item(m, text_chars) for m in rows],
+                             "next_cursor": next_cursor, "total": total})
+
+@app.get("/knowledge/{chunk_id}")
+def get_knowledge_chunk(chunk_id: str, request: Request):
+    """
+    One chunk with its text, for evidence returned by reference. Chunk ids come back with new
+    text after a knowledge-base rebuild, so clients keep a copy but revalidate it on every use:
+    the ETag hashes the content and a matching If-None-Match gets an empty 304.
+    """
+    info = get_store().by_chunk.get(chunk_id)
+    if not info:
+        raise HTTPException(404, "Chunk not found")
+    body = dumps(info)
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.delete("/knowledge/{chunk_id}")
 def delete_knowledge_chunk(chunk_id: str):
     """Deletes a specific chunk by ID."""
-    vs = SimpleVectorStore()
-    success = vs.delete_chunk(chunk_id)
+    # A private instance does the read-modify-write; the shared one keeps serving
+    # until the generation bump makes every worker reload on its next request
+    success = SimpleVectorStore().delete_chunk(chunk_id)
     if not success:
         raise HTTPException(404, "Chunk not found")
     
-    # Refresh in-memory cache
-    global _chunk_meta, _by_chunk
-    _chunk_meta = vs.get_all_chunks()
-    _by_chunk = {m["chunk_id"]: m for m in _chunk_meta}
-    
     return {"status": "deleted", "chunk_id": chunk_id}
 
 class TranslateRequest(BaseModel):
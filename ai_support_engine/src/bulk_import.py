@@ -0,0 +1,270 @@
+# src/bulk_import.py
+"""
+Streaming bulk import of historical tickets from CSV/TSV or JSONL.
+
+    python bulk_import.py ../data/tickets.csv
+    python bulk_import.py backfill.jsonl --batch-size 500 --workers 8 --status resolved
+
+Rows are read incrementally (never the whole file), classified in batches on a process
+pool and written with db.insert_tickets: one Firestore batched commit, or one local
+transaction, per batch. At most `max_pending` batches are in flight, so a fast reader
+cannot run ahead of slow writes. The number of rows safely written is checkpointed
+after every batch; an interrupted import resumes from there, and replaying a batch is
+harmless because ticket ids are deterministic and existing ids are never overwritten.
+"""
+import os
+import csv
+import codecs
+import json
+import time
+import uuid
+import itertools
+import threading
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import db
+from classifier import classify_many
+from vector_store import atomic_write_json
+
+# rows per classify + write step; Firestore still commits at most 500 documents at a time
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+# concurrent batch commits: overlaps Firestore round-trips; the local store serializes them anyway
+IMPORT_WRITERS = int(os.getenv("IMPORT_WRITERS", "4"))
+
+TEXT_FIELDS = ("text", "body", "content", "description")
+PROGRESS_EVERY_S = 5.0
+
+
+def _detect_format(name):
+    ext = os.path.splitext(name or "")[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson", ".json") else "csv"
+
+def iter_records(f, fmt="csv"):
+    """Yields one dict per row of a text stream. CSV delimiter (comma or tab) is taken from the header."""
+    if fmt == "jsonl":
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+        return
+    lines = iter(f)
+    header = next(lines, "")
+    if not header:
+        return
+    delimiter = "\t" if "\t" in header else ","
+    yield from csv.DictReader(itertools.chain([header], lines), delimiter=delimiter)
+
+def _timestamp(value, default):
+    if value in (None, ""):
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return default
+
+def _tags(value):
+    if isinstance(value, list):
+        return value
+    return [t.strip() for t in str(value).replace("|", ",").split(",") if t.strip()]
+
+def record_text(rec):
+    return next((str(rec[k]).strip() for k in TEXT_FIELDS if rec.get(k)), "")
+
+def build_ticket(rec, analysis, source, offset, status="open", now=None):
+    """
+    Ticket document for one input row, in the same shape as db.create_ticket.
+    The row's own id (or a uuid5 of source + row offset) is the ticket id, so a
+    re-imported row maps to the same ticket. tags/sentiment/priority/status/
+    created_at columns in the input win over the classifier and defaults.
+    """
+    now = now or time.time()
+    text = record_text(rec)
+    created = _timestamp(rec.get("created_at"), now)
+    ticket_id = str(rec.get("ticket_id") or rec.get("id") or uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{offset}"))
+    messages = rec.get("messages") if isinstance(rec.get("messages"), list) else [
+        {"role": "customer", "content": text, "ts": created}
+    ]
+    return {
+        "id": ticket_id,
+        "customer_id": str(rec.get("customer_id") or "import"),
+        "text": text,
+        "tags": _tags(rec["tags"]) if rec.get("tags") else analysis["tags"],
+        "sentiment": rec.get("sentiment") or analysis["sentiment"],
+        "priority": rec.get("priority") or analysis["priority"],
+        "status": rec.get("status") or status,
+        "created_at": created,
+        # write time, not the source's: the change feed (GET /tickets?since=) must see imported rows
+        "updated_at": now,
+        "messages": messages,
+    }
+
+
+class BulkImporter:
+    """
+    read -> classify (process pool) -> write (db.insert_tickets), pipelined per batch.
+    The checkpointed `next_offset` only moves past a batch once it and every earlier
+    batch are written, even when later batches finish first.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_WORKERS, writers=IMPORT_WRITERS,
+                 max_pending=None, status="open", checkpoint=None):
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.writers = max(1, writers)
+        self.max_pending = max_pending or (self.workers + self.writers)
+        self.status = status
+        self.checkpoint = checkpoint
+        self._write_slots = threading.Semaphore(self.writers)
+        self._lock = threading.Lock()
+        self._classify_pool = None
+
+    def _classify(self, texts):
+        if self._classify_pool is None:
+            return classify_many(texts, workers=1)
+        return self._classify_pool.submit(classify_many, texts, 1).result()
+
+    def _process(self, batch, source, report):
+        t0 = time.perf_counter()
+        rows = [(off, rec) for off, rec in batch if record_text(rec)]
+        analyses = self._classify([record_text(rec) for _, rec in rows])
+        now = time.time()
+        tickets = [build_ticket(rec, a, source, off, self.status, now) for (off, rec), a in zip(rows, analyses)]
+        t_built = time.perf_counter()
+        with self._write_slots:
+            t1 = time.perf_counter()
+            written = db.insert_tickets(tickets)
+            t2 = time.perf_counter()
+        with self._lock:
+            report["classify_s"] += t_built - t0
+            report["write_s"] += t2 - t1
+            report["imported"] += written
+            report["skipped"] += len(batch) - len(rows)
+            report["existing"] += len(tickets) - written
+
+    def _save_checkpoint(self, source, report):
+        if self.checkpoint:
+            atomic_write_json(self.checkpoint, {
+                "source": source, "offset": report["next_offset"],
+                "imported": report["imported"], "updated_at": time.time(),
+            })
+
+    def run(self, records, source="stream", start=0):
+        """
+        Imports `records` (an iterable of dicts, e.g. iter_records) starting at row `start`;
+        rows before it are skipped. Returns the throughput report; on failure it carries
+        "error" and `next_offset` is where to resume.
+        """
+        report = {"source": source, "start": start, "rows": 0, "imported": 0, "existing": 0, "skipped": 0,
+                  "batches": 0, "next_offset": start, "read_s": 0.0, "classify_s": 0.0, "write_s": 0.0}
+        t_start = last_progress = time.perf_counter()
+        pending = deque()  # (end_offset, future) in input order
+        if self.workers > 1:
+            # started (forked) here, before any import thread exists
+            self._classify_pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._classify_pool.submit(classify_many, [], 1).result()
+        threads = ThreadPoolExecutor(max_workers=self.max_pending, thread_name_prefix="import")
+
+        def settle(block):
+            # advance the committed offset over the finished prefix of the pipeline
+            while pending and (block or pending[0][1].done()):
+                end, fut = pending.popleft()
+                block = False
+                fut.result()
+                report["next_offset"] = end
+                report["batches"] += 1
+                self._save_checkpoint(source, report)
+
+        try:
+            rows = itertools.islice(enumerate(records), start, None)
+            while True:
+                t0 = time.perf_counter()
+                batch = list(itertools.islice(rows, self.batch_size))
+                report["read_s"] += time.perf_counter() - t0
+                if not batch:
+                    break
+                report["rows"] += len(batch)
+                pending.append((batch[-1][0] + 1, threads.submit(self._process, batch, source, report)))
+                settle(block=len(pending) >= self.max_pending)  # backpressure
+                if time.perf_counter() - last_progress >= PROGRESS_EVERY_S:
+                    last_progress = time.perf_counter()
+                    rate = report["rows"] / (last_progress - t_start)
+                    print(f"[INFO] Import {source}: {report['rows']} rows read, {report['imported']} imported ({rate:.0f} rows/s)")
+            while pending:
+                settle(block=True)
+        except Exception as e:
+            for _, fut in pending:
+                fut.cancel()
+            report["error"] = str(e)
+            print(f"[ERROR] Import {source} stopped at row {report['next_offset']}: {e}")
+        finally:
+            threads.shutdown(wait=True)
+            if self._classify_pool is not None:
+                self._classify_pool.shutdown()
+                self._classify_pool = None
+
+        report["elapsed_s"] = time.perf_counter() - t_start
+        report["rows_per_s"] = report["rows"] / report["elapsed_s"] if report["elapsed_s"] else 0.0
+        return report
+
+
+def load_checkpoint(path, source):
+    """Row offset to resume from, or 0 if there is no checkpoint for this source."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            cp = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return 0
+    return int(cp.get("offset", 0)) if cp.get("source") == source else 0
+
+def import_file(path, fmt=None, checkpoint=None, resume=True, **kwargs):
+    """Imports a CSV/TSV/JSONL file, resuming from `checkpoint` (default: <path>.import.json)."""
+    source = os.path.abspath(path)
+    checkpoint = checkpoint or path + ".import.json"
+    start = load_checkpoint(checkpoint, source) if resume else 0
+    if start:
+        print(f"[INFO] Resuming import of {path} at row {start}")
+    with open(path, newline="", encoding="utf-8") as f:
+        records = iter_records(f, fmt or _detect_format(path))
+        return BulkImporter(checkpoint=checkpoint, **kwargs).run(records, source=source, start=start)
+
+def import_upload(fileobj, filename, fmt=None, start=0, **kwargs):
+    """Imports an uploaded binary stream (e.g. UploadFile.file) without reading it into memory."""
+    # decoded line by line: TextIOWrapper over a SpooledTemporaryFile needs Python 3.11
+    lines = codecs.iterdecode(fileobj, "utf-8")
+    return BulkImporter(**kwargs).run(iter_records(lines, fmt or _detect_format(filename)), source=filename, start=start)
+
+
+def print_report(report):
+    print(f"\nImported {report['imported']} tickets from {report['rows']} rows "
+          f"({report['existing']} already present, {report['skipped']} without text) "
+          f"in {report['elapsed_s']:.2f}s: {report['rows_per_s']:.0f} rows/s")
+    print(f"  read {report['read_s']:.2f}s  classify {report['classify_s']:.2f}s  write {report['write_s']:.2f}s "
+          f"(summed over batches)  next offset {report['next_offset']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk ticket import (CSV/TSV/JSONL)")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    parser.add_argument("--writers", type=int, default=IMPORT_WRITERS)
+    parser.add_argument("--status", default="open", help="status for rows without one")
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from row 0")
+    args = parser.parse_args()
+
+    report = import_file(args.path, fmt=args.format, checkpoint=args.checkpoint, resume=not args.restart,
+                         batch_size=args.batch_size, workers=args.workers, writers=args.writers, status=args.status)
+    print_report(report)
+    if report.get("error"):
+        raise SystemExit(1)
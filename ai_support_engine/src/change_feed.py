@@ -0,0 +1,135 @@
+# src/change_feed.py
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+
+
+class ChangeFeed:
+    """
+    In-process pub/sub for ticket changes.
+    db.py publishes from worker threads; the SSE endpoint consumes on the event loop.
+    Each subscriber gets a bounded queue: a slow client that falls behind receives a
+    single {"type": "resync"} event and should fall back to GET /tickets?since=<cursor>.
+    """
+
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subs = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict):
+        with self._lock:
+            subs = list(self._subs)
+        for sub in subs:
+            loop, q = sub
+            try:
+                loop.call_soon_threadsafe(self._offer, q, event)
+            except RuntimeError:
+                # loop already closed; drop the subscriber
+                with self._lock:
+                    self._subs.discard(sub)
+
+    @staticmethod
+    def _offer(q, event):
+        if q.full():
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait({"type": "resync"})
+            return
+        q.put_nowait(event)
+
+    @contextmanager
+    def subscription(self):
+        """
+        Registers an asyncio.Queue on the running loop for the lifetime of the block:
+            with feed.subscription() as q:
+                event = await q.get()
+        """
+        sub = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_queue))
+        with self._lock:
+            self._subs.add(sub)
+        try:
+            yield sub[1]
+        finally:
+            with self._lock:
+                self._subs.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subs)
+
+
+feed = ChangeFeed()
+
+
+class FeedIndex:
+    """
+    Base for in-process indexes over tickets that stay current by following the change
+    feed (db.get_changes): a full load on first use, then on each read only the tickets
+    changed since the last cursor, whichever process wrote them. Writes made by this
+    process mark the index dirty (register on_ticket_event with db.add_listener); otherwise
+    the feed is polled at most every `sync_interval` seconds.
+
+    Subclasses set FIELDS (the projection loaded) and implement _reset(), _apply(ticket)
+    and _drop(ticket_id), which are called with the index lock held. _apply sees tickets
+    oldest first, on the initial load as well as from the feed.
+    """
+    FIELDS = ["id", "status", "created_at", "updated_at"]
+    LOAD_STATUS = None   # e.g. "open": the initial load only needs those tickets
+    LOAD_LIMIT = None    # newest N tickets on the initial load
+    CLOCK_SKEW_S = 5.0   # the initial cursor starts this far back to cover writes in flight
+
+    def __init__(self, sync_interval=1.0):
+        self.sync_interval = sync_interval
+        self._cursor = None
+        self._last_sync = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "syncs": 0, "applied": 0}
+
+    def on_ticket_event(self, kind, ticket_id, msg=None):
+        self._dirty = True
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _apply(self, ticket):
+        raise NotImplementedError
+
+    def _drop(self, ticket_id):
+        raise NotImplementedError
+
+    def _load(self):
+        import db
+        self._reset()
+        cursor = db.encode_change_cursor(time.time() - self.CLOCK_SKEW_S)
+        # get_tickets is newest first; apply oldest first like the feed does, so
+        # insertion-ordered subclasses evict the oldest tickets, not the newest
+        tickets = db.get_tickets(status=self.LOAD_STATUS, limit=self.LOAD_LIMIT, fields=self.FIELDS)
+        for t in reversed(tickets):
+            self._apply(t)
+        self._cursor = cursor
+        self.stats["loads"] += 1
+
+    def sync(self, force=False):
+        """Applies changes since the last sync (a full load the first time)."""
+        import db
+        with self._lock:
+            now = time.monotonic()
+            if self._cursor is None:
+                self._load()
+            elif force or self._dirty or now - self._last_sync >= self.sync_interval:
+                self._dirty = False
+                changes = db.get_changes(self._cursor, fields=self.FIELDS)
+                if changes.get("reset"):
+                    # the cursor outlived the tombstone retention: rebuild from the full listing
+                    self._reset()
+                for t in changes["tickets"]:
+                    self._apply(t)
+                for ticket_id in changes["deleted"]:
+                    self._drop(ticket_id)
+                self._cursor = changes["cursor"]
+                self.stats["syncs"] += 1
+                self.stats["applied"] += len(changes["tickets"]) + len(changes["deleted"])
+            self._last_sync = now
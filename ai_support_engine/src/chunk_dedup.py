@@ -0,0 +1,180 @@
+# src/chunk_dedup.py
+"""
+Near-duplicate chunk detection with 64-bit SimHash over word 3-grams.
+
+Ingestion (/upload, chunker.build_chunks) drops chunks that are near-identical to one
+already in the index or earlier in the same batch: repeated headers, footers and
+legal text, or the unchanged parts of a re-uploaded revision. With DEDUP_MODE=merge
+(default) the kept chunk records the other articles it also appears in.
+Retrieval uses the same fingerprints to keep near-duplicate hits out of the top-k.
+
+    python chunk_dedup.py      # report for the current index
+"""
+import os
+import re
+import hashlib
+from functools import lru_cache
+from collections import defaultdict
+
+import numpy as np
+
+DEDUP_MODE = os.getenv("DEDUP_MODE", "merge")           # merge | skip | off
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))  # Hamming distance (of 64 bits)
+
+_TOKEN_RE = re.compile(r"\w+")
+BLOCKS = 4  # 16-bit blocks: two hashes within 3 bits share at least one block exactly
+
+stats = {"chunks_in": 0, "duplicates": 0, "embeddings_saved": 0, "index_bytes_saved": 0}
+
+
+@lru_cache(maxsize=65536)
+def simhash(text):
+    """64-bit SimHash of the text's word 3-grams (case and punctuation insensitive)."""
+    words = _TOKEN_RE.findall((text or "").lower())
+    if not words:
+        return 0
+    grams = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    digests = b"".join(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest() for g in grams)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(grams)
+    return int(np.packbits(votes > 0, bitorder="little").view("<u8")[0])
+
+def chunk_simhash(meta):
+    """The fingerprint stored on the chunk, or computed from its text for older indexes."""
+    stored = meta.get("simhash")
+    return int(stored, 16) if stored else simhash(meta.get("chunk_text", ""))
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class SimHashIndex:
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        if max_distance >= BLOCKS:
+            raise ValueError(f"max_distance must be below {BLOCKS} for exact block lookup")
+        self.max_distance = max_distance
+        self._blocks = defaultdict(list)  # (block, 16-bit value) -> [(hash, item)]
+
+    @staticmethod
+    def _keys(h):
+        return [(b, (h >> (16 * b)) & 0xFFFF) for b in range(BLOCKS)]
+
+    def add(self, h, item):
+        for key in self._keys(h):
+            self._blocks[key].append((h, item))
+
+    def find(self, h):
+        """An item within max_distance of h, or None."""
+        for key in self._keys(h):
+            for other, item in self._blocks.get(key, ()):
+                if hamming(h, other) <= self.max_distance:
+                    return item
+        return None
+
+
+def dedupe_chunks(new_chunks, existing=(), mode=DEDUP_MODE, bytes_per_chunk=0, record=True):
+    """
+    Splits `new_chunks` (chunk meta dicts) into (kept, duplicates). Each kept chunk gets
+    a "simhash"; each duplicate gets "duplicate_of" (the chunk_id it matched, in
+    `existing` or earlier in `new_chunks`). In merge mode a match within `new_chunks`
+    lists the duplicate's article_id in its "also_in"; use apply_merges() for matches
+    in `existing`. bytes_per_chunk (one embedding row) feeds the index-size counters.
+    """
+    for c in new_chunks:
+        c["simhash"] = format(simhash(c.get("chunk_text", "")), "016x")
+    if mode == "off":
+        return list(new_chunks), []
+
+    index = SimHashIndex()
+    for m in existing:
+        index.add(chunk_simhash(m), m)
+    kept, dups, batch = [], [], set()
+    for c in new_chunks:
+        h = int(c["simhash"], 16)
+        match = index.find(h) if h else None
+        if match is None:
+            index.add(h, c)
+            kept.append(c)
+            batch.add(id(c))
+            continue
+        c["duplicate_of"] = match.get("chunk_id")
+        dups.append(c)
+        if mode == "merge" and id(match) in batch:
+            _merge(match, c)
+
+    if record:
+        record_dedup(len(new_chunks), len(dups), bytes_per_chunk)
+    return kept, dups
+
+def record_dedup(chunks_in, duplicates, bytes_per_chunk=0):
+    """Adds one ingestion's outcome to the counters (for callers that dedupe with record=False)."""
+    stats["chunks_in"] += chunks_in
+    stats["duplicates"] += duplicates
+    stats["embeddings_saved"] += duplicates
+    stats["index_bytes_saved"] += duplicates * bytes_per_chunk
+
+def _merge(target, dup):
+    aid = dup.get("article_id")
+    if aid and aid != target.get("article_id") and aid not in target.get("also_in", []):
+        target.setdefault("also_in", []).append(aid)
+        return True
+    return False
+
+def apply_merges(meta, dups):
+    """Records each duplicate's article on the chunk it matched in `meta`; returns how many changed."""
+    by_id = {m.get("chunk_id"): m for m in meta}
+    return sum(_merge(by_id[d["duplicate_of"]], d) for d in dups if d.get("duplicate_of") in by_id)
+
+def diversify(hits, max_distance=DEDUP_MAX_DISTANCE):
+    """Drops hits (best first) whose chunk is a near-duplicate of a higher-ranked hit."""
+    out, index = [], SimHashIndex(max_distance)
+    for h in hits:
+        fp = chunk_simhash(h["meta"])
+        if fp and index.find(fp) is not None:
+            continue
+        index.add(fp, h)
+        out.append(h)
+    return out
+
+def dedup_stats():
+    return dict(stats)
+
+
+def index_report(meta, bytes_per_chunk=0):
+    """How many chunks of an existing index are near-duplicates of an earlier one."""
+    kept, dups = dedupe_chunks([dict(m) for m in meta], mode="skip", bytes_per_chunk=bytes_per_chunk, record=False)
+    return {
+        "chunks": len(meta),
+        "unique": len(kept),
+        "duplicates": len(dups),
+        "index_bytes_saved": len(dups) * bytes_per_chunk,
+        "examples": [(d["chunk_id"], d["duplicate_of"]) for d in dups[:5]],
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import time
+    from vector_store import EMB_PATH as emb_path, META_PATH as meta_path
+
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    row_bytes = 0
+    if os.path.exists(emb_path):
+        emb = np.load(emb_path, mmap_mode="r")
+        row_bytes = emb.shape[1] * emb.dtype.itemsize
+    print(index_report(meta, row_bytes))
+
+    # synthetic: boilerplate on every page plus a re-uploaded revision
+    footer = "This document is confidential. All rights reserved. Contact support@example.com for help."
+    pages = [f"Section {i}: how to handle case {i} when the customer reports problem number {i} in detail." for i in range(500)]
+    doc_a = [{"chunk_id": f"a_{i}", "article_id": "a", "chunk_text": t} for i, t in enumerate(pages + [footer] * 50)]
+    revised = [t.replace("in detail", "in full detail") if i % 10 == 0 else t for i, t in enumerate(pages)]
+    doc_b = [{"chunk_id": f"b_{i}", "article_id": "b", "chunk_text": t} for i, t in enumerate(revised + [footer] * 50)]
+    t0 = time.perf_counter()
+    kept_a, dups_a = dedupe_chunks(doc_a, mode="merge", bytes_per_chunk=row_bytes or 6144)
+    kept_b, dups_b = dedupe_chunks(doc_b, existing=kept_a, mode="merge", bytes_per_chunk=row_bytes or 6144)
+    dt = time.perf_counter() - t0
+    print(f"doc a: {len(kept_a)} kept, {len(dups_a)} duplicates; revision b: {len(kept_b)} kept, {len(dups_b)} duplicates "
+          f"({dt * 1000:.1f} ms for {len(doc_a) + len(doc_b)} chunks)")
+    print(dedup_stats())
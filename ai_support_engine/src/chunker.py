@@ -1,6 +1,7 @@
 import re
 import csv
 import os
+from chunk_dedup import dedupe_chunks
 
 def split_into_sentences(text):
     text = text.strip()
@@ -61,10 +62,16 @@ def build_chunks(articles_csv=ARTICLES_PATH, out_csv=CHUNKS_PATH, max_chars=400)
                     "chunk_text": chunk_text
                 })
 
+    # boilerplate repeated across articles is indexed once
+    total = len(chunks)
+    chunks, duplicates = dedupe_chunks(chunks)
+    if duplicates:
+        print(f"Skipped {len(duplicates)} near-duplicate chunks of {total}")
+
     os.makedirs(os.path.dirname(out_csv), exist_ok=True)
     with open(out_csv, 'w', newline='', encoding='utf-8') as f:
         fieldnames = ["chunk_id", "article_id", "title", "chunk_text"]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
         writer.writeheader()
         for c in chunks:
             writer.writerow(c)
@@ -1,39 +1,126 @@
 # src/classifier.py
-from typing import List, Tuple
+import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Set
+
+# 1. Tagging lexicon
+TAG_KEYWORDS = {
+    "billing": ["bill", "invoice", "charge", "payment", "cost", "price", "subscription", "refund"],
+    "technical": ["error", "bug", "fail", "crash", "login", "password", "access", "connect", "broken"],
+    "account": ["account", "profile", "email", "username", "settings", "reset"],
+    "feature_request": ["feature", "request", "add", "improve", "suggestion", "idea"],
+    "urgent": ["urgent", "asap", "immediately", "critical", "emergency"]
+}
+
+# 2. Sentiment lexicon (Simple Keyword-based)
+# In a real app, use NLTK or a Transformer model
+POSITIVE_WORDS = ["great", "awesome", "thanks", "thank", "good", "love", "helpful", "best"]
+NEGATIVE_WORDS = ["bad", "terrible", "worst", "hate", "angry", "upset", "fail", "broken", "slow", "useless", "waiting"]
+
+# Inflections accepted after a keyword, so "fail" still matches "failed"/"failure"
+# but "add" no longer fires inside "address".
+SUFFIXES = ["s", "es", "d", "ed", "ing", "er", "ers", "ion", "ions", "ure", "ures", "ment", "ments", "ly"]
+_VOWELS = set("aeiou")
+
+
+def _inflections(word):
+    """
+    Surface forms of a keyword: the word, word + suffix, and the English spelling
+    changes before a vowel suffix: final-e drop ("charge" -> "charging") and a doubled
+    final consonant after a short vowel ("reset" -> "resetting").
+    """
+    forms = [word] + [word + suf for suf in SUFFIXES]
+    vowel_sufs = [suf for suf in SUFFIXES if suf[0] in _VOWELS]
+    if len(word) > 2 and word.endswith("e") and word[-2] not in _VOWELS:
+        forms += [word[:-1] + suf for suf in vowel_sufs]
+    if (len(word) > 2 and word[-1] not in _VOWELS and word[-1] not in "wxy"
+            and word[-2] in _VOWELS and word[-3] not in _VOWELS):
+        forms += [word + word[-1] + suf for suf in vowel_sufs]
+    return forms
+
+
+def _build_lexicon():
+    """
+    Expands every keyword with its accepted inflections into one lookup table:
+    surface form -> list of (category, label, keyword).
+    """
+    entries = defaultdict(list)
+    for tag, words in TAG_KEYWORDS.items():
+        for w in words:
+            entries[w].append(("tag", tag))
+    for w in POSITIVE_WORDS:
+        entries[w].append(("sentiment", "positive"))
+    for w in NEGATIVE_WORDS:
+        entries[w].append(("sentiment", "negative"))
+
+    lexicon = defaultdict(list)
+    for word, targets in entries.items():
+        for form in _inflections(word):
+            for category, label in targets:
+                hit = (category, label, word)
+                if hit not in lexicon[form]:
+                    lexicon[form].append(hit)
+    return dict(lexicon)
+
+_LEXICON = _build_lexicon()
+
+
+def _trie_pattern(words):
+    """
+    Regex alternation shaped as a prefix trie ("pa(?:ssword|yment)") so the engine
+    never re-tries shared prefixes; much cheaper than a flat "a|b|c" list.
+    """
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+# one combined word-boundary regex over every surface form of every lexicon
+_MATCHER = re.compile(r"\b(" + _trie_pattern(_LEXICON) + r")\b")
+
+
+def scan(text: str) -> Dict[str, Set[str]]:
+    """
+    Single regex pass over the text for every lexicon at once,
+    then one lookup per distinct matched word.
+    Returns {"tags": {tag, ...}, "positive": {word, ...}, "negative": {word, ...}}.
+    """
+    found = {"tags": set(), "positive": set(), "negative": set()}
+    for tok in set(_MATCHER.findall(text.lower())):
+        for category, label, word in _LEXICON.get(tok, ()):
+            if category == "tag":
+                found["tags"].add(label)
+            else:
+                found[label].add(word)
+    return found
+
 
 def classify_ticket(text: str) -> dict:
     """
     Analyzes ticket text to return tags, sentiment, and priority.
     """
-    text_lower = text.lower()
-    tags = []
-    
-    # 1. Tagging
-    keywords = {
-        "billing": ["bill", "invoice", "charge", "payment", "cost", "price", "subscription", "refund"],
-        "technical": ["error", "bug", "fail", "crash", "login", "password", "access", "connect", "broken"],
-        "account": ["account", "profile", "email", "username", "settings", "reset"],
-        "feature_request": ["feature", "request", "add", "improve", "suggestion", "idea"],
-        "urgent": ["urgent", "asap", "immediately", "critical", "emergency"]
-    }
-
-    for tag, words in keywords.items():
-        if any(w in text_lower for w in words):
-            tags.append(tag)
+    found = scan(text)
 
+    tags = list(found["tags"])
     if not tags:
         tags.append("general")
-    
-    tags = list(set(tags))
-
-    # 2. Sentiment Analysis (Simple Keyword-based)
-    # In a real app, use NLTK or a Transformer model
-    positive_words = ["great", "awesome", "thanks", "thank", "good", "love", "helpful", "best"]
-    negative_words = ["bad", "terrible", "worst", "hate", "angry", "upset", "fail", "broken", "slow", "useless", "waiting"]
-    
-    pos_count = sum(1 for w in positive_words if w in text_lower)
-    neg_count = sum(1 for w in negative_words if w in text_lower)
-    
+
+    # distinct lexicon words, as before
+    pos_count = len(found["positive"])
+    neg_count = len(found["negative"])
+
     sentiment = "neutral"
     if neg_count > pos_count:
         sentiment = "negative"
@@ -52,3 +139,83 @@ def classify_ticket(text: str) -> dict:
         "sentiment": sentiment,
         "priority": priority
     }
+
+
+def classify_many(texts: List[str], workers: int = None, chunksize: int = 2000, min_parallel: int = 20000) -> List[dict]:
+    """
+    Classifies a batch of texts (e.g. backlog imports), preserving order.
+    Small batches run in-process; larger ones fan out across a process pool.
+    workers=1 forces in-process execution.
+    """
+    if workers == 1 or len(texts) < min_parallel:
+        return [classify_ticket(t) for t in texts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(classify_ticket, texts, chunksize=chunksize))
+
+
+if __name__ == "__main__":
+    import time
+
+    # the previous implementation: one substring check per keyword, per pass
+    def classify_ticket_substring(text):
+        text_lower = text.lower()
+        tags = [tag for tag, words in TAG_KEYWORDS.items() if any(w in text_lower for w in words)] or ["general"]
+        pos_count = sum(1 for w in POSITIVE_WORDS if w in text_lower)
+        neg_count = sum(1 for w in NEGATIVE_WORDS if w in text_lower)
+        return tags, pos_count, neg_count
+
+    samples = [
+        "My payment failed but I was charged twice.",
+        "I can't login to my account, forgot password.",
+        "Please update my billing address, thanks!",
+        "Order not delivered, tracking not updating. This is urgent!!",
+        "Great app, would love a dark mode feature idea.",
+    ]
+    for s in samples:
+        print(s, "->", classify_ticket(s))
+
+    # equivalence check against the substring classifier on the sample corpus. Expected
+    # differences: keywords inside unrelated words ("add" in "address"), which only the
+    # substring classifier matches, and e-drop forms ("loving"), which only the matcher
+    # matches. Anything else is a word form the matcher is missing.
+    import os
+    import csv
+    data = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+    corpus = list(samples) + [
+        "I keep resetting my password", "The charger is charging slowly", "I hate the app",
+        "Loving the new update", "This is urgently needed, we were charged again", "Pricing is unclear",
+    ]
+    with open(os.path.join(data, "tickets.csv"), newline="", encoding="utf-8") as f:
+        corpus += [r["text"] for r in csv.DictReader(f, delimiter="\t")]
+    with open(os.path.join(data, "chunks.csv"), newline="", encoding="utf-8") as f:
+        corpus += [r["chunk_text"] for r in csv.DictReader(f)]
+    mismatches = 0
+    for text in corpus:
+        old_tags, old_pos, old_neg = classify_ticket_substring(text)
+        new = classify_ticket(text)
+        found = scan(text)
+        if sorted(old_tags) != sorted(new["tags"]) or (old_pos, old_neg) != (len(found["positive"]), len(found["negative"])):
+            mismatches += 1
+            print(f"[WARN] mismatch: {text[:60]!r} substring={sorted(old_tags)} +{old_pos}/-{old_neg} "
+                  f"matcher={sorted(new['tags'])} +{len(found['positive'])}/-{len(found['negative'])}")
+    print(f"{len(corpus)} texts, {mismatches} differ from the substring classifier")
+
+    texts = samples * 20000
+    t0 = time.perf_counter()
+    for t in texts:
+        classify_ticket_substring(t)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    classify_many(texts, workers=1)
+    t_new = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    classify_many(texts)
+    t_pool = time.perf_counter() - t0
+
+    n = len(texts)
+    print(f"\n{n} texts")
+    print(f"substring checks : {n / t_old:10.0f} texts/s")
+    print(f"compiled matcher : {n / t_new:10.0f} texts/s")
+    print(f"classify_many    : {n / t_pool:10.0f} texts/s (process pool)")
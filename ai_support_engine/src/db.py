@@ -1,32 +1,155 @@
 import os
 import time
 import uuid
-from typing import List, Optional, Dict, Any
-from google.cloud import firestore
-from google.oauth2 import service_account
+import json
+import base64
+import threading
+from typing import List, Optional, Dict, Any, Callable
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from ticket_store import SqliteTicketStore, DB_PATH
+from change_feed import feed
+from ticket_cache import TicketCache
 
 load_dotenv()
 
 # Configuration
 FIREBASE_KEY_PATH = os.getenv("FIREBASE_KEY_PATH")
+FIRESTORE_EMULATOR_HOST = os.getenv("FIRESTORE_EMULATOR_HOST")
+TICKETS_DB_PATH = os.getenv("TICKETS_DB_PATH", DB_PATH)
+TICKET_CACHE_SIZE = int(os.getenv("TICKET_CACHE_SIZE", "1024"))
+# Without the listener, another worker's write can be served this late from the cache
+TICKET_CACHE_TTL = float(os.getenv("TICKET_CACHE_TTL", "5"))
+# Cross-process invalidation through a Firestore snapshot listener (one watch stream per process)
+TICKET_CACHE_LISTEN = os.getenv("TICKET_CACHE_LISTEN", "0") == "1"
+# The listener re-subscribes this often so its result set only spans recent writes
+TICKET_CACHE_LISTEN_WINDOW_S = float(os.getenv("TICKET_CACHE_LISTEN_WINDOW_S", "600"))
+# The change feed re-reads this far behind the newest change a cursor has seen, so writes whose
+# timestamp is older than one already served (slow commit, another worker, clock skew) still arrive
+CHANGE_OVERLAP_S = float(os.getenv("CHANGE_OVERLAP_S", "10"))
+# Deletion tombstones are kept this long; a cursor older than that gets a full resync
+TOMBSTONE_RETENTION_S = float(os.getenv("TOMBSTONE_RETENTION_S", str(7 * 86400)))
+TOMBSTONE_PRUNE_EVERY_S = 3600.0
 USE_FIRESTORE = False
 db = None
+# google-cloud-firestore takes ~0.4 s to import; it is only loaded when a Firestore backend is used
+firestore = None
+NotFound = None
+AlreadyExists = None
+FailedPrecondition = None
+
+def _load_firestore():
+    global firestore, NotFound, AlreadyExists, FailedPrecondition
+    if firestore is None:
+        from google.cloud import firestore as firestore_module
+        from google.api_core import exceptions
+        firestore = firestore_module
+        NotFound, AlreadyExists, FailedPrecondition = exceptions.NotFound, exceptions.AlreadyExists, exceptions.FailedPrecondition
+    return firestore
+
+# Read-through cache for Firestore ticket documents (not used for the local store)
+_cache = TicketCache(TICKET_CACHE_SIZE, TICKET_CACHE_TTL)
+_watch = None
+_watch_client = None
+_watch_lock = threading.Lock()
+
+def _on_ticket_snapshot(docs, changes, read_time):
+    for change in changes:
+        _cache.invalidate(change.document.id)
+
+def _subscribe(client):
+    """
+    (Re)starts the ticket listener. The watch holds every document matching the query, so it
+    starts a minute back instead of at startup; the old watch is closed once the new one exists,
+    and the new one's initial snapshot evicts anything written in between.
+    """
+    global _watch
+    query = client.collection("tickets").where("updated_at", ">", time.time() - 60)
+    old, _watch = _watch, query.on_snapshot(_on_ticket_snapshot)
+    if old is not None:
+        old.unsubscribe()
+
+def _rotate_watch(client):
+    while True:
+        time.sleep(TICKET_CACHE_LISTEN_WINDOW_S)
+        with _watch_lock:
+            if _watch_client is not client:
+                return
+            try:
+                _subscribe(client)
+            except Exception as e:
+                print(f"[WARN] Ticket listener re-subscribe failed: {e}")
+
+def use_firestore_client(client, listen: bool = TICKET_CACHE_LISTEN):
+    """
+    Switches ticket storage to the given Firestore client (real, emulator or an
+    in-process fake exposing the same collection/document API).
+    """
+    global db, USE_FIRESTORE, _watch, _watch_client
+    _load_firestore()
+    db = client
+    USE_FIRESTORE = True
+    _cache.clear()
+    with _watch_lock:
+        _watch_client = None
+        if _watch is not None:
+            _watch.unsubscribe()
+            _watch = None
+        if listen:
+            # each change made by any process evicts the cached copy
+            _watch_client = client
+            _subscribe(client)
+    if listen:
+        threading.Thread(target=_rotate_watch, args=(client,), name="ticket-watch", daemon=True).start()
 
 # Initialize Firestore
-if FIREBASE_KEY_PATH and os.path.exists(FIREBASE_KEY_PATH):
+if FIRESTORE_EMULATOR_HOST:
+    # the client picks up FIRESTORE_EMULATOR_HOST itself and needs no credentials
+    use_firestore_client(_load_firestore().Client(project=os.getenv("FIRESTORE_PROJECT", "demo-owntrail")))
+    print(f"[OK] Firestore emulator at {FIRESTORE_EMULATOR_HOST}")
+elif FIREBASE_KEY_PATH and os.path.exists(FIREBASE_KEY_PATH):
     try:
+        from google.oauth2 import service_account
         cred = service_account.Credentials.from_service_account_file(FIREBASE_KEY_PATH)
-        db = firestore.Client(credentials=cred)
-        USE_FIRESTORE = True
+        use_firestore_client(_load_firestore().Client(credentials=cred))
         print(f"[OK] Firestore initialized using {FIREBASE_KEY_PATH}")
     except Exception as e:
         print(f"[WARN] Failed to initialize Firestore: {e}")
 else:
-    print("[WARN] FIREBASE_KEY_PATH not found or invalid. Using in-memory storage (data will be lost on restart).")
+    print(f"[WARN] FIREBASE_KEY_PATH not found or invalid. Using local ticket store at {TICKETS_DB_PATH}.")
+
+# Local fallback (sqlite, persistent across restarts)
+_local = None if USE_FIRESTORE else SqliteTicketStore(TICKETS_DB_PATH)
+
+def write_batch():
+    """
+    Context manager grouping several writes into one local transaction.
+    Firestore writes are not affected.
+    """
+    if USE_FIRESTORE:
+        return nullcontext()
+    return _local.batch()
+
+def cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
+
+_listeners = []
+
+def add_listener(fn):
+    """
+    Registers fn(kind, ticket_id, msg) to run in-process after each write
+    (msg is the appended message for kind == "message", else None).
+    """
+    _listeners.append(fn)
 
-# In-memory fallback
-_tickets_memory = {}
+def _publish(kind: str, ticket_id: str, ts: float, msg: Optional[Dict[str, Any]] = None):
+    # push channel for /tickets/events; clients follow up with get_changes()
+    feed.publish({"type": kind, "ticket_id": ticket_id, "updated_at": ts})
+    for fn in _listeners:
+        try:
+            fn(kind, ticket_id, msg)
+        except Exception as e:
+            print(f"[WARN] Ticket listener failed: {e}")
 
 # --- DB Operations ---
 
@@ -54,75 +177,370 @@ def create_ticket(customer_id: str, text: str, tags: List[str] = [], sentiment:
 
     if USE_FIRESTORE:
         db.collection("tickets").document(ticket_id).set(ticket_data)
+        _cache.put(ticket_id, ticket_data)
     else:
-        _tickets_memory[ticket_id] = ticket_data
-    
+        _local.insert_ticket(ticket_data)
+
+    _publish("created", ticket_id, now)
     return ticket_id
 
-def get_ticket(ticket_id: str) -> Optional[Dict[str, Any]]:
+FIRESTORE_BATCH_LIMIT = 500  # writes per batched commit
+
+def insert_tickets(tickets: List[Dict[str, Any]]) -> int:
+    """
+    Bulk write of fully-built ticket documents (see bulk_import.py): Firestore batched
+    commits of up to 500 documents, or one local transaction. Ids that already exist are
+    left untouched on both backends, so replaying a batch is a no-op. Publishes a single
+    "imported" event (ticket_id None) instead of one per ticket. Returns the number of
+    new tickets.
+    """
+    if not tickets:
+        return 0
+    if USE_FIRESTORE:
+        col = db.collection("tickets")
+        written = 0
+        for i in range(0, len(tickets), FIRESTORE_BATCH_LIMIT):
+            chunk = tickets[i:i + FIRESTORE_BATCH_LIMIT]
+            batch = db.batch()
+            for t in chunk:
+                batch.create(col.document(t["id"]), t)
+            try:
+                batch.commit()
+                written += len(chunk)
+            except AlreadyExists:
+                # the batch is all-or-nothing: create one by one and skip the existing ids
+                for t in chunk:
+                    try:
+                        col.document(t["id"]).create(t)
+                        written += 1
+                    except AlreadyExists:
+                        pass
+        # not cached: a backfill would only evict the tickets agents are working on
+        for t in tickets:
+            _cache.invalidate(t["id"])
+    else:
+        written = _local.insert_tickets(tickets)
+    _publish("imported", None, time.time())
+    return written
+
+def get_ticket(ticket_id: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    fresh=True skips the cached copy unless the cross-process listener keeps it current:
+    for reads that must see every message (suggestions), not just this worker's writes.
+    """
     if USE_FIRESTORE:
+        cached = _cache.get(ticket_id) if not fresh or _watch is not None else None
+        if cached is not None:
+            return cached
         doc = db.collection("tickets").document(ticket_id).get()
         if doc.exists:
-            return doc.to_dict()
+            data = doc.to_dict()
+            _cache.put(ticket_id, data)
+            return data
         return None
     else:
-        return _tickets_memory.get(ticket_id)
+        return _local.get_ticket(ticket_id)
+
+# --- Pagination helpers ---
+
+def encode_cursor(ts: float, ticket_id: str) -> str:
+    """Opaque keyset cursor for a (timestamp, id) position: created_at for pages, updated_at for changes."""
+    raw = json.dumps([ts or 0, ticket_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, ticket_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(created_at), str(ticket_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _project(ticket: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return ticket
+    # id and created_at are always kept so the caller can build the next cursor
+    keep = set(fields) | {"id", "created_at"}
+    return {k: v for k, v in ticket.items() if k in keep}
+
+def get_tickets(status: Optional[str] = None, customer_id: Optional[str] = None,
+                limit: Optional[int] = None, cursor: Optional[str] = None,
+                fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Tickets newest first.
+    limit/cursor: keyset pagination on (created_at, id); pass encode_cursor(last["created_at"], last["id"]) for the next page.
+    fields: optional projection, e.g. ["text", "status", "priority"]. Messages are only loaded if listed.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    with_messages = fields is None or "messages" in fields
 
-def get_tickets(status: Optional[str] = None, customer_id: Optional[str] = None) -> List[Dict[str, Any]]:
     if USE_FIRESTORE:
         ref = db.collection("tickets")
         if status:
             ref = ref.where("status", "==", status)
         if customer_id:
             ref = ref.where("customer_id", "==", customer_id)
-        
-        # Order by created_at desc (requires index in Firestore, usually)
-        # For now, we'll sort in python to avoid index creation errors during dev
-        docs = ref.stream()
-        tickets = [d.to_dict() for d in docs]
-        tickets.sort(key=lambda x: x.get("created_at", 0), reverse=True)
-        return tickets
+
+        # Ordering and limit run server-side. Filtering on status/customer_id needs the
+        # composite indexes (status, created_at desc, __name__ desc) and
+        # (customer_id, created_at desc, __name__ desc) in Firestore.
+        ref = ref.order_by("created_at", direction=firestore.Query.DESCENDING)
+        ref = ref.order_by("__name__", direction=firestore.Query.DESCENDING)
+        if after is not None:
+            ref = ref.start_after([after[0], after[1]])
+        if limit is not None:
+            ref = ref.limit(limit)
+        if fields is not None:
+            ref = ref.select(sorted(set(fields) | {"id", "created_at"}))
+        return [d.to_dict() for d in ref.stream()]
     else:
-        tickets = list(_tickets_memory.values())
-        if status:
-            tickets = [t for t in tickets if t.get("status") == status]
-        if customer_id:
-            tickets = [t for t in tickets if t.get("customer_id") == customer_id]
-        tickets.sort(key=lambda x: x.get("created_at", 0), reverse=True)
-        return tickets
+        tickets = _local.list_tickets(status, customer_id, limit=limit, after=after, with_messages=with_messages)
+        return [_project(t, fields) for t in tickets]
 
-def add_message(ticket_id: str, role: str, content: str):
+def add_message(ticket_id: str, role: str, content: str, updates: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Appends a message and optionally applies metadata `updates` in the same write
+    (one Firestore round-trip / one local transaction).
+    Returns False if the ticket does not exist.
+    """
     now = time.time()
     msg = {"role": role, "content": content, "ts": now}
-    
+    fields = {**(updates or {}), "updated_at": now}
+
     if USE_FIRESTORE:
         ref = db.collection("tickets").document(ticket_id)
-        # Atomically update messages array and updated_at
-        ref.update({
-            "messages": firestore.ArrayUnion([msg]),
-            "updated_at": now
-        })
+        # Atomically update messages array, metadata and updated_at
+        try:
+            ref.update({"messages": firestore.ArrayUnion([msg]), **fields})
+        except NotFound:
+            _cache.invalidate(ticket_id)
+            return False
+
+        def apply(doc):
+            doc.setdefault("messages", []).append(msg)
+            doc.update(fields)
+        _cache.update(ticket_id, apply)
     else:
-        if ticket_id in _tickets_memory:
-            _tickets_memory[ticket_id]["messages"].append(msg)
-            _tickets_memory[ticket_id]["updated_at"] = now
+        with _local.batch():
+            if not _local.append_message(ticket_id, msg, now):
+                return False
+            if updates:
+                _local.update_fields(ticket_id, fields)
+    _publish("message", ticket_id, now, msg)
+    return True
 
-def update_ticket_status(ticket_id: str, status: str):
+def _update_fields(ticket_id: str, updates: Dict[str, Any]):
     if USE_FIRESTORE:
-        db.collection("tickets").document(ticket_id).update({"status": status})
+        db.collection("tickets").document(ticket_id).update(updates)
+        _cache.update(ticket_id, lambda doc: doc.update(updates))
     else:
-            _tickets_memory[ticket_id]["status"] = status
+        _local.update_fields(ticket_id, updates)
+
+def set_suggestion(ticket_id: str, suggestion: Dict[str, Any],
+                   if_current: Optional[Callable[[Dict[str, Any]], bool]] = None) -> bool:
+    """
+    Stores a precomputed reply suggestion on the ticket. Derived data: updated_at is
+    not bumped and no change event is published.
+    if_current(ticket) is checked against the stored ticket in the same transaction (local)
+    or under a last-update-time precondition (Firestore), so a slow job cannot overwrite a
+    suggestion for newer messages. Returns False if the ticket is gone or the check fails.
+    """
+    if USE_FIRESTORE:
+        ref = db.collection("tickets").document(ticket_id)
+        for _ in range(3):
+            option = None
+            if if_current is not None:
+                snap = ref.get()
+                if not snap.exists or not if_current(snap.to_dict()):
+                    _cache.invalidate(ticket_id)
+                    return False
+                option = db.write_option(last_update_time=snap.update_time)
+            try:
+                ref.update({"suggestion": suggestion}, option=option)
+            except NotFound:
+                _cache.invalidate(ticket_id)
+                return False
+            except FailedPrecondition:
+                continue  # written in between: check again
+            _cache.update(ticket_id, lambda doc: doc.update({"suggestion": suggestion}))
+            return True
+        return False
+    with _local.batch():
+        if if_current is not None:
+            current = _local.get_ticket(ticket_id)
+            if current is None or not if_current(current):
+                return False
+        return _local.update_fields(ticket_id, {"suggestion": suggestion})
+
+def update_ticket_status(ticket_id: str, status: str):
+    now = time.time()
+    _update_fields(ticket_id, {"status": status, "updated_at": now})
+    _publish("status", ticket_id, now)
 
 def update_ticket_metadata(ticket_id: str, updates: Dict[str, Any]):
+    now = time.time()
+    _update_fields(ticket_id, {**updates, "updated_at": now})
+    _publish("updated", ticket_id, now)
+
+def delete_ticket(ticket_id: str):
+    now = time.time()
     if USE_FIRESTORE:
-        db.collection("tickets").document(ticket_id).update(updates)
+        existing = get_ticket(ticket_id)
+        _cache.invalidate(ticket_id)
+        if existing is None:
+            return
+        # tombstone so get_changes() can report the deletion
+        batch = db.batch()
+        batch.delete(db.collection("tickets").document(ticket_id))
+        batch.set(db.collection("ticket_deletions").document(ticket_id), {
+            "ticket_id": ticket_id,
+            "customer_id": existing.get("customer_id"),
+            "deleted_at": now
+        })
+        batch.commit()
     else:
-        if ticket_id in _tickets_memory:
-            _tickets_memory[ticket_id].update(updates)
+        _local.delete_ticket(ticket_id, now)
+    _publish("deleted", ticket_id, now)
+    prune_tombstones(now)
 
-def delete_ticket(ticket_id: str):
+_last_prune = 0.0
+
+def prune_tombstones(now: Optional[float] = None) -> int:
+    """
+    Drops deletion tombstones older than TOMBSTONE_RETENTION_S. Runs at most once per
+    TOMBSTONE_PRUNE_EVERY_S in each process; returns the number removed.
+    """
+    global _last_prune
+    now = now or time.time()
+    if now - _last_prune < TOMBSTONE_PRUNE_EVERY_S:
+        return 0
+    _last_prune = now
+    before = now - TOMBSTONE_RETENTION_S
+    if not USE_FIRESTORE:
+        return _local.prune_deletions(before)
+    removed = 0
+    while True:
+        old = list(db.collection("ticket_deletions").where("deleted_at", "<", before)
+                   .limit(FIRESTORE_BATCH_LIMIT).select([]).stream())
+        if not old:
+            return removed
+        batch = db.batch()
+        for d in old:
+            batch.delete(db.collection("ticket_deletions").document(d.id))
+        batch.commit()
+        removed += len(old)
+
+# --- Change feed ---
+
+def encode_change_cursor(high: float, seen=(), seen_deleted=()) -> str:
+    """
+    Opaque change-feed cursor: the newest change time returned so far plus the (id, timestamp)
+    versions already returned within CHANGE_OVERLAP_S of it (tickets and tombstones).
+    """
+    raw = json.dumps([high, sorted(seen), sorted(seen_deleted)])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_change_cursor(cursor: str) -> tuple:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if len(raw) == 2:
+            # (updated_at, id) cursor from before the overlap window: re-read from its timestamp
+            return float(raw[0]), set(), set()
+        high, seen, seen_deleted = raw
+        return (float(high), {(str(i), float(ts)) for i, ts in seen},
+                {(str(i), float(ts)) for i, ts in seen_deleted})
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def get_changes(since: Optional[str] = None, customer_id: Optional[str] = None,
+                limit: Optional[int] = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Tickets modified after the `since` cursor (oldest change first) plus ids deleted since then.
+    An empty/None cursor returns everything. The returned "cursor" is passed back as `since`
+    on the next poll. status is deliberately not filtered here so clients see tickets leaving
+    their view (e.g. open -> resolved).
+
+    Timestamps are taken before a write commits and come from several workers, so each poll
+    re-reads from CHANGE_OVERLAP_S behind the cursor and skips the (id, updated_at) versions it
+    already returned. A cursor older than TOMBSTONE_RETENTION_S may have missed pruned
+    deletions: the response then carries "reset": true and lists every ticket, and the client
+    should replace its copy instead of merging.
+    """
+    now = time.time()
+    high, seen, seen_deleted = decode_change_cursor(since) if since else (None, set(), set())
+    reset = high is not None and high < now - TOMBSTONE_RETENTION_S
+    if reset:
+        high, seen, seen_deleted = None, set(), set()
+    lower = high - CHANGE_OVERLAP_S if high is not None else None
+    # rows already in `seen` are filtered out below, so fetch that many extra
+    fetch = limit + len(seen) if limit is not None else None
+    with_messages = fields is None or "messages" in fields
+
+    if USE_FIRESTORE:
+        ref = db.collection("tickets")
+        if customer_id:
+            ref = ref.where("customer_id", "==", customer_id)
+        if lower is not None:
+            ref = ref.where("updated_at", ">=", lower)
+        # needs composite index (customer_id, updated_at, __name__) when filtering by customer
+        ref = ref.order_by("updated_at").order_by("__name__")
+        if fetch is not None:
+            ref = ref.limit(fetch)
+        if fields is not None:
+            ref = ref.select(sorted(set(fields) | {"id", "created_at", "updated_at"}))
+        rows = [d.to_dict() for d in ref.stream()]
+
+        dref = db.collection("ticket_deletions").where("deleted_at", ">=", lower or 0.0)
+        if customer_id:
+            dref = dref.where("customer_id", "==", customer_id)
+        deleted_docs = [d.to_dict() for d in dref.stream()]
+        tombstones = [(d.get("ticket_id"), d.get("deleted_at", 0)) for d in deleted_docs]
+    else:
+        rows = _local.list_changes(lower, customer_id, limit=fetch, with_messages=with_messages)
+        if fields is not None:
+            keep = set(fields) | {"id", "created_at", "updated_at"}
+            rows = [{k: v for k, v in t.items() if k in keep} for t in rows]
+        tombstones = _local.list_deletions(lower or 0.0, customer_id)
+
+    tickets = [t for t in rows if (t["id"], t.get("updated_at", 0)) not in seen]
+    # when the page is cut short, nothing past its last change may be reported yet
+    bound = None
+    if limit is not None and len(tickets) > limit:
+        tickets = tickets[:limit]
+        bound = tickets[-1].get("updated_at", 0)
+    elif fetch is not None and len(rows) == fetch:
+        bound = rows[-1].get("updated_at", 0)
+    tombstones = [(i, ts) for i, ts in tombstones
+                  if (i, ts) not in seen_deleted and (bound is None or ts <= bound)]
+
+    stamps = [t.get("updated_at", 0) for t in tickets] + [ts for _, ts in tombstones]
+    new_high = max(stamps + ([high] if high is not None else []), default=None)
+    if bound is None:
+        # everything up to now was read: an idle cursor moves forward too
+        new_high = max(new_high or 0.0, now - CHANGE_OVERLAP_S)
+    horizon = new_high - CHANGE_OVERLAP_S
+    seen = {p for p in seen | {(t["id"], t.get("updated_at", 0)) for t in tickets} if p[1] >= horizon}
+    seen_deleted = {p for p in seen_deleted | set(tombstones) if p[1] >= horizon}
+
+    result = {"tickets": tickets, "deleted": [i for i, _ in tombstones],
+              "cursor": encode_change_cursor(new_high, seen, seen_deleted)}
+    if reset:
+        result["reset"] = True
+    return result
+
+def get_change_marker() -> str:
+    """
+    Cheap version string for the whole ticket collection (latest write and latest delete).
+    Used as the ETag basis for GET /tickets.
+    """
     if USE_FIRESTORE:
-        db.collection("tickets").document(ticket_id).delete()
+        latest = list(db.collection("tickets")
+                      .order_by("updated_at", direction=firestore.Query.DESCENDING)
+                      .limit(1).select(["updated_at"]).stream())
+        latest_del = list(db.collection("ticket_deletions")
+                          .order_by("deleted_at", direction=firestore.Query.DESCENDING)
+                          .limit(1).select(["deleted_at"]).stream())
+        updated = latest[0].to_dict().get("updated_at", 0) if latest else 0
+        deleted = latest_del[0].to_dict().get("deleted_at", 0) if latest_del else 0
     else:
-        if ticket_id in _tickets_memory:
-            del _tickets_memory[ticket_id]
+        updated, deleted = _local.change_marker()
+    return f"{updated!r}:{deleted!r}"
@@ -2,12 +2,13 @@ import os
 import csv
 import json
 import numpy as np
-from model_engine import load_embedding_model, get_embedding
+from model_engine import load_embedding_model, get_embedding, output_dim, fit_projection, save_projection, EMBED_DIM, EMBED_PROJECTION, EMBED_BACKEND
+from vector_store import write_header, index_write_lock, bump_generation, atomic_save, save_meta, EMB_PATH, META_PATH
 
 ROOT = os.path.join(os.path.dirname(__file__), "..")
 CHUNKS_CSV = os.path.join(ROOT, "data", "chunks.csv")
-EMB_OUT = os.path.join(ROOT, "models", "chunk_embeddings.npy")
-META_OUT = os.path.join(ROOT, "models", "chunk_meta.json")
+EMB_OUT = EMB_PATH
+META_OUT = META_PATH
 
 def read_chunks(csv_path):
     rows = []
@@ -22,38 +23,80 @@ def read_chunks(csv_path):
             })
     return rows
 
-def embed_all(chunks, model, batch_size=64):
+def embed_all(chunks, model, batch_size=64, refit=False):
+    """
+    refit: local backend only; fit the local model on these chunks first
+    (always done when no fitted model exists yet).
+    Returns (embeddings, chunks, projection). projection is the PCA fit the embeddings were
+    reduced with ("pca" mode, else None); save it with save_projection() alongside them.
+    """
     texts = [c["chunk_text"] for c in chunks]
     n = len(texts)
     if n == 0:
-        return np.zeros((0, 384), dtype="float32"), []
+        return np.zeros((0, output_dim()), dtype="float32"), [], None
+
+    if EMBED_BACKEND == "local" and (refit or model.svd is None):
+        from local_embedder import fit_local_embedder
+        model = fit_local_embedder(texts)
+
+    # in "pca" mode the projection is (re)fitted on this corpus, so fetch full-size vectors first
+    fit_pca = bool(EMBED_DIM) and EMBED_PROJECTION == "pca" and EMBED_BACKEND != "local"
 
     embeddings = []
     for i in range(0, n, batch_size):
         batch = texts[i:i+batch_size]
-        emb = get_embedding(model, batch) 
+        emb = get_embedding(model, batch, project_output=not fit_pca)
         if emb is None:
             raise RuntimeError("Embedding returned None for batch starting at %d" % i)
         embeddings.append(emb)
         print(f"Embedded {min(i+batch_size, n)}/{n}")
 
     embeddings = np.vstack(embeddings).astype("float32")
-    return embeddings, chunks
+    projection = None
+    if fit_pca:
+        projection = fit_projection(embeddings, EMBED_DIM)
+        mean, components, _ = projection
+        embeddings = ((embeddings - mean) @ components.T).astype("float32")
+    return embeddings, chunks, projection
+
+def write_index(emb_matrix, meta, projection=None, emb_out=EMB_OUT, meta_out=META_OUT):
+    """Replaces the index files (and the PCA projection they were reduced with) as one generation."""
+    with index_write_lock(emb_out):
+        atomic_save(emb_out, emb_matrix)
+        save_meta(list(meta), meta_out)
+        if projection is not None:
+            # queries switch to the new basis together with the matrix it produced
+            save_projection(projection)
+        write_header(emb_matrix, emb_out)
+        bump_generation(emb_out)
+
+def rebuild_index(meta, emb_out=EMB_OUT, meta_out=META_OUT, batch_size=64):
+    """
+    Re-embeds every chunk in `meta` with the current embedding settings and replaces
+    the stored matrix (metadata order is kept). Returns False if embedding failed.
+    """
+    try:
+        emb_matrix, _, projection = embed_all(meta, load_embedding_model(), batch_size=batch_size)
+    except RuntimeError as e:
+        print(f"[ERROR] Index rebuild failed: {e}")
+        return False
+    write_index(emb_matrix, meta, projection, emb_out, meta_out)
+    print(f"[OK] Rebuilt index: {emb_matrix.shape}")
+    return True
 
 def main(batch_size=64):
-    os.makedirs(os.path.join(ROOT, "models"), exist_ok=True)
+    os.makedirs(os.path.dirname(EMB_OUT), exist_ok=True)
 
     print("Reading chunks from:", CHUNKS_CSV)
     chunks = read_chunks(CHUNKS_CSV)
     print("Num chunks:", len(chunks))
 
     model = load_embedding_model()  
-    emb_matrix, meta = embed_all(chunks, model, batch_size=batch_size)
+    # a full build refits the local backend on the current KB
+    emb_matrix, meta, projection = embed_all(chunks, model, batch_size=batch_size, refit=True)
 
     print("Embeddings shape:", emb_matrix.shape)
-    np.save(EMB_OUT, emb_matrix)
-    with open(META_OUT, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    write_index(emb_matrix, meta, projection)
 
     print("Saved embeddings ->", EMB_OUT)
     print("Saved metadata ->", META_OUT)
@@ -0,0 +1,347 @@
+# src/firestore_fake.py
+"""
+In-process stand-in for the subset of the Firestore client API that db.py uses:
+documents (get/create/set/update/delete, last_update_time preconditions), batched writes, and queries with where /
+order_by / start_after / limit / select / stream, including ArrayUnion updates.
+
+    import db
+    from firestore_fake import FakeFirestore
+    db.use_firestore_client(FakeFirestore(latency_ms=5))
+
+Documents are copied on every read and write, as a real client (de)serializes them.
+latency_ms adds a fixed delay per RPC to stand in for the network round-trip.
+Snapshot listeners (query.on_snapshot) are called synchronously on each write, with the
+changed document only (`docs` is left empty).
+
+    python firestore_fake.py    # checks db.py's ticket cache against the fake
+"""
+import copy
+import time
+import heapq
+import itertools
+import threading
+from functools import total_ordering
+from collections import defaultdict
+
+from google.api_core.exceptions import NotFound, AlreadyExists, FailedPrecondition
+from google.cloud import firestore
+from google.cloud.firestore_v1.transforms import ArrayUnion
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+@total_ordering
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class _Snapshot:
+    def __init__(self, doc_id, data, update_time=None):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+        self.update_time = update_time
+
+    def to_dict(self):
+        return self._data
+
+
+class _DocumentRef:
+    def __init__(self, client, collection, doc_id):
+        self._client, self._collection, self.id = client, collection, doc_id
+
+    def get(self):
+        self._client._rpc()
+        with self._client._lock:
+            data = self._client._docs[self._collection].get(self.id)
+            return _Snapshot(self.id, copy.deepcopy(data), self._client._update_times.get((self._collection, self.id)))
+
+    def create(self, data):
+        self._client._rpc()
+        self._client._create(self._collection, self.id, data)
+
+    def set(self, data):
+        self._client._rpc()
+        self._client._set(self._collection, self.id, data)
+
+    def update(self, fields, option=None):
+        self._client._rpc()
+        self._client._update(self._collection, self.id, fields, option)
+
+    def delete(self):
+        self._client._rpc()
+        self._client._delete(self._collection, self.id)
+
+
+class _Query:
+    def __init__(self, client, collection, filters=(), orders=(), start=None, limit=None, fields=None):
+        self._client, self._collection = client, collection
+        self._filters, self._orders = tuple(filters), tuple(orders)
+        self._start, self._limit, self._fields = start, limit, fields
+
+    def _copy(self, **changes):
+        kw = {"filters": self._filters, "orders": self._orders, "start": self._start,
+              "limit": self._limit, "fields": self._fields, **changes}
+        return _Query(self._client, self._collection, **kw)
+
+    def where(self, field, op, value):
+        if op not in _OPS:
+            raise ValueError(f"unsupported operator {op!r}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction=firestore.Query.ASCENDING):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def start_after(self, values):
+        return self._copy(start=list(values))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def _matches(self, data):
+        return data is not None and all(f in data and _OPS[op](data[f], value) for f, op, value in self._filters)
+
+    def _key(self, values):
+        return tuple(_Descending(v) if d == firestore.Query.DESCENDING else v
+                     for v, (_, d) in zip(values, self._orders))
+
+    def stream(self):
+        self._client._rpc()
+        fields = [f for f, _ in self._orders]
+        with self._client._lock:
+            rows = []
+            for doc_id, data in self._client._docs[self._collection].items():
+                # like Firestore, a document without an ordered field is left out
+                if any(f != "__name__" and f not in data for f in fields):
+                    continue
+                if not self._matches(data):
+                    continue
+                rows.append((self._key([doc_id if f == "__name__" else data[f] for f in fields]), doc_id, data))
+            if self._start is not None:
+                start = self._key(self._start)
+                rows = [r for r in rows if r[0] > start]
+            if self._limit is not None:
+                rows = heapq.nsmallest(self._limit, rows, key=lambda r: (r[0], r[1]))
+            else:
+                rows.sort(key=lambda r: (r[0], r[1]))
+            out = []
+            for _, doc_id, data in rows:
+                if self._fields is not None:
+                    data = {f: data[f] for f in self._fields if f in data}
+                out.append(_Snapshot(doc_id, copy.deepcopy(data)))
+        return iter(out)
+
+    def get(self):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        """callback(docs, changes, read_time) for the current matches, then for every write that enters, changes or leaves them."""
+        watch = _Watch(self._client, self, callback)
+        with self._client._lock:
+            initial = [_Change("ADDED", _Snapshot(doc_id, copy.deepcopy(data)))
+                       for doc_id, data in self._client._docs[self._collection].items() if self._matches(data)]
+            self._client._watches.add(watch)
+        if initial:
+            callback([], initial, time.time())
+        return watch
+
+
+class _Change:
+    __slots__ = ("type", "document")
+
+    def __init__(self, kind, document):
+        self.type, self.document = kind, document
+
+
+class _Watch:
+    def __init__(self, client, query, callback):
+        self._client, self.query, self.callback = client, query, callback
+
+    def unsubscribe(self):
+        with self._client._lock:
+            self._client._watches.discard(self)
+
+
+class _Collection(_Query):
+    def document(self, doc_id):
+        return _DocumentRef(self._client, self._collection, doc_id)
+
+
+class _Batch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def create(self, ref, data):
+        self._ops.append(("create", ref, copy.deepcopy(data)))
+
+    def set(self, ref, data):
+        self._ops.append(("set", ref, copy.deepcopy(data)))
+
+    def update(self, ref, fields):
+        self._ops.append(("update", ref, fields))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None))
+
+    def commit(self):
+        self._client._rpc()
+        with self._client._lock:
+            # all-or-nothing, like a Firestore batch: check every create/update target first
+            for op, ref, _ in self._ops:
+                exists = ref.id in self._client._docs[ref._collection]
+                if op == "update" and not exists:
+                    raise NotFound(f"No document to update: {ref._collection}/{ref.id}")
+                if op == "create" and exists:
+                    raise AlreadyExists(f"Document already exists: {ref._collection}/{ref.id}")
+            for op, ref, data in self._ops:
+                if op in ("set", "create"):
+                    self._client._set(ref._collection, ref.id, data)
+                elif op == "update":
+                    self._client._update(ref._collection, ref.id, data)
+                else:
+                    self._client._delete(ref._collection, ref.id)
+        self._ops = []
+
+
+class _LastUpdateOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class FakeFirestore:
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self._docs = defaultdict(dict)   # collection -> {doc id: data}
+        self._watches = set()
+        self._update_times = {}          # (collection, doc id) -> write counter, stands in for update_time
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+        self.stats = {"rpcs": 0}
+
+    def _rpc(self):
+        self.stats["rpcs"] += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def collection(self, name):
+        return _Collection(self, name)
+
+    def batch(self):
+        return _Batch(self)
+
+    def write_option(self, last_update_time):
+        return _LastUpdateOption(last_update_time)
+
+    def _set(self, collection, doc_id, data):
+        with self._lock:
+            before = self._docs[collection].get(doc_id)
+            self._docs[collection][doc_id] = copy.deepcopy(data)
+            self._written(collection, doc_id, before, data)
+
+    def _written(self, collection, doc_id, before, after):
+        # bumps the update time and calls the snapshot listeners the write concerns
+        if after is None:
+            self._update_times.pop((collection, doc_id), None)
+        else:
+            self._update_times[(collection, doc_id)] = next(self._clock)
+        for watch in list(self._watches):
+            if watch.query._collection != collection:
+                continue
+            was, now = watch.query._matches(before), watch.query._matches(after)
+            if was or now:
+                kind = "REMOVED" if not now else "MODIFIED" if was else "ADDED"
+                watch.callback([], [_Change(kind, _Snapshot(doc_id, copy.deepcopy(after) if now else None))], time.time())
+
+    def _create(self, collection, doc_id, data):
+        with self._lock:
+            if doc_id in self._docs[collection]:
+                raise AlreadyExists(f"Document already exists: {collection}/{doc_id}")
+            self._docs[collection][doc_id] = copy.deepcopy(data)
+            self._written(collection, doc_id, None, data)
+
+    def _update(self, collection, doc_id, fields, option=None):
+        with self._lock:
+            doc = self._docs[collection].get(doc_id)
+            if doc is None:
+                raise NotFound(f"No document to update: {collection}/{doc_id}")
+            if option is not None and self._update_times.get((collection, doc_id)) != option.last_update_time:
+                raise FailedPrecondition(f"Document changed since it was read: {collection}/{doc_id}")
+            before = copy.deepcopy(doc) if self._watches else None
+            for key, value in fields.items():
+                if isinstance(value, ArrayUnion):
+                    items = doc.setdefault(key, [])
+                    items.extend(copy.deepcopy(v) for v in value.values if v not in items)
+                else:
+                    doc[key] = copy.deepcopy(value)
+            self._written(collection, doc_id, before, doc)
+
+    def _delete(self, collection, doc_id):
+        with self._lock:
+            before = self._docs[collection].pop(doc_id, None)
+            if before is not None:
+                self._written(collection, doc_id, before, None)
+
+
+if __name__ == "__main__":
+    # Two API workers share one Firestore: this process writes through db.py (and its ticket
+    # cache), the other worker is played by writes straight to the client.
+    import db
+
+    def other_worker_reply(client, ticket_id, content):
+        client.collection("tickets").document(ticket_id).update({
+            "messages": ArrayUnion([{"role": "customer", "content": content, "ts": time.time()}]),
+            "updated_at": time.time()})
+
+    def last_message(ticket):
+        return ticket["messages"][-1]["content"]
+
+    for listen in (False, True):
+        client = FakeFirestore()
+        db.use_firestore_client(client, listen=listen)
+        ticket_id = db.create_ticket("cust-1", "my parcel never arrived")
+        db.add_message(ticket_id, "agent", "checking with the courier")
+        assert last_message(db.get_ticket(ticket_id)) == "checking with the courier"  # write-through
+        rpcs = client.stats["rpcs"]
+        db.get_ticket(ticket_id)
+        assert client.stats["rpcs"] == rpcs, "cached read went to Firestore"
+
+        other_worker_reply(client, ticket_id, "it is still missing")
+        cached = last_message(db.get_ticket(ticket_id))
+        # without the listener the cached copy is stale until TICKET_CACHE_TTL; with it, evicted
+        assert cached == ("it is still missing" if listen else "checking with the courier"), cached
+        assert last_message(db.get_ticket(ticket_id, fresh=True)) == "it is still missing"
+        print(f"listen={listen}: cached read {cached!r}, fresh read sees the other worker's reply")
+
+        # a suggestion computed for the previous messages must not be stored
+        version = len(db.get_ticket(ticket_id, fresh=True)["messages"])
+        def at_version(n):
+            return lambda t: len(t["messages"]) == n
+        assert db.set_suggestion(ticket_id, {"answer": "new"}, if_current=at_version(version))
+        assert not db.set_suggestion(ticket_id, {"answer": "old"}, if_current=at_version(version - 1))
+        assert db.get_ticket(ticket_id, fresh=True)["suggestion"] == {"answer": "new"}
+
+        db.delete_ticket(ticket_id)
+        assert db.get_ticket(ticket_id) is None and db.get_ticket(ticket_id, fresh=True) is None
+    print(f"[OK] ticket cache checks passed ({db.cache_stats()})")
@@ -0,0 +1,330 @@
+# src/knowledge_index.py
+"""
+Browse and search index over the knowledge-base chunk metadata (GET /knowledge).
+
+Chunks are listed in a stable order: title (case-insensitive), article_id, then chunk
+number. Pages are keyset cursors on that order, so inserts and deletes between pages
+neither repeat nor skip chunks. A page costs a bisect plus decoding its own rows from
+the metadata snapshot, whatever the size of the knowledge base.
+
+Search goes through a word index over titles and text: a sorted vocabulary (prefix
+ranges by bisection), trigrams of the vocabulary (words containing a fragment), and
+per-word posting arrays in listing order. match=prefix needs every query word to start
+a word of the chunk; match=substring needs the query to appear in the title or text,
+and only the index's candidates are checked, one page at a time.
+
+The index is built during warm-up and again after each upload/delete reloads the store;
+until a rebuild finishes, the previous index keeps serving.
+
+    python knowledge_index.py    # build / page / search cost on 10 vs 100k chunks
+"""
+import re
+import json
+import base64
+import threading
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+_ORDINAL_RE = re.compile(r"(\d+)$")
+
+MAX_PAGE = 500
+
+
+def _norm(text):
+    return " ".join((text or "").lower().split())
+
+def _chunk_key(m, article_title):
+    """Listing order: article title, article, then chunk number (upload ids end in _<i>)."""
+    cid = m.get("chunk_id") or ""
+    n = _ORDINAL_RE.search(cid)
+    return (article_title.casefold(), m.get("article_id") or "", int(n.group(1)) if n else -1, cid)
+
+def _trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+# a cursor is the last key of its listing: chunk keys and article keys (key[:2]) never mix
+_CURSOR_SHAPES = {"chunk": (str, str, int, str), "article": (str, str)}
+
+def decode_cursor(cursor, kind="chunk"):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("invalid cursor")
+    shape = _CURSOR_SHAPES[kind]
+    if (not isinstance(key, list) or len(key) != len(shape)
+            or not all(type(v) is t for v, t in zip(key, shape))):
+        raise ValueError(f"invalid cursor (not from a {kind} listing)")
+    return tuple(key)
+
+
+class KnowledgeIndex:
+    def __init__(self, meta):
+        self.meta = meta
+        rows = list(enumerate(meta))
+        titles = {}  # an article sorts (and groups) under the title of its first chunk
+        for _, m in rows:
+            titles.setdefault(m.get("article_id"), m.get("title") or "")
+        rows = [(_chunk_key(m, titles[m.get("article_id")]), i, m) for i, m in rows]
+        rows.sort(key=lambda r: r[0])
+        self.keys = [r[0] for r in rows]
+        self.order = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+
+        # articles: listing ranges, in listing order
+        self.article_keys, self.article_ranges, self.article_info = [], [], []
+        self._article_at = {}
+        for rank, (key, _, m) in enumerate(rows):
+            akey = key[:2]
+            if not self.article_keys or self.article_keys[-1] != akey:
+                self._article_at[m.get("article_id")] = len(self.article_keys)
+                self.article_keys.append(akey)
+                self.article_ranges.append([rank, rank])
+                self.article_info.append({"article_id": m.get("article_id"), "title": titles[m.get("article_id")],
+                                          "file_url": m.get("file_url")})
+            self.article_ranges[-1][1] = rank + 1
+
+        # word index: each chunk's distinct title/text words, postings in listing order
+        all_words, counts = [], []
+        for _, _, m in rows:
+            words = set(_TOKEN_RE.findall(f"{m.get('title') or ''} {m.get('chunk_text') or ''}".lower()))
+            all_words.extend(words)
+            counts.append(len(words))
+        self.vocab = sorted(set(all_words))
+        word_ids = {w: i for i, w in enumerate(self.vocab)}
+        word_col = np.fromiter(map(word_ids.__getitem__, all_words), dtype=np.int64, count=len(all_words))
+        rank_col = np.repeat(np.arange(len(rows), dtype=np.int32), counts)
+        by_word = np.argsort(word_col, kind="stable")  # ranks stay ascending within a word
+        self.postings = rank_col[by_word]
+        self.posting_offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(word_col, minlength=len(self.vocab)), out=self.posting_offsets[1:])
+        self._grams = {}
+        for wid, w in enumerate(self.vocab):
+            for g in _trigrams(w):
+                self._grams.setdefault(g, []).append(wid)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def article_size(self, article_id):
+        a = self._article_at.get(article_id)
+        return 0 if a is None else self.article_ranges[a][1] - self.article_ranges[a][0]
+
+    # ---------------- search ----------------
+    def _words_with_prefix(self, term):
+        lo = bisect_left(self.vocab, term)
+        hi = bisect_left(self.vocab, term + "\U0010ffff", lo)
+        return range(lo, hi)
+
+    def _words_containing(self, term):
+        if len(term) < 3:
+            return [wid for wid, w in enumerate(self.vocab) if term in w]
+        lists = sorted((self._grams.get(g, []) for g in _trigrams(term)), key=len)
+        if not lists[0]:
+            return []
+        common = set(lists[0]).intersection(*lists[1:])
+        return sorted(wid for wid in common if term in self.vocab[wid])
+
+    def _postings(self, word_ids):
+        parts = [self.postings[self.posting_offsets[w]:self.posting_offsets[w + 1]] for w in word_ids]
+        if not parts:
+            return np.zeros(0, dtype=np.int32)
+        return parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+
+    def candidates(self, q, match="substring"):
+        """Listing ranks (ascending) that may match q; exact for prefix and single-word substring queries."""
+        terms = _TOKEN_RE.findall(q.lower())
+        if not terms:
+            return np.arange(len(self.keys), dtype=np.int32)
+        found = None
+        for term in sorted(set(terms), key=len, reverse=True):  # longest (rarest) first
+            words = self._words_with_prefix(term) if match == "prefix" else self._words_containing(term)
+            ranks = self._postings(words)
+            found = ranks if found is None else np.intersect1d(found, ranks, assume_unique=True)
+            if not len(found):
+                break
+        return found
+
+    def _verifier(self, q, match):
+        needle = _norm(q)
+        if match == "prefix" or _TOKEN_RE.fullmatch(needle):
+            return None  # the word index is exact for these
+        return lambda m: needle in _norm(m.get("title")) or needle in _norm(m.get("chunk_text"))
+
+    # ---------------- pages ----------------
+    def _row(self, rank):
+        return self.meta[int(self.order[rank])]
+
+    def _scan(self, ranks, q, match):
+        """Rows for the given listing ranks that match q, decoded lazily."""
+        verify = self._verifier(q, match) if q else None
+        for rank in ranks:
+            m = self._row(rank)
+            if verify is None or verify(m):
+                yield int(rank), m
+
+    def page(self, limit=50, cursor=None, q=None, match="substring", article_id=None):
+        """(chunk rows, next cursor or None) in listing order."""
+        lo, hi = 0, len(self.keys)
+        if article_id is not None:
+            a = self._article_at.get(article_id)
+            if a is None:
+                return [], None
+            lo, hi = self.article_ranges[a]
+        if cursor:
+            lo = max(lo, bisect_right(self.keys, decode_cursor(cursor, "chunk"), lo, hi))
+        if q:
+            ranks = self.candidates(q, match)
+            ranks = ranks[np.searchsorted(ranks, lo):np.searchsorted(ranks, hi)]
+        else:
+            ranks = range(lo, hi)
+        out, last = [], None
+        for rank, m in self._scan(ranks, q, match):
+            if len(out) == limit:
+                return out, encode_cursor(self.keys[last])
+            out.append(m)
+            last = rank
+        return out, None
+
+    def article_page(self, limit=50, cursor=None, q=None, match="substring"):
+        """(article summaries, next cursor or None); with q, articles that have a matching chunk."""
+        start = bisect_right(self.article_keys, decode_cursor(cursor, "article")) if cursor else 0
+        ranks = self.candidates(q, match) if q else None
+        verify = self._verifier(q, match) if q else None
+        out, last = [], None
+        for a in range(start, len(self.article_keys)):
+            lo, hi = self.article_ranges[a]
+            item = {**self.article_info[a], "chunks": hi - lo}
+            if ranks is not None:
+                # first chunk of this article that really matches
+                hits = ranks[np.searchsorted(ranks, lo):np.searchsorted(ranks, hi)]
+                first = next((int(r) for r in hits if verify is None or verify(self._row(r))), None)
+                if first is None:
+                    continue
+                item["first_match"] = self.keys[first][3]
+            if len(out) == limit:
+                return out, encode_cursor(self.article_keys[last])
+            out.append(item)
+            last = a
+        return out, None
+
+
+_index = None
+_lock = threading.Lock()
+_first_build = threading.Lock()
+_building = None
+
+def _rebuild(meta):
+    global _index, _building
+    try:
+        idx = KnowledgeIndex(meta)
+        with _lock:
+            _index = idx
+    except Exception as e:
+        print(f"[ERROR] Knowledge index rebuild failed: {e}")
+    finally:
+        with _lock:
+            _building = None
+
+def get_index():
+    """
+    The index for the shared store's metadata. The first call builds it; after the store
+    reloads, the previous index keeps serving while the new one builds in the background.
+    """
+    global _index, _building
+    from vector_store import get_store
+    meta = get_store().meta
+    idx = _index
+    if idx is not None and idx.meta is meta:
+        return idx
+    with _lock:
+        if _index is None:
+            idx = None
+        elif _index.meta is meta:
+            return _index
+        else:
+            idx = _index
+            if _building is None:
+                _building = threading.Thread(target=_rebuild, args=(meta,), name="knowledge-index", daemon=True)
+                _building.start()
+    if idx is not None:
+        return idx
+    with _first_build:  # nothing to serve yet: the first caller builds, concurrent ones wait
+        if _index is None:
+            idx = KnowledgeIndex(meta)
+            with _lock:
+                _index = idx
+        return _index
+
+def list_item(m, text_chars=0):
+    """Listing fields of a chunk; text_chars > 0 adds the first text_chars characters of its text."""
+    item = {"chunk_id": m.get("chunk_id"), "article_id": m.get("article_id"), "title": m.get("title"),
+            "file_url": m.get("file_url")}
+    if m.get("also_in"):
+        item["also_in"] = m["also_in"]
+    if text_chars:
+        text = m.get("chunk_text") or ""
+        item["chunk_text"] = text[:text_chars]
+        item["truncated"] = len(text) > text_chars
+    return item
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import random
+    import shutil
+    import tempfile
+    from http_encoding import dumps
+    from vector_store import save_meta, load_meta
+
+    words = ("order refund password login tracking account charged delivery invoice card reset "
+             "shipping address subscription cancel upgrade billing warranty return exchange").split()
+
+    def synthetic(n):
+        return [{"chunk_id": f"doc_{i // 20}_{i % 20}", "article_id": f"doc_{i // 20}",
+                 "title": f"{words[i // 20 % len(words)].title()} policy {i // 20}.pdf",
+                 "chunk_text": " ".join(random.choices(words, k=50))} for i in range(n)]
+
+    def best_ms(fn, repeat=20):
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn()
+            dt = (time.perf_counter() - t0) * 1000
+            best = dt if best is None else min(best, dt)
+        return best, out
+
+    def page_bytes(result):
+        rows, cursor = result
+        return len(dumps({"chunks": [list_item(m, 200) for m in rows], "next_cursor": cursor}))
+
+    random.seed(0)
+    tmp = tempfile.mkdtemp(prefix="kb-bench-")
+    try:
+        for n in (10, 100000):
+            # served from the metadata snapshot, as the API does
+            path = os.path.join(tmp, f"meta_{n}.json")
+            save_meta(synthetic(n), path)
+            meta = load_meta(path)
+            t0 = time.perf_counter()
+            idx = KnowledgeIndex(meta)
+            t_build = (time.perf_counter() - t0) * 1000
+            _, cur = idx.page(limit=50)
+            print(f"{n} chunks: index built in {t_build:.0f} ms ({len(idx.vocab)} words, {len(idx.article_keys)} articles)")
+            for label, fn in [("first page (50)", lambda: idx.page(limit=50)),
+                              ("next page", lambda: idx.page(limit=50, cursor=cur)),
+                              ("prefix 'pass res'", lambda: idx.page(limit=50, q="pass res", match="prefix")),
+                              ("substring 'fund'", lambda: idx.page(limit=50, q="fund")),
+                              ("substring 'card reset'", lambda: idx.page(limit=50, q="card reset"))]:
+                ms, result = best_ms(fn)
+                print(f"  {label:24s} {ms:9.3f} ms  {page_bytes(result):9d} B")
+            ms, _ = best_ms(lambda: idx.article_page(limit=50))
+            print(f"  {'article page (50)':24s} {ms:9.3f} ms")
+            ms, body = best_ms(lambda: dumps(list(meta)), repeat=3)
+            print(f"  {'legacy: every chunk':24s} {ms:9.3f} ms  {len(body):9d} B")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
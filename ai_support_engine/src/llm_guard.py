@@ -0,0 +1,241 @@
+# src/llm_guard.py
+"""
+Tail-latency controls for upstream LLM calls: a per-attempt timeout inside an overall
+deadline, jittered retries on retryable errors, optional hedging after the observed
+p95 latency, and a circuit breaker that fails fast while the upstream is degraded.
+Callers get either a result or LLMUnavailable, never a hung worker thread.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+import numpy as np
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "20"))      # one attempt
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "30"))    # whole call, retries included
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_S = float(os.getenv("LLM_BACKOFF_S", "0.25"))    # base of the exponential backoff
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_S = float(os.getenv("LLM_HEDGE_MIN_S", "0.5"))  # never hedge sooner than this
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+HEDGE_MIN_SAMPLES = 20  # latencies needed before the p95 is trusted
+
+RETRYABLE_ERRORS = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+
+class LLMUnavailable(Exception):
+    """The upstream call failed, timed out or was short-circuited by the breaker."""
+
+
+def is_retryable(e):
+    if isinstance(e, (TimeoutError, FutureTimeout, ConnectionError)):
+        return True
+    if type(e).__name__ in RETRYABLE_ERRORS:
+        return True
+    status = getattr(e, "status_code", None)
+    return status is not None and (status in (408, 409, 429) or status >= 500)
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failed calls; open -> half_open after
+    `reset_after` seconds, when a single probe is let through; the probe's outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_after=LLM_BREAKER_RESET_S):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_after:
+                self.state = "half_open"
+                self._probe = False
+            if self.state == "half_open" and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._consecutive = 0
+            self._probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                if self.state != "open":
+                    print(f"[WARN] LLM circuit opened after {self._consecutive} failures; serving retrieval-only answers.")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe = False
+
+
+class GuardedCall:
+    """
+    Wraps one upstream operation. `fn(timeout)` must make a single attempt that gives up
+    after `timeout` seconds (e.g. the OpenAI SDK's per-request timeout).
+    """
+
+    def __init__(self, name, timeout=LLM_TIMEOUT_S, deadline=LLM_DEADLINE_S, retries=LLM_MAX_RETRIES,
+                 backoff=LLM_BACKOFF_S, hedge=LLM_HEDGE, hedge_min=LLM_HEDGE_MIN_S, breaker=None):
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = deque(maxlen=512)
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"{name}-hedge")
+        self._lock = threading.Lock()
+        self.counts = {"calls": 0, "ok": 0, "failed": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "short_circuited": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def available(self):
+        """False while the breaker is open (cheap pre-check before building a prompt)."""
+        return self.breaker.state != "open" or time.monotonic() - self.breaker._opened_at >= self.breaker.reset_after
+
+    def hedge_delay(self):
+        """p95 of recent successful attempts, or None until there are enough samples."""
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            p95 = float(np.percentile(self._latencies, 95))
+        return max(p95, self.hedge_min)
+
+    def call(self, fn):
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise LLMUnavailable(f"{self.name}: circuit open")
+        start = time.monotonic()
+        last = None
+        for attempt in range(self.retries + 1):
+            budget = self.deadline - (time.monotonic() - start)
+            if budget <= 0:
+                break
+            if attempt:
+                self._count("retries")
+            t0 = time.monotonic()
+            try:
+                result = self._attempt(fn, min(self.timeout, budget))
+            except Exception as e:
+                last = e
+                if not is_retryable(e):
+                    # the upstream answered (a bad request says nothing against its health):
+                    # count it as a success for the breaker, which also releases a half-open probe
+                    self.breaker.record_success()
+                    self._count("failed")
+                    raise LLMUnavailable(f"{self.name}: {e!r}") from e
+                print(f"[WARN] {self.name} attempt {attempt + 1} failed: {e!r}")
+                if attempt < self.retries:
+                    # full jitter, never sleeping past the deadline
+                    pause = random.uniform(0, self.backoff * (2 ** attempt))
+                    time.sleep(max(0.0, min(pause, self.deadline - (time.monotonic() - start))))
+                continue
+            with self._lock:
+                self._latencies.append(time.monotonic() - t0)
+            self.breaker.record_success()
+            self._count("ok")
+            return result
+        self.breaker.record_failure()
+        self._count("failed")
+        raise LLMUnavailable(f"{self.name}: gave up after {time.monotonic() - start:.1f}s: {last!r}") from last
+
+    def _attempt(self, fn, timeout):
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None or delay >= timeout:
+            return fn(timeout)
+        primary = self._pool.submit(fn, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        # primary is past p95: race a second request, first success wins
+        self._count("hedges")
+        hedged = self._pool.submit(fn, timeout - delay)
+        pending = {primary, hedged}
+        give_up = time.monotonic() + (timeout - delay)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, give_up - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"no response within {timeout:.1f}s (hedged)")
+            for f in done:
+                if f.exception() is None:
+                    if f is hedged:
+                        self._count("hedge_wins")
+                    return f.result()
+                error = f.exception()
+        raise error
+
+    def stats(self):
+        with self._lock:
+            out = dict(self.counts)
+            lat = list(self._latencies)
+        out["breaker"] = self.breaker.state
+        out["p50_ms"] = float(np.percentile(lat, 50)) * 1000 if lat else None
+        out["p95_ms"] = float(np.percentile(lat, 95)) * 1000 if lat else None
+        return out
+
+
+chat_guard = GuardedCall("chat")
+
+
+if __name__ == "__main__":
+    # fault-injection walkthrough against the local stub server
+    from stub_openai import start_stub_server
+
+    server, url = start_stub_server()
+    import openai
+    client = openai.OpenAI(api_key="stub", base_url=url, max_retries=0)
+
+    def attempt(timeout):
+        resp = client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "ping"}], max_tokens=8, timeout=timeout
+        )
+        return resp.choices[0].message.content
+
+    def run(label, guard, n, **faults):
+        server.faults.update(faults)
+        t0 = time.perf_counter()
+        outcomes = []
+        for _ in range(n):
+            try:
+                guard.call(attempt)
+                outcomes.append("ok")
+            except LLMUnavailable:
+                outcomes.append("fallback")
+        dt = time.perf_counter() - t0
+        print(f"{label:28s} {outcomes.count('ok'):3d} ok {outcomes.count('fallback'):3d} fallback "
+              f"in {dt:5.2f}s  {guard.stats()}")
+        server.faults.clear()
+
+    g = GuardedCall("demo", timeout=0.5, deadline=1.5, retries=2, backoff=0.05, hedge=True, hedge_min=0.05,
+                    breaker=CircuitBreaker(failures=3, reset_after=1.0))
+    run("healthy", g, 30, latency_ms=20)
+    run("20% HTTP 500", g, 30, latency_ms=20, error_rate=0.2)
+    run("10% slow (2s) -> hedged", g, 30, latency_ms=20, slow_rate=0.1, slow_ms=2000)
+    run("upstream down -> breaker", g, 10, error_rate=1.0)
+    time.sleep(1.1)
+    run("recovered (half-open probe)", g, 5, latency_ms=20)
+    server.shutdown()
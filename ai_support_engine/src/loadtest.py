@@ -0,0 +1,415 @@
+# src/loadtest.py
+"""
+End-to-end load test of api.py against local stand-ins: stub_openai.py serves chat
+and embeddings with a configurable latency distribution, and tickets live in an
+in-process fake Firestore (default), the Firestore emulator, or the local sqlite store.
+
+    python loadtest.py --duration 60 --agents 20 --rps 5
+    python loadtest.py --llm-latency-ms 800 --llm-dist lognormal --llm-sigma 0.6 --llm-error-rate 0.02
+    python loadtest.py --firestore emulator --emulator-host 127.0.0.1:8080
+    python loadtest.py --mix create=1,reply=2,suggest=4,summarize=1 --json report.json
+
+Three processes: the stub, the app (uvicorn, one worker) and this load generator, so
+client-side work does not share a GIL with the server. The app runs on a scratch
+copy of the KB (INDEX_DIR in a temp dir, embedded through the stub) and a scratch
+ticket store (and LOG_DIR); nothing under models/, data/ or logs/ is touched. The app's output goes to
+app.log in that directory (--keep to look at it). Other app settings
+(SUGGEST_PRECOMPUTE, LLM_*, TICKET_CACHE_*) are read from the environment as usual.
+
+Traffic:
+  - `--agents` agent dashboards and `--customers` customer portals poll GET /tickets
+    every `--poll-s` seconds with the frontend's queries, revalidating with If-None-Match
+    as the browser does;
+  - open-loop arrivals at `--rps` of create / reply / suggest / summarize / view,
+    weighted by `--mix`. Latency is measured from each request's scheduled start, so
+    queueing behind `--concurrency` in-flight requests counts against the server
+    instead of silently lowering the offered load.
+Reports requests, RPS, p50/p95/p99 latency and error rate per endpoint.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+DEFAULT_MIX = "create=2,reply=3,suggest=3,summarize=1,view=3"
+# the agent dashboard's list request (frontend/src/App.jsx)
+AGENT_POLL = {"status": "open", "fields": "text,tags,sentiment,priority,status,customer_id"}
+CUSTOMERS = 500
+TEXTS = [
+    "I was charged twice for my order",
+    "My payment failed but the money left my account",
+    "Forgot my password and cannot login",
+    "Order not delivered and tracking is not updating",
+    "Please update my billing address",
+    "Refund has not arrived after two weeks",
+    "The app crashes when I open the checkout page",
+    "How do I cancel my subscription?",
+    "Coupon code is not applied at checkout",
+    "I received the wrong item in my package",
+]
+FOLLOW_UPS = [
+    "Any update on this?",
+    "I tried that and it still does not work.",
+    "This is really frustrating, please help.",
+    "Thanks, that fixed it!",
+    "Can you escalate this to a manager?",
+]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_http(url, timeout, proc=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with {proc.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code == 200:  # /health: 503 while warming up
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} not reachable after {timeout}s")
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = math.ceil(p / 100.0 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, k))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))   # endpoint -> status/exception -> count
+        self.recording = False
+
+    def record(self, endpoint, seconds, error=None):
+        if not self.recording:
+            return
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if error is not None:
+                self.errors[endpoint][str(error)] += 1
+
+    def report(self, duration):
+        rows = {}
+        with self._lock:
+            for endpoint in sorted(self.latencies):
+                lat = sorted(self.latencies[endpoint])
+                errors = sum(self.errors[endpoint].values())
+                rows[endpoint] = {
+                    "requests": len(lat),
+                    "rps": len(lat) / duration,
+                    "p50_ms": percentile(lat, 50) * 1000,
+                    "p95_ms": percentile(lat, 95) * 1000,
+                    "p99_ms": percentile(lat, 99) * 1000,
+                    "max_ms": lat[-1] * 1000,
+                    "error_rate": errors / len(lat),
+                    "errors": dict(self.errors[endpoint]),
+                }
+        return rows
+
+
+class LoadTest:
+    def __init__(self, base_url, recorder, mix, agents=20, customers=20, poll_s=5.0, rps=5.0, concurrency=64,
+                 timeout=60.0):
+        self.base_url = base_url
+        self.rec = recorder
+        self.mix = mix
+        self.agents = agents
+        self.customers = customers
+        self.poll_s = poll_s
+        self.rps = rps
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="load")
+        self.ticket_ids = []
+        self._ids_lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+
+    def _session(self):
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def _call(self, endpoint, method, path, start=None, ok=(200,), **kwargs):
+        """One request; latency counts from `start` (the scheduled time) when given."""
+        start = start or time.perf_counter()
+        try:
+            r = self._session().request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            self.rec.record(endpoint, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.rec.record(endpoint, time.perf_counter() - start, None if r.status_code in ok else r.status_code)
+        return r
+
+    def _random_ticket(self):
+        with self._ids_lock:
+            return random.choice(self.ticket_ids) if self.ticket_ids else None
+
+    def create(self, start=None):
+        text = f"{random.choice(TEXTS)} (order #{random.randrange(10000, 99999)})"
+        r = self._call("POST /tickets", "POST", "/tickets", start,
+                       json={"customer_id": f"cust-{random.randrange(CUSTOMERS)}", "text": text})
+        if r is not None and r.status_code == 200:
+            with self._ids_lock:
+                self.ticket_ids.append(r.json()["ticket_id"])
+
+    def reply(self, start=None):
+        tid = self._random_ticket()
+        if tid is None:
+            return self.create(start)
+        role = random.choice(["customer", "agent"])
+        content = random.choice(FOLLOW_UPS) if role == "customer" else "Thanks for reaching out, we are looking into it."
+        self._call("POST /tickets/{id}/reply", "POST", f"/tickets/{tid}/reply", start,
+                   json={"role": role, "content": content})
+
+    def suggest(self, start=None):
+        tid = self._random_ticket()
+        if tid is None:
+            return self.create(start)
+        self._call("POST /tickets/{id}/suggest", "POST", f"/tickets/{tid}/suggest", start)
+
+    def summarize(self, start=None):
+        tid = self._random_ticket()
+        if tid is None:
+            return self.create(start)
+        self._call("POST /tickets/{id}/summarize", "POST", f"/tickets/{tid}/summarize", start)
+
+    def view(self, start=None):
+        tid = self._random_ticket()
+        if tid is None:
+            return self.create(start)
+        self._call("GET /tickets/{id}", "GET", f"/tickets/{tid}", start)
+
+    def _poller(self, endpoint, params):
+        # what the frontend does every 5 s; the browser revalidates with the ETag it holds
+        if self._stop.wait(random.uniform(0, self.poll_s)):  # dashboards start out of phase
+            return
+        etag = None
+        while not self._stop.is_set():
+            headers = {"If-None-Match": etag} if etag else {}
+            r = self._call(endpoint, "GET", "/tickets", ok=(200, 304), params=params, headers=headers)
+            if r is not None and r.status_code == 200:
+                etag = r.headers.get("ETag")
+            self._stop.wait(self.poll_s)
+
+    def seed(self, n):
+        list(self.pool.map(lambda _: self.create(), range(n)))
+
+    def run(self, duration):
+        actions = [getattr(self, name) for name in self.mix]
+        weights = list(self.mix.values())
+        pollers = [threading.Thread(target=self._poller, daemon=True,
+                                    args=("GET /tickets?status=open (agent poll)", AGENT_POLL)) for _ in range(self.agents)]
+        pollers += [threading.Thread(target=self._poller, daemon=True,
+                                     args=("GET /tickets?customer_id= (customer poll)", {"customer_id": f"cust-{i}"}))
+                    for i in range(self.customers)]
+        for t in pollers:
+            t.start()
+        t_end = time.perf_counter() + duration
+        next_at = time.perf_counter()
+        while True:
+            next_at += random.expovariate(self.rps) if self.rps > 0 else duration
+            if next_at >= t_end:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.pool.submit(random.choices(actions, weights)[0], next_at)
+        time.sleep(max(0.0, t_end - time.perf_counter()))
+        self._stop.set()
+        self.pool.shutdown(wait=True)
+        for t in pollers:
+            t.join()
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("create", "reply", "suggest", "summarize", "view"):
+            raise ValueError(f"unknown action {name!r} in --mix")
+        mix[name] = float(weight or 1)
+    return mix
+
+def print_report(rows, duration):
+    total = sum(r["requests"] for r in rows.values())
+    errors = sum(r["error_rate"] * r["requests"] for r in rows.values())
+    print(f"\n{'endpoint':42s} {'reqs':>7s} {'rps':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'errors':>7s}")
+    for endpoint, r in rows.items():
+        print(f"{endpoint:42s} {r['requests']:7d} {r['rps']:7.2f} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} "
+              f"{r['p99_ms']:9.1f} {r['max_ms']:9.1f} {r['error_rate'] * 100:6.1f}%")
+        if r["errors"]:
+            print(f"{'':42s} errors: {r['errors']}")
+    if total:
+        print(f"{'total':42s} {total:7d} {total / duration:7.2f} {'':39s} {errors / total * 100:6.1f}%")
+
+
+# --- server side (run in the app process) ---
+
+def serve(args):
+    import uvicorn
+    from vector_store import EMB_PATH, META_PATH
+
+    if not os.path.exists(EMB_PATH):
+        from embed_chunks import rebuild_index
+        with open(META_PATH, encoding="utf-8") as f:
+            meta = json.load(f)
+        if not rebuild_index(meta):
+            raise SystemExit("[ERROR] Could not embed the scratch KB through the stub")
+
+    import db
+    if args.firestore == "fake":
+        from firestore_fake import FakeFirestore
+        db.use_firestore_client(FakeFirestore(latency_ms=args.firestore_latency_ms), listen=False)
+        print(f"[INFO] Tickets in an in-process fake Firestore ({args.firestore_latency_ms:g} ms per RPC)")
+    import api
+    # keep-alive above the poll interval, as behind a load balancer; uvicorn's 5 s default
+    # races the 5 s pollers and shows up as connection resets
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False,
+                timeout_keep_alive=75)
+
+
+def start_processes(args, workdir):
+    """Starts the stub and the app; returns (stub_proc, app_proc, app_url, stub_url)."""
+    stub_port, app_port = _free_port(), _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub = subprocess.Popen([sys.executable, os.path.join(HERE, "stub_openai.py"), "--port", str(stub_port)],
+                            stdout=subprocess.DEVNULL)
+    _wait_http(stub_url + "/_stats", 10, stub)
+
+    index_dir = os.path.join(workdir, "models")
+    os.makedirs(index_dir)
+    shutil.copy(os.path.join(ROOT, "models", "chunk_meta.json"), os.path.join(index_dir, "chunk_meta.json"))
+    env = dict(os.environ,
+               OPENAI_BASE_URL=stub_url + "/v1", OPENAI_API_KEY="stub",
+               INDEX_DIR=index_dir, TICKETS_DB_PATH=os.path.join(workdir, "tickets.db"),
+               LOG_DIR=os.path.join(workdir, "logs"),
+               TICKET_CACHE_LISTEN="0", PYTHONUNBUFFERED="1")
+    env.pop("FIREBASE_KEY_PATH", None)
+    if args.firestore == "emulator":
+        env["FIRESTORE_EMULATOR_HOST"] = args.emulator_host
+    else:
+        env.pop("FIRESTORE_EMULATOR_HOST", None)
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(app_port),
+           "--firestore", args.firestore, "--firestore-latency-ms", str(args.firestore_latency_ms)]
+    # the app's own output (DEBUG lines per request) goes to a log file, not the report
+    with open(os.path.join(workdir, "app.log"), "w") as log:
+        app = subprocess.Popen(cmd, env=env, cwd=HERE, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        _wait_http(f"http://127.0.0.1:{app_port}/health", 120, app)
+    except Exception:
+        stub.terminate()
+        app.terminate()
+        print(f"[ERROR] App did not start; see {os.path.join(workdir, 'app.log')} (kept)")
+        args.keep = True
+        raise
+    return stub, app, f"http://127.0.0.1:{app_port}", stub_url
+
+def clear_emulator(host, project):
+    """Deletes every document in the emulator's database, so runs start from the same state."""
+    r = requests.delete(f"http://{host}/emulator/v1/projects/{project}/databases/(default)/documents", timeout=10)
+    r.raise_for_status()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end load test of the API with a stub OpenAI server")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--agents", type=int, default=20, help="agent dashboards polling open tickets")
+    parser.add_argument("--customers", type=int, default=20, help="customer portals polling their tickets")
+    parser.add_argument("--poll-s", type=float, default=5.0)
+    parser.add_argument("--rps", type=float, default=5.0, help="arrival rate of the --mix actions")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="action=weight,... of create/reply/suggest/summarize/view")
+    parser.add_argument("--concurrency", type=int, default=64, help="max in-flight --mix requests")
+    parser.add_argument("--seed-tickets", type=int, default=50, help="tickets created before measuring")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--llm-dist", choices=["fixed", "lognormal", "exponential"], default="lognormal")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="lognormal spread")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0)
+    parser.add_argument("--llm-error-rate", type=float, default=0)
+    parser.add_argument("--llm-slow-rate", type=float, default=0)
+    parser.add_argument("--llm-slow-ms", type=float, default=0)
+    parser.add_argument("--firestore", choices=["fake", "emulator", "local"], default="fake",
+                        help="fake: in-process FakeFirestore; emulator: FIRESTORE_EMULATOR_HOST; local: sqlite")
+    parser.add_argument("--firestore-latency-ms", type=float, default=0, help="fake: delay per RPC")
+    parser.add_argument("--emulator-host", default=os.getenv("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080"))
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        raise SystemExit(0)
+
+    mix = parse_mix(args.mix)
+    if args.firestore == "emulator":
+        clear_emulator(args.emulator_host, os.getenv("FIRESTORE_PROJECT", "demo-owntrail"))
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    stub = app = None
+    try:
+        print(f"[INFO] Starting stub OpenAI and the app (scratch dir {workdir})")
+        stub, app, base_url, stub_url = start_processes(args, workdir)
+        faults = {"latency_ms": args.llm_latency_ms, "latency_dist": args.llm_dist, "latency_sigma": args.llm_sigma,
+                  "jitter_ms": args.llm_jitter_ms, "error_rate": args.llm_error_rate,
+                  "slow_rate": args.llm_slow_rate, "slow_ms": args.llm_slow_ms}
+        requests.post(stub_url + "/_faults", json=faults, timeout=5).raise_for_status()
+
+        rec = Recorder()
+        lt = LoadTest(base_url, rec, mix, agents=args.agents, customers=min(args.customers, CUSTOMERS),
+                      poll_s=args.poll_s, rps=args.rps,
+                      concurrency=args.concurrency, timeout=args.timeout)
+        lt.seed(args.seed_tickets)
+        print(f"[INFO] Seeded {len(lt.ticket_ids)} tickets; running {args.duration:g}s: {args.agents} agents and "
+              f"{args.customers} customers polling every {args.poll_s:g}s, {args.rps:g} req/s of {args.mix}")
+        rec.recording = True
+        t0 = time.perf_counter()
+        lt.run(args.duration)
+        elapsed = time.perf_counter() - t0
+        rec.recording = False
+
+        rows = rec.report(elapsed)
+        print_report(rows, elapsed)
+        llm = requests.get(stub_url + "/_stats", timeout=5).json()
+        app_stats = {name: requests.get(base_url + f"/stats/{name}", timeout=5).json() for name in ("llm", "precompute")}
+        print(f"\nstub OpenAI: {llm}")
+        print(f"app: {json.dumps(app_stats)}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "duration_s": elapsed, "endpoints": rows,
+                           "stub": llm, "app": app_stats}, f, indent=2)
+    finally:
+        for proc in (app, stub):
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+        if args.keep:
+            print(f"[INFO] Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
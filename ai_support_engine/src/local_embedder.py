@@ -0,0 +1,164 @@
+# src/local_embedder.py
+"""
+Offline CPU embedding backend: hashing vectorizer -> TF-IDF -> truncated SVD (LSA),
+fitted on the knowledge base. No network, no per-token cost, deterministic output;
+selected with EMBED_BACKEND=local and used through model_engine.get_embedding.
+"""
+import os
+import time
+import pickle
+import hashlib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.decomposition import TruncatedSVD
+
+from vector_store import INDEX_DIR, _replacing
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+# lives with the index it embedded, like the PCA projection
+LOCAL_MODEL_PATH = os.path.join(INDEX_DIR, "local_embedder.pkl")
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "256"))
+LOCAL_MODEL_ID = "local-hash-tfidf-svd"
+
+
+class LocalEmbedder:
+    def __init__(self, dim=LOCAL_EMBED_DIM, n_features=2 ** 18):
+        self.dim = dim
+        # stateless, so nothing vocabulary-sized is stored; bigrams catch "order id", "forgot password"
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=(1, 2), alternate_sign=False,
+            norm=None, stop_words="english", lowercase=True,
+        )
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.svd = None
+        self.fit_id = None
+
+    def fit(self, texts):
+        """Fits IDF weights and the SVD basis on the corpus (e.g. every KB chunk)."""
+        texts = [t or "" for t in texts]
+        if not texts:
+            raise ValueError("Cannot fit the local embedder on an empty corpus.")
+        x = self.tfidf.fit_transform(self.vectorizer.transform(texts))
+        # a small KB has fewer latent axes than requested; the rest is zero-padded in embed()
+        k = max(1, min(self.dim, x.shape[0] - 1, x.shape[1] - 1))
+        self.svd = TruncatedSVD(n_components=k, algorithm="randomized", random_state=0)
+        self.svd.fit(x)
+        digest = hashlib.sha1()
+        for t in texts:
+            digest.update(t.encode("utf-8"))
+        self.fit_id = digest.hexdigest()[:12]
+        return self
+
+    def embed(self, texts):
+        """(N, dim) float32, rows L2-normalized. Whole batches go through one sparse matmul."""
+        if self.svd is None:
+            raise RuntimeError("Local embedder is not fitted; run embed_chunks.py with EMBED_BACKEND=local.")
+        x = self.tfidf.transform(self.vectorizer.transform([t or "" for t in texts]))
+        z = self.svd.transform(x).astype("float32")
+        if z.shape[1] < self.dim:
+            z = np.hstack([z, np.zeros((len(z), self.dim - z.shape[1]), dtype="float32")])
+        norms = np.linalg.norm(z, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return z / norms
+
+    def save(self, path=LOCAL_MODEL_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with _replacing(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path=LOCAL_MODEL_PATH):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+_model = None
+_model_key = None
+
+def _file_key(path):
+    # every save is an os.replace, so (inode, mtime) changes on each refit
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+def load_local_embedder(path=LOCAL_MODEL_PATH):
+    """The fitted model, reloaded when another process refits it. Unfitted if no model file exists."""
+    global _model, _model_key
+    key = _file_key(path)
+    if _model is None or key != _model_key:
+        _model = LocalEmbedder.load(path) if key is not None else LocalEmbedder()
+        _model_key = key
+    return _model
+
+def fit_local_embedder(texts, path=LOCAL_MODEL_PATH):
+    global _model, _model_key
+    model = LocalEmbedder().fit(texts)
+    model.save(path)
+    _model, _model_key = model, _file_key(path)
+    print(f"[INFO] Fitted local embedder on {len(texts)} texts (dim={model.dim}, fit_id={model.fit_id}).")
+    return model
+
+
+def compare_backends(chunk_texts, queries, top_k=3):
+    """
+    Side-by-side latency and recall@k of the local backend against the OpenAI API backend
+    (API neighbours are the reference). Falls back to local-only numbers without an API key.
+    """
+    from model_engine import get_embedding, load_embedding_model
+
+    local = LocalEmbedder().fit(chunk_texts)
+    rows = {}
+
+    t0 = time.perf_counter()
+    doc_local = local.embed(chunk_texts)
+    rows["local_index_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    q_local = np.vstack([local.embed([q]) for q in queries])
+    rows["local_query_ms"] = (time.perf_counter() - t0) / len(queries) * 1000
+    t0 = time.perf_counter()
+    local.embed(queries)
+    rows["local_batch_query_ms"] = (time.perf_counter() - t0) / len(queries) * 1000
+    top_local = np.argsort(-(q_local @ doc_local.T), axis=1)[:, :top_k]
+
+    if not os.getenv("OPENAI_API_KEY"):
+        print("[WARN] OPENAI_API_KEY not set; reporting the local backend only.")
+        return rows
+    client = load_embedding_model()
+    t0 = time.perf_counter()
+    doc_api = get_embedding(client, chunk_texts, project_output=False)
+    rows["api_index_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    q_api = [get_embedding(client, q) for q in queries]
+    rows["api_query_ms"] = (time.perf_counter() - t0) / len(queries) * 1000
+    if doc_api is None or any(q is None for q in q_api):
+        print("[WARN] API embeddings failed; reporting the local backend only.")
+        return rows
+    doc_api = doc_api / np.linalg.norm(doc_api, axis=1, keepdims=True)
+    q_api = np.vstack(q_api)
+    top_api = np.argsort(-(q_api @ doc_api.T), axis=1)[:, :top_k]
+    rows[f"local_recall@{top_k}_vs_api"] = float(np.mean(
+        [len(set(a) & set(b)) / len(a) for a, b in zip(top_local, top_api)]
+    ))
+    return rows
+
+
+if __name__ == "__main__":
+    import csv
+    from embed_chunks import read_chunks, CHUNKS_CSV
+
+    chunks = read_chunks(CHUNKS_CSV)
+    with open(os.path.join(ROOT, "data", "tickets.csv"), newline="", encoding="utf-8") as f:
+        queries = [r["text"] for r in csv.DictReader(f, delimiter="\t")]
+    texts = [c["chunk_text"] for c in chunks]
+    print(f"{len(texts)} chunks, {len(queries)} queries")
+
+    model = LocalEmbedder().fit(texts)
+    sims = model.embed(queries) @ model.embed(texts).T
+    for q, row in zip(queries, sims):
+        best = int(np.argmax(row))
+        print(f"{q[:50]:50s} -> {chunks[best]['title']} ({row[best]:.3f})")
+
+    for k, v in compare_backends(texts, queries, top_k=min(3, len(texts))).items():
+        print(f"{k:28s} {v:.4f}")
@@ -1,12 +1,38 @@
 import os
-import openai
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 import numpy as np
 
 load_dotenv()
 
+from vector_store import INDEX_DIR, _replacing
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+# lives with the index it was fitted for
+PROJECTION_PATH = os.path.join(INDEX_DIR, "projection.npz")
+
+# "openai" (API) or "local" (hashing + TF-IDF + SVD fitted on the KB, see local_embedder.py)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "openai")
+EMBED_MODEL = "text-embedding-3-small"
+NATIVE_DIMS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072}
+# Optional reduced dimension for queries and chunks alike (e.g. 256 or 512).
+EMBED_DIM = int(os.getenv("EMBED_DIM", "0")) or None
+# How EMBED_DIM is reached: "api" (OpenAI `dimensions` parameter) or "pca" (projection fitted on the corpus)
+EMBED_PROJECTION = os.getenv("EMBED_PROJECTION", "api")
+# Micro-batching of single-query embeddings: concurrent callers arriving within
+# EMBED_BATCH_WAIT_MS share one API request of up to EMBED_BATCH_MAX texts (0 ms disables).
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "64"))
+EMBED_BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", "4"))
+
 # Global client
 _client = None
+_projection = None       # (mean, components, fit_id)
+_projection_key = None   # (inode, mtime) of the file it was loaded from
 
 def load_embedding_model(model_name: str = "text-embedding-3-small"):
     """
@@ -14,7 +40,11 @@ def load_embedding_model(model_name: str = "text-embedding-3-small"):
     The 'model_name' argument is kept for compatibility but defaults to OpenAI's model.
     """
     global _client
+    if EMBED_BACKEND == "local":
+        from local_embedder import load_local_embedder
+        return load_local_embedder()
     if _client is None:
+        import openai  # heavy; only the openai backend needs it
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             print("[WARN] OPENAI_API_KEY not found. Embeddings will fail.")
@@ -22,34 +52,141 @@ def load_embedding_model(model_name: str = "text-embedding-3-small"):
         print(f"Initialized OpenAI Client for embeddings ({model_name})")
     return _client
 
-def get_embedding(model, text):
+def embedding_config():
+    """Embedding settings recorded in the index header; queries and chunks must agree on these."""
+    if EMBED_BACKEND == "local":
+        from local_embedder import load_local_embedder, LOCAL_MODEL_ID
+        local = load_local_embedder()
+        return {
+            "backend": "local",
+            # a refit changes the vector space, so the fit id is part of the model identity
+            "model": f"{LOCAL_MODEL_ID}:{local.fit_id}",
+            "dim": local.dim,
+            "projection": "none"
+        }
+    projection = EMBED_PROJECTION if EMBED_DIM else "none"
+    if projection == "pca":
+        # a refit changes the reduced space, so the fit id is part of the setting
+        proj = load_projection()
+        if proj is not None:
+            projection = f"pca:{proj[2]}"
+    return {
+        "backend": "openai",
+        "model": EMBED_MODEL,
+        "dim": EMBED_DIM,
+        "projection": projection
+    }
+
+def output_dim():
+    """Dimension of the vectors get_embedding returns under the current settings."""
+    if EMBED_BACKEND == "local":
+        from local_embedder import LOCAL_EMBED_DIM
+        return LOCAL_EMBED_DIM
+    return EMBED_DIM or NATIVE_DIMS.get(EMBED_MODEL, 1536)
+
+# ---------------- PCA projection ----------------
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+def load_projection(path=PROJECTION_PATH):
+    """(mean, components, fit_id) of the fitted projection, reloaded when another process refits it; None if unfitted."""
+    global _projection, _projection_key
+    key = _stat_key(path)
+    if key != _projection_key:
+        proj = None
+        if key is not None:
+            with np.load(path) as data:
+                mean, components = data["mean"], data["components"]
+                fit_id = str(data["fit_id"]) if "fit_id" in data.files else _fit_id(mean, components)
+            proj = (mean, components, fit_id)
+        _projection, _projection_key = proj, key
+    return _projection
+
+def _fit_id(mean, components):
+    digest = hashlib.sha1(mean.tobytes())
+    digest.update(components.tobytes())
+    return digest.hexdigest()[:12]
+
+def fit_projection(vectors, dim, max_samples=20000):
+    """
+    Fits a PCA projection on full-size corpus vectors. Returns (mean, components, fit_id);
+    queries keep using the current one until save_projection() installs it.
+    """
+    x = np.asarray(vectors, dtype="float32")
+    if len(x) > max_samples:
+        x = x[np.random.default_rng(0).choice(len(x), size=max_samples, replace=False)]
+    mean = x.mean(axis=0)
+    # principal axes from the SVD of the centered corpus
+    _, _, vt = np.linalg.svd(x - mean, full_matrices=False)
+    components = vt[:dim].astype("float32")
+    if len(components) < dim:
+        # tiny corpus: fewer axes than requested; pad so the output size is always `dim`
+        components = np.vstack([components, np.zeros((dim - len(components), x.shape[1]), dtype="float32")])
+    return mean, components, _fit_id(mean, components)
+
+def save_projection(proj, path=PROJECTION_PATH):
+    """
+    Installs a fitted projection. Call under index_write_lock, together with the matrix it
+    produced and before write_header, so the header records its fit id.
+    """
+    global _projection, _projection_key
+    mean, components, fit_id = proj
+    with _replacing(path) as f:
+        np.savez(f, mean=mean, components=components, fit_id=np.array(fit_id))
+    _projection, _projection_key = proj, _stat_key(path)
+
+def project(vectors):
+    """Applies the fitted PCA projection (1D or 2D input). Returns input unchanged if none is fitted."""
+    proj = load_projection()
+    if proj is None or vectors is None:
+        return vectors
+    mean, components, _ = proj
+    return ((vectors - mean) @ components.T).astype("float32")
+
+def get_embedding(model, text, project_output=True):
     """
     Fetches embeddings from OpenAI API.
     'model' here is the OpenAI client instance.
+    With EMBED_DIM set, vectors are reduced the same way for every caller;
+    project_output=False returns full-size vectors in "pca" mode (used to fit the projection).
     """
     if not text:
         return None
     
     # Ensure client is ready
     client = model or load_embedding_model()
-    model_id = "text-embedding-3-small"
+    if EMBED_BACKEND == "local":
+        return _local_embedding(client, text)
+    model_id = EMBED_MODEL
+    extra = {}
+    if EMBED_DIM and EMBED_PROJECTION == "api":
+        extra["dimensions"] = EMBED_DIM
+    use_pca = EMBED_DIM and EMBED_PROJECTION == "pca" and project_output
 
     try:
         # Handle string input
         if isinstance(text, str):
             text = text.replace("\n", " ")
-            response = client.embeddings.create(input=[text], model=model_id)
-            return np.array(response.data[0].embedding, dtype="float32")
+            if EMBED_BATCH_WAIT_MS > 0 and project_output:
+                return get_batcher().submit(client, text)
+            response = client.embeddings.create(input=[text], model=model_id, **extra)
+            vec = np.array(response.data[0].embedding, dtype="float32")
+            return project(vec) if use_pca else vec
         
         # Handle list input
         if isinstance(text, list):
             # OpenAI recommends batching, but for simplicity we send the list
             # Ensure no newlines
             clean_texts = [t.replace("\n", " ") for t in text]
-            response = client.embeddings.create(input=clean_texts, model=model_id)
+            response = client.embeddings.create(input=clean_texts, model=model_id, **extra)
             # Map results back to order
             embeddings = [item.embedding for item in response.data]
-            return np.array(embeddings, dtype="float32")
+            arr = np.array(embeddings, dtype="float32")
+            return project(arr) if use_pca else arr
             
     except Exception as e:
         print(f"[ERROR] Embedding generation failed: {e}")
@@ -57,9 +194,108 @@ def get_embedding(model, text):
 
     raise ValueError("Input must be a string or list of strings.")
 
+def _local_embedding(model, text):
+    """get_embedding for the local backend: same str -> (D,) / list -> (N, D) contract, no batcher needed."""
+    try:
+        if isinstance(text, str):
+            return model.embed([text])[0]
+        if isinstance(text, list):
+            return model.embed(text)
+    except Exception as e:
+        print(f"[ERROR] Local embedding failed: {e}")
+        return None
+    raise ValueError("Input must be a string or list of strings.")
+
 # Alias for compatibility
 get_embeddings = get_embedding
 
+# ---------------- Dynamic micro-batching ----------------
+class EmbeddingBatcher:
+    """
+    Collects single-text embedding requests from concurrent callers and sends them as
+    one list request. A batch closes when it holds max_batch texts or max_wait_ms after
+    its first text arrived, so an idle caller waits at most max_wait_ms extra.
+    Batches are sent from a small pool, so collection continues while a request is in flight.
+    """
+
+    def __init__(self, max_batch=EMBED_BATCH_MAX, max_wait_ms=EMBED_BATCH_WAIT_MS, concurrency=EMBED_BATCH_CONCURRENCY):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed-batch")
+        self._lock = threading.Lock()
+        self._thread = None
+        self.requests = 0
+        self.texts_sent = 0
+        self.batches = 0
+
+    def submit(self, client, text):
+        """Blocks until the text's batch returns; yields the vector (or None on failure)."""
+        fut = Future()
+        with self._lock:
+            self.requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+                self._thread.start()
+        self._queue.put((client, text, fut))
+        return fut.result()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        by_client = {}
+        for client, text, fut in batch:
+            by_client.setdefault(id(client), (client, []))[1].append((text, fut))
+        for client, items in by_client.values():
+            # identical texts in one window are embedded once
+            unique = list(dict.fromkeys(text for text, _ in items))
+            try:
+                arr = get_embedding(client, unique)
+                if arr is not None and len(arr) != len(unique):
+                    print(f"[ERROR] Batched embedding returned {len(arr)} vectors for {len(unique)} texts.")
+                    arr = None
+            except Exception as e:
+                print(f"[ERROR] Batched embedding failed: {e}")
+                arr = None
+            with self._lock:
+                self.batches += 1
+                self.texts_sent += len(unique)
+            pos = {text: i for i, text in enumerate(unique)}
+            for text, fut in items:
+                fut.set_result(None if arr is None else arr[pos[text]])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "api_calls": self.batches,
+                "saved": self.requests - self.batches,
+                "avg_batch": (self.texts_sent / self.batches) if self.batches else 0.0,
+            }
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher()
+    return _batcher
+
 if __name__ == "__main__":
     client = load_embedding_model()
     s = "My payment failed and I need a refund"
@@ -69,3 +305,10 @@ if __name__ == "__main__":
     else:
         print("Failed to get embedding")
 
+    # burst of concurrent single-text queries -> a handful of batched requests
+    queries = [f"{s} (variant {i})" for i in range(32)]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as ex:
+        list(ex.map(lambda q: get_embedding(client, q), queries))
+    print(f"{len(queries)} concurrent queries in {time.perf_counter() - t0:.2f}s:", get_batcher().stats())
+
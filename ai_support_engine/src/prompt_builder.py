@@ -0,0 +1,249 @@
+# src/prompt_builder.py
+"""
+Token-budgeted RAG prompt assembly.
+
+The instructions, JSON schema and example never change, so they are sent first as a
+byte-identical system message: the provider can then serve that prefix from its
+prompt cache. Everything request-specific (retrieved chunks, history, the ticket)
+follows in the user message, filled by relevance until the token budget is spent.
+"""
+import os
+import re
+import math
+import json
+import time
+import random
+import threading
+from collections import Counter
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+LOG_PATH = os.path.join(os.getenv("LOG_DIR", os.path.join(ROOT, "logs")), "prompt_tokens.jsonl")
+
+PROMPT_MODEL = "gpt-4o-mini"
+# Total input tokens per generation request (static prefix included)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+# Most of the dynamic budget goes to evidence; history gets at most this share
+HISTORY_BUDGET_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.35"))
+# Upper bound on history turns even when the budget has room (most relevant kept)
+MAX_HISTORY_TURNS = int(os.getenv("PROMPT_MAX_HISTORY_TURNS", "4"))
+# USD per 1M input tokens, for the savings report only
+PROMPT_COST_PER_MTOK = float(os.getenv("PROMPT_COST_PER_MTOK", "0.15"))
+# Share of requests that also build the legacy prompt for the savings report (0 turns it off)
+PROMPT_REPORT_SAMPLE = float(os.getenv("PROMPT_REPORT_SAMPLE", "0.01"))
+
+STATIC_PREFIX = (
+    "You are an expert customer-support assistant. Use the 'Retrieved Knowledge Chunks' "
+    "and 'Conversation History' to answer. \n"
+    "CRITICAL: If the user asks 'what is my problem?' or refers to previous context, "
+    "you MUST infer the topic from the 'Conversation History'.\n"
+    "REFUSAL POLICY: If the user asks a question (e.g., baking, weather, math) that is NOT covered by the "
+    "'Retrieved Knowledge Chunks' or 'Conversation History', you MUST refuse to answer. "
+    "Do NOT use your internal knowledge base to answer general questions. "
+    "Reply with: 'I can only assist with Owntrail support questions.'\n\n"
+    "Task:\n"
+    "1) Provide a concise customer-facing reply (1-2 sentences) as 'answer'.\n"
+    "2) Provide 1-4 recommended next steps the agent should take as 'steps'.\n"
+    "3) Provide 'citations' as a list of chunk ids used (e.g. ['doc_123_0', 'a1_0']). "
+    "Use the EXACT string ID found in brackets []. Do NOT use the list numbers (1, 2, 3).\n"
+    "4) Provide a 'confidence' score between 0.0 and 1.0 (based only on retrieved chunks).\n\n"
+    "Return EXACTLY a single JSON object with keys: "
+    '"answer" (string), "steps" (array of strings), '
+    '"citations" (array of chunk_ids), "confidence" (float 0.0-1.0).\n\n'
+    "Example output (must match structure):\n"
+    '{"answer":"Short reply...","steps":["step1","step2"],"citations":["a3_0"],"confidence":0.85}\n\n'
+    "Return only the JSON object, nothing else."
+)
+
+# ---------------- Token counting ----------------
+@lru_cache(maxsize=1)
+def _encoder():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(PROMPT_MODEL)
+    except Exception:
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+def count_tokens(text: str) -> int:
+    """Exact count with tiktoken; otherwise ~4 characters per token."""
+    if not text:
+        return 0
+    enc = _encoder()
+    if enc is not None:
+        return len(enc.encode(text))
+    return math.ceil(len(text) / 4)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    enc = _encoder()
+    if enc is not None:
+        ids = enc.encode(text)
+        return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens]) + "..."
+    return text if len(text) <= max_tokens * 4 else text[:max_tokens * 4] + "..."
+
+# ---------------- History ranking ----------------
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_FILLER = {"the", "a", "an", "and", "or", "to", "of", "in", "on", "for", "is", "it", "i", "my",
+           "me", "you", "your", "we", "be", "was", "this", "that", "with", "at", "as", "are", "do"}
+
+def _bag(text):
+    return Counter(w for w in _WORD_RE.findall((text or "").lower()) if w not in _FILLER)
+
+def _cosine(a, b):
+    if not a or not b:
+        return 0.0
+    dot = sum(v * b.get(k, 0) for k, v in a.items())
+    return dot / (math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values())))
+
+def rank_history(query: str, history: list):
+    """
+    History indices, most useful first: lexical similarity to the query plus a small
+    recency bonus. The latest turn always leads, so follow-ups like "what did you say?"
+    keep their antecedent.
+    """
+    if not history:
+        return []
+    q = _bag(query)
+    n = len(history)
+    scored = [(_cosine(q, _bag(m.get("content"))) + 0.1 * (i + 1) / n, i) for i, m in enumerate(history)]
+    order = [i for _, i in sorted(scored, reverse=True)]
+    order.remove(n - 1)
+    return [n - 1] + order
+
+# ---------------- Assembly ----------------
+def _chunk_line(c):
+    cid = c.get("best_chunk_id") or c.get("chunk_id") or ""
+    title = c.get("title", "")
+    text = (c.get("best_chunk_text") or c.get("chunk_text") or "").strip().replace("\n", " ")
+    return cid, title, text
+
+def _history_line(m):
+    return f"{m['role'].upper()}: {m['content']}"
+
+def build_prompt(ticket_text: str, chunks: list, history: list = None, max_chunks: int = 3,
+                 budget: int = None):
+    """
+    Returns (system, user, report).
+    system is always STATIC_PREFIX; user holds chunks (in retrieval order), the selected
+    history turns (chronological) and the ticket, sized to fit `budget` tokens in total.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    history = [m for m in (history or []) if m.get("content")]
+    # the ticket is already the query; don't repeat it as a history turn
+    if history and history[-1].get("content") == ticket_text:
+        history = history[:-1]
+
+    query_block = f"User ticket: \"{ticket_text}\""
+    fixed = count_tokens(STATIC_PREFIX) + count_tokens(query_block) + 16  # section headers
+    remaining = max(0, budget - fixed)
+    history_cap = int(remaining * HISTORY_BUDGET_SHARE) if history else 0
+
+    # evidence first, best-scored first, within its share
+    chunk_lines, chunk_budget = [], remaining - history_cap
+    for c in chunks[:max_chunks]:
+        cid, title, text = _chunk_line(c)
+        head = f"{len(chunk_lines) + 1}. [{cid}] ({title}) "
+        cost = count_tokens(head + text)
+        if cost > chunk_budget:
+            text = truncate_tokens(text, chunk_budget - count_tokens(head) - 1)
+            if not text:
+                break
+            cost = count_tokens(head + text)
+        chunk_lines.append(head + text)
+        chunk_budget -= cost
+    # history gets whatever evidence left over, too
+    history_budget = history_cap + max(0, chunk_budget)
+
+    picked = []
+    for i in rank_history(ticket_text, history):
+        if len(picked) >= MAX_HISTORY_TURNS:
+            break
+        cost = count_tokens(_history_line(history[i])) + 1
+        if cost > history_budget:
+            continue
+        picked.append(i)
+        history_budget -= cost
+    picked.sort()
+
+    parts = ["Retrieved Knowledge Chunks:\n" + ("\n".join(chunk_lines) or "No chunks retrieved.")]
+    if picked:
+        parts.append("Conversation History:\n" + "\n".join(_history_line(history[i]) for i in picked))
+    parts.append(query_block)
+    user = "\n\n".join(parts)
+
+    report = {
+        "budget": budget,
+        "static_tokens": count_tokens(STATIC_PREFIX),
+        "dynamic_tokens": count_tokens(user),
+        "chunks_used": len(chunk_lines),
+        "history_used": len(picked),
+        "history_dropped": len(history) - len(picked),
+        "exact_counts": _encoder() is not None,
+    }
+    report["prompt_tokens"] = report["static_tokens"] + report["dynamic_tokens"]
+    return STATIC_PREFIX, user, report
+
+_totals = {"requests": 0, "prompt_tokens": 0, "legacy_tokens": 0, "tokens_saved": 0, "cost_saved_usd": 0.0}
+_totals_lock = threading.Lock()
+
+def report_sampled() -> bool:
+    """Whether this request goes into the savings report (PROMPT_REPORT_SAMPLE of them)."""
+    return PROMPT_REPORT_SAMPLE > 0 and random.random() < PROMPT_REPORT_SAMPLE
+
+def prompt_stats():
+    """Running totals across the sampled requests in this process."""
+    with _totals_lock:
+        out = dict(_totals)
+    out["avg_tokens_saved"] = out["tokens_saved"] / out["requests"] if out["requests"] else 0.0
+    return out
+
+def savings_report(report: dict, legacy_prompt: str, logfile=LOG_PATH):
+    """
+    Adds the legacy prompt's size and the tokens/cost saved to `report`, and appends it
+    to logs/prompt_tokens.jsonl. The static prefix is reported separately since a cache
+    hit bills it at a discount on top of these savings.
+    """
+    legacy = count_tokens(legacy_prompt)
+    report["legacy_tokens"] = legacy
+    report["tokens_saved"] = legacy - report["prompt_tokens"]
+    report["cost_saved_usd"] = report["tokens_saved"] * PROMPT_COST_PER_MTOK / 1e6
+    with _totals_lock:
+        _totals["requests"] += 1
+        for k in ("prompt_tokens", "legacy_tokens", "tokens_saved", "cost_saved_usd"):
+            _totals[k] += report[k]
+    try:
+        os.makedirs(os.path.dirname(logfile), exist_ok=True)
+        with open(logfile, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(report, ts=time.time())) + "\n")
+    except OSError:
+        pass
+    return report
+
+
+if __name__ == "__main__":
+    chunks = [
+        {"best_chunk_id": f"a{i}_0", "title": f"Article {i}", "best_chunk_text": "To request a refund open Billing > Orders and select the charge. " * 12}
+        for i in range(5)
+    ]
+    history = [
+        {"role": "customer", "content": "Hi, I was charged twice for my subscription this month."},
+        {"role": "agent", "content": "Sorry about that! Can you share the order id?"},
+        {"role": "customer", "content": "Also, unrelated, how do I change my profile picture?"},
+        {"role": "agent", "content": "Go to Settings > Profile and upload a new image."},
+        {"role": "customer", "content": "Order id is 88812. When do I get the refund for the double charge?"},
+    ] * 3
+    query = "When will the duplicate charge be refunded?"
+    for budget in (600, 1000, 1800):
+        system, user, report = build_prompt(query, chunks, history, max_chunks=3, budget=budget)
+        print(f"budget={budget}: {report}")
+    print("\n" + user)
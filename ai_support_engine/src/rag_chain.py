@@ -2,41 +2,44 @@
 import os
 import json
 import time
+import threading
 from dotenv import load_dotenv
 
-# OpenAI client
-try:
-    # modern SDK import style
-    from openai import OpenAI
-except Exception:
-    # fallback if user has older openai package
-    import openai as _openai
-    class OpenAI:
-        def __init__(self, api_key=None):
-            self._client = _openai
-            if api_key:
-                self._client.api_key = api_key
-        def responses(self, *args, **kwargs):
-            return self._client  # not used; this branch is fallback only
-
 # load local env
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("Set OPENAI_API_KEY in .env (project root)")
 
-# initialize client (uses env key)
-client = OpenAI(api_key=OPENAI_API_KEY)
+# OpenAI client, created on first use: importing this module needs neither the SDK nor a key
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """The shared OpenAI client (OPENAI_BASE_URL points it at a stub server for fault tests)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Set OPENAI_API_KEY in .env (project root)")
+                from openai import OpenAI
+                client = OpenAI(api_key=api_key)
+                # retries and timeouts are owned by llm_guard, not the SDK
+                _client = client.with_options(max_retries=0)
+    return _client
 
 # import your existing retriever function
 # make sure src is on PYTHONPATH (running from project root or use relative import)
 from recommender import recommend_ticket_with_chunks
+from single_flight import flight, fingerprint, normalize_text
+from prompt_builder import build_prompt, savings_report, report_sampled
+from llm_guard import chat_guard, LLMUnavailable
 
 # --- Helpers: build prompt for RAG ---
 def build_openai_prompt(ticket_text: str, chunks: list, history: list = [], max_chunks: int = 3) -> str:
     """
     Build a deterministic instruction prompt that tells the model to return EXACT JSON.
     We include explicit format, a short example, and the retrieved chunks.
+    Superseded by prompt_builder.build_prompt; kept as the baseline for the tokens-saved report.
     """
     selected = chunks[:max_chunks]
     chunk_lines = []
@@ -114,48 +117,33 @@ def check_context_relevance(query: str, history: list) -> bool:
     except:
         return True # Fail open if check fails
 
-def call_openai(prompt: str, model: str = "gpt-4.1-mini", max_tokens: int = 512, **kwargs):
+def call_openai(prompt: str, model: str = "gpt-4.1-mini", max_tokens: int = 512, system: str = None, **kwargs):
     """
     Robust wrapper for OpenAI Responses API.
+    system: optional static instructions sent first, so the provider can cache that prefix.
+    Concurrent calls with the same prompt share one completion.
+    Raises LLMUnavailable on timeout, exhausted retries or an open circuit.
     """
-    try:
-        # Note: The user's environment seems to use a custom or older OpenAI client wrapper
-        # based on the import block at the top. We'll try to use it as intended.
-        # If it's the standard library, client.chat.completions.create is typical.
-        # But the code uses client.responses.create in previous versions.
-        # Let's stick to what was likely there or standard chat completion.
-        
-        # Assuming standard OpenAI v1.x+
-        if hasattr(client, "chat"):
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini", # Fallback to a known model if 4.1-mini isn't real
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=0.0
-            )
-            return resp.choices[0].message.content
-        
-        # Fallback for the custom wrapper seen in file
-        # The wrapper defined in lines 14-20 doesn't seem to have a create method implemented?
-        # Wait, lines 8-21 show a fallback class that does nothing.
-        # If the user has the real library, it should work.
-        # Let's assume standard ChatCompletion for modern OpenAI.
-        
-        # Actually, looking at previous context, it used client.responses.create?
-        # Let's implement a standard call.
-        
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini", 
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0
+    key = fingerprint(system, prompt, model, max_tokens)
+    return flight("generate").do(key, _call_openai, prompt, model, max_tokens, system, **kwargs)
+
+def _call_openai(prompt: str, model: str, max_tokens: int, system: str = None, **kwargs):
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        messages.insert(0, {"role": "system", "content": system})
+
+    def attempt(timeout):
+        resp = get_client().chat.completions.create(
+            model="gpt-4o-mini", # Fallback to a known model if 4.1-mini isn't real
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.0,
+            timeout=timeout
         )
         return resp.choices[0].message.content
 
-    except Exception as e:
-        # If the custom wrapper is active, it might fail.
-        # Let's try to be robust.
-        print(f"DEBUG: OpenAI Call Failed: {e}")
-        return '{"answer": "I am having trouble connecting to the AI model right now.", "confidence": 0.0}'
+    # deadline, retries, hedging and circuit breaker; raises LLMUnavailable when it gives up
+    return chat_guard.call(attempt)
 
 def parse_model_json(raw: str):
     raw = raw.strip()
@@ -172,10 +160,36 @@ def parse_model_json(raw: str):
             pass
     return {"answer": raw, "steps": [], "citations": [], "confidence": 0.0, "raw": raw}
 
-def rag_answer_openai(ticket_text: str, history: list = [], top_k_chunks=5, max_prompt_chunks=3, threshold=0.25):
+def retrieval_only_answer(recs: list, max_chunks: int, reason: str):
+    """Evidence without generation: the top retrieved chunks as citations, no drafted reply."""
+    citations = [r.get("best_chunk_id") for r in recs[:max_chunks] if r.get("best_chunk_id")]
+    return {
+        "answer": None,
+        "steps": [],
+        "citations": citations,
+        "confidence": float(recs[0].get("score", 0.0)) if recs else 0.0,
+        "note": f"Retrieval-only: AI reply unavailable ({reason}). See the related articles.",
+    }
+
+def rag_answer_openai(ticket_text: str, history: list = [], top_k_chunks=5, max_prompt_chunks=3, threshold=0.25, context=None):
+    """
+    Retrieve -> prompt -> generate. Concurrent requests for the same query, history and
+    parameters (a double-clicked "suggest", several agents on one ticket) share one run.
+    context: optional retrieval_context.TicketContext for the ticket being answered.
+    """
+    key = fingerprint(
+        normalize_text(ticket_text),
+        [(m.get("role"), normalize_text(m.get("content"))) for m in history or []],
+        top_k_chunks, max_prompt_chunks, threshold,
+        context.ticket_id if context is not None else None,
+    )
+    return flight("rag").do(key, _rag_answer_openai, ticket_text, history, top_k_chunks, max_prompt_chunks, threshold, context)
+
+def _rag_answer_openai(ticket_text, history, top_k_chunks, max_prompt_chunks, threshold, context=None):
     # 1) Retrieve
-    # For retrieval, we might want to combine history + current query, but for now just use current query
-    recs = recommend_ticket_with_chunks(ticket_text, top_k=top_k_chunks, chunk_hits_k=12)
+    # With a ticket context the query is blended with the conversation so far and re-ranked
+    # from the ticket's warm candidates; otherwise just the current query
+    recs = recommend_ticket_with_chunks(ticket_text, top_k=top_k_chunks, chunk_hits_k=12, context=context)
     if not recs:
         return {"answer": None, "steps": [], "citations": [], "confidence": 0.0, "note": "No chunks retrieved"}
 
@@ -192,12 +206,21 @@ def rag_answer_openai(ticket_text: str, history: list = [], top_k_chunks=5, max_
         if not is_relevant:
             return {"answer": "I'm sorry, I can only assist with questions related to Owntrail support or our previous conversation.", "steps": [], "citations": [], "confidence": 0.0, "note": "Irrelevant follow-up."}
 
-    # 2) Build prompt
-    prompt = build_openai_prompt(ticket_text, recs, history=history, max_chunks=max_prompt_chunks)
+    # upstream degraded: skip prompt building and answer with the evidence alone
+    if not chat_guard.available():
+        return retrieval_only_answer(recs, max_prompt_chunks, "LLM circuit open")
+
+    # 2) Build prompt: static prefix first, then chunks/history fitted to the token budget
+    system, prompt, report = build_prompt(ticket_text, recs, history=history, max_chunks=max_prompt_chunks)
+    if report_sampled():
+        # the legacy prompt is built and tokenized only for the report, so only for a sample
+        savings_report(report, build_openai_prompt(ticket_text, recs, history=history, max_chunks=max_prompt_chunks))
 
     # 3) Call OpenAI
     try:
-        raw = call_openai(prompt, model="gpt-4.1-mini", max_tokens=512)
+        raw = call_openai(prompt, model="gpt-4.1-mini", max_tokens=512, system=system)
+    except LLMUnavailable as e:
+        return retrieval_only_answer(recs, max_prompt_chunks, str(e))
     except Exception as e:
         return {"answer": None, "steps": [], "citations": [], "confidence": 0.0, "error": str(e)}
 
@@ -211,6 +234,7 @@ def rag_answer_openai(ticket_text: str, history: list = [], top_k_chunks=5, max_
 
     # include raw for debugging
     parsed["raw_model_output"] = raw
+    parsed["prompt_tokens"] = report
     return parsed
 
 def summarize_ticket(ticket_text: str, history: list) -> str:
@@ -4,9 +4,16 @@ import time
 import json
 from collections import defaultdict
 from model_engine import load_embedding_model, get_embedding
-from vector_store import SimpleVectorStore
+from vector_store import get_store
+from sharded_store import get_sharded_store
+from single_flight import flight, fingerprint, normalize_text
+from chunk_dedup import diversify
 
-LOG_PATH = os.path.join(os.path.dirname(__file__), "..", "logs", "recs.jsonl")
+# Drop hits that are near-duplicates of a better hit (boilerplate shared across articles)
+RETRIEVAL_DIVERSIFY = os.getenv("RETRIEVAL_DIVERSIFY", "1") == "1"
+
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(os.path.dirname(__file__), "..", "logs"))
+LOG_PATH = os.path.join(LOG_DIR, "recs.jsonl")
 os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
 
 def shorten(text, n=200):
@@ -61,6 +68,18 @@ def title_boost(results, query, boost=0.05):
                     break
     return sorted(results, key=lambda x: x["score"], reverse=True)
 
+def embed_query(ticket_text):
+    """Query embedding; concurrent requests for the same text share one API call."""
+    text = normalize_text(ticket_text)
+    return flight("embed").do(fingerprint(text), get_embedding, load_embedding_model(), text)
+
+def search_chunks(q_vec, top_k):
+    """Chunk hits from the sharded index when VECTOR_SHARDS/VECTOR_SHARD_ADDRS is set, else the local store."""
+    sharded = get_sharded_store()
+    if sharded is not None:
+        return sharded.search(q_vec, top_k=top_k)
+    return get_store().search(q_vec, top_k=top_k)
+
 # ---------------- Logging ----------------
 def log_query(query, preproc_query, agg_method, params, results, logfile=LOG_PATH):
     record = {
@@ -80,10 +99,8 @@ def recommend_ticket(ticket_text, top_k=3, chunk_hits_k=9, agg="max"):
     Basic recommendation (no chunk snippets) kept for compatibility.
     agg: "max" | "mean" | "hybrid"
     """
-    model = load_embedding_model()
-    q_vec = get_embedding(model, ticket_text)
-    vs = SimpleVectorStore()
-    hits = vs.search(q_vec, top_k=chunk_hits_k)
+    q_vec = embed_query(ticket_text)
+    hits = search_chunks(q_vec, chunk_hits_k)
 
     if agg == "mean":
         scores = aggregate_mean(hits)
@@ -94,9 +111,10 @@ def recommend_ticket(ticket_text, top_k=3, chunk_hits_k=9, agg="max"):
 
     # sort and return top_k
     sorted_items = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+    titles = {h["meta"].get("article_id"): h["meta"].get("title", "") for h in reversed(hits)}
     results = []
     for aid, sc in sorted_items:
-        title = next((m["title"] for m in vs.meta if m["article_id"] == aid), "")
+        title = titles.get(aid, "")
         results.append({"article_id": aid, "title": title, "score": float(sc)})
     return results
 
@@ -108,22 +126,36 @@ def recommend_ticket_with_chunks(
     keyword_boost=0.03,
     threshold=0.30,
     title_boost_value=0.03,
-    shorten_snippet_len=200
+    shorten_snippet_len=200,
+    context=None
 ):
     """
     Full recommendation returning best chunk snippet per article.
     - keyword_boost: small additive boost when query and chunk share keywords
     - threshold: minimum score to display an article (fallback to top-1 if none)
     - agg: aggregation method for chunk -> article ("max","mean","hybrid")
+    - context: a retrieval_context.TicketContext; hits then come from the ticket's
+      warm candidate set instead of a fresh embed + full search
+    Identical concurrent calls (same normalized text and parameters) share one retrieval.
     """
-    model = load_embedding_model()
-    q_vec = get_embedding(model, ticket_text)
-    vs = SimpleVectorStore()
+    params = (top_k, chunk_hits_k, agg, keyword_boost, threshold, title_boost_value, shorten_snippet_len)
+    if context is not None:
+        return _recommend_ticket_with_chunks(ticket_text, *params, context=context)
+    key = fingerprint(normalize_text(ticket_text), params)
+    return flight("retrieve").do(key, _recommend_ticket_with_chunks, ticket_text, *params)
+
+def _recommend_ticket_with_chunks(ticket_text, top_k, chunk_hits_k, agg, keyword_boost,
+                                  threshold, title_boost_value, shorten_snippet_len, context=None):
     
     # 2. Search
     print(f"DEBUG: Searching for query: '{ticket_text}'")
-    chunk_hits = vs.search(q_vec, top_k=chunk_hits_k)
+    if context is not None:
+        chunk_hits = context.search(ticket_text, chunk_hits_k)
+    else:
+        chunk_hits = search_chunks(embed_query(ticket_text), chunk_hits_k)
     print(f"DEBUG: Found {len(chunk_hits)} raw hits")
+    if RETRIEVAL_DIVERSIFY:
+        chunk_hits = diversify(chunk_hits)
     for h in chunk_hits:
         print(f"DEBUG: Hit: {h['score']:.4f} - {h['meta'].get('chunk_id')}")
 
@@ -160,10 +192,11 @@ def recommend_ticket_with_chunks(
                 "chunk_text": h["meta"].get("chunk_text", "")
             }
 
-    # prepare result objects
+    # prepare result objects (every scored article has a hit, which carries its title)
+    titles = {h["meta"].get("article_id"): h["meta"].get("title", "") for h in reversed(chunk_hits)}
     results = []
     for aid, score in sorted(article_scores.items(), key=lambda x: x[1], reverse=True):
-        title = next((m["title"] for m in vs.meta if m["article_id"] == aid), "")
+        title = titles.get(aid, "")
         best = best_chunk_per_article.get(aid, {"chunk_id": "", "chunk_text": "", "score": score})
         results.append({
             "article_id": aid,
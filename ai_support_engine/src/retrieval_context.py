@@ -0,0 +1,198 @@
+# src/retrieval_context.py
+"""
+Per-ticket retrieval state kept across a conversation.
+
+For each ticket: the embeddings of its customer messages, a running conversation
+vector, and the candidate chunk set from the last full search. db.add_message feeds
+new messages in; the next suggestion embeds only those and re-ranks the warm
+candidates, going back to the index only when the conversation drifts or the
+index generation changes.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from model_engine import load_embedding_model, get_embedding
+from vector_store import get_store, header_matches, _generation_key, _normalize_rows
+
+CONTEXT_CACHE_SIZE = int(os.getenv("RETRIEVAL_CONTEXT_SIZE", "2048"))
+CONTEXT_TTL = float(os.getenv("RETRIEVAL_CONTEXT_TTL", "3600"))
+# Share of the conversation vector blended into the latest message's query vector
+CONTEXT_WEIGHT = float(os.getenv("RETRIEVAL_CONTEXT_WEIGHT", "0.3"))
+# Re-run the full search when the query moves this far from the one the candidates came from
+CONTEXT_DRIFT = float(os.getenv("RETRIEVAL_CONTEXT_DRIFT", "0.9"))
+CONVERSATION_DECAY = 0.5  # weight of older customer turns in the running vector
+MIN_CANDIDATES = 48
+
+
+def _unit(v):
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+def _message_key(m):
+    # the same for a message seen through note() and through sync(); without a ts (imported
+    # history) repeated identical text shares one key, which only skips a duplicate embedding
+    return (m.get("ts"), m.get("content"))
+
+
+class TicketContext:
+    def __init__(self, ticket_id):
+        self.ticket_id = ticket_id
+        self.lock = threading.Lock()
+        self.keys = []          # customer message keys, in conversation order
+        self.vectors = {}       # key -> embedding (None until embedded)
+        self.conversation = None
+        self._folded = 0        # how many of self.keys are folded into self.conversation
+        self.cand_idx = None    # global row indices of the warm candidate set
+        self.cand_query = None
+        self.cand_generation = None
+        self.touched = time.monotonic()
+
+    def note(self, msg):
+        """Registers a new message (from add_message); embedding is deferred to the next retrieval."""
+        if msg.get("role") != "customer" or not msg.get("content"):
+            return
+        key = _message_key(msg)
+        with self.lock:
+            if key not in self.vectors:
+                self.keys.append(key)
+                self.vectors[key] = None
+
+    def sync(self, messages):
+        """Catches up with the ticket's stored messages (e.g. written by another worker)."""
+        for m in messages or []:
+            if m.get("role") == "customer" and m.get("content"):
+                key = _message_key(m)
+                with self.lock:
+                    if key not in self.vectors:
+                        self.keys.append(key)
+                        self.vectors[key] = None
+
+    def _embed_pending(self):
+        pending = [k for k in self.keys if self.vectors[k] is None]
+        if not pending:
+            return 0
+        texts = [k[1] for k in pending]
+        if len(texts) == 1:
+            from recommender import embed_query
+            vecs = [embed_query(texts[0])]
+        else:
+            arr = get_embedding(load_embedding_model(), texts)
+            vecs = list(arr) if arr is not None else [None] * len(texts)
+        for k, v in zip(pending, vecs):
+            if v is not None:
+                self.vectors[k] = np.asarray(v, dtype="float32")
+        stats["embedded"] += sum(v is not None for v in vecs)
+        return len(pending)
+
+    def _fold(self):
+        # incremental: only turns added since the last fold touch the running vector
+        while self._folded < len(self.keys):
+            v = self.vectors.get(self.keys[self._folded])
+            if v is None:
+                break
+            v = _unit(v)
+            if self.conversation is None or len(self.conversation) != len(v):
+                self.conversation = v
+            else:
+                self.conversation = _unit(CONVERSATION_DECAY * self.conversation + v)
+            self._folded += 1
+
+    def query_vector(self, text):
+        """Embedding of `text` (cached if it is a known message) blended with the conversation vector."""
+        self._embed_pending()
+        self._fold()
+        vec = next((self.vectors[k] for k in reversed(self.keys) if k[1] == text and self.vectors[k] is not None), None)
+        if vec is None:
+            from recommender import embed_query
+            vec = embed_query(text)
+            stats["embedded"] += vec is not None
+        if vec is None:
+            return None
+        q = _unit(np.asarray(vec, dtype="float32"))
+        if self.conversation is not None and len(self.conversation) == len(q) and CONTEXT_WEIGHT > 0:
+            q = _unit((1 - CONTEXT_WEIGHT) * q + CONTEXT_WEIGHT * self.conversation)
+        return q
+
+    def search(self, text, top_k):
+        """Hits in SimpleVectorStore.search format, re-ranked from the warm candidate set when possible."""
+        from recommender import search_chunks
+        with self.lock:
+            self.touched = time.monotonic()
+            q = self.query_vector(text)
+            if q is None:
+                return []
+            store = get_store()
+            if len(store.emb) == 0:
+                return []
+            generation = _generation_key(store.emb_path)
+            warm = (
+                self.cand_idx is not None
+                and self.cand_generation == generation
+                and len(q) == store.emb.shape[1]
+                and header_matches(store.header)
+                and float(q @ self.cand_query) >= CONTEXT_DRIFT
+                and len(self.cand_idx) >= min(top_k, len(store.emb))
+            )
+            if not warm:
+                stats["refetched"] += 1
+                wide = search_chunks(q, max(4 * top_k, MIN_CANDIDATES))
+                self.cand_idx = np.asarray(sorted(h["idx"] for h in wide), dtype="int64")
+                self.cand_query = q
+                self.cand_generation = _generation_key(store.emb_path)
+                store = get_store()
+            else:
+                stats["reranked"] += 1
+            if len(self.cand_idx) == 0 or self.cand_idx[-1] >= len(store.emb) or len(q) != store.emb.shape[1]:
+                return []
+            rows = _normalize_rows(np.asarray(store.emb[self.cand_idx], dtype="float32"))
+            scores = rows @ q
+            order = np.argsort(-scores)[:top_k]
+            return [{"idx": int(self.cand_idx[j]), "score": float(scores[j]), "meta": store.meta[int(self.cand_idx[j])]}
+                    for j in order]
+
+
+# ---------------- Per-process context cache ----------------
+_contexts = OrderedDict()
+_lock = threading.Lock()
+stats = {"contexts": 0, "hits": 0, "misses": 0, "embedded": 0, "reranked": 0, "refetched": 0}
+
+def for_ticket(ticket_id, messages=None):
+    """The ticket's context (created on first use), caught up with `messages`."""
+    now = time.monotonic()
+    with _lock:
+        ctx = _contexts.get(ticket_id)
+        if ctx is not None and now - ctx.touched > CONTEXT_TTL:
+            del _contexts[ticket_id]
+            ctx = None
+        if ctx is None:
+            stats["misses"] += 1
+            ctx = _contexts[ticket_id] = TicketContext(ticket_id)
+            while len(_contexts) > CONTEXT_CACHE_SIZE:
+                _contexts.popitem(last=False)
+        else:
+            stats["hits"] += 1
+            _contexts.move_to_end(ticket_id)
+        stats["contexts"] = len(_contexts)
+    ctx.sync(messages)
+    return ctx
+
+def on_ticket_event(kind, ticket_id, msg=None):
+    """db listener: new messages extend an existing context; deletions drop it."""
+    if kind == "deleted":
+        with _lock:
+            _contexts.pop(ticket_id, None)
+        return
+    if kind == "message" and msg is not None:
+        with _lock:
+            ctx = _contexts.get(ticket_id)
+        if ctx is not None:
+            ctx.note(msg)
+
+def context_stats():
+    with _lock:
+        out = dict(stats)
+        out["contexts"] = len(_contexts)
+    return out
@@ -0,0 +1,430 @@
+# src/sharded_store.py
+"""
+Scatter-gather retrieval over a partitioned index.
+
+Each shard is a process holding its own float32 slice of the chunk embeddings,
+so a query is scanned by N cores (or N machines) in parallel and the per-shard
+top-k lists are merged with a heap.
+
+Shard membership is a hash of chunk_id, so /upload inserts and delete_chunk
+never move an existing chunk to another shard; shards pick up changes through
+the same index generation file as get_store().
+
+Local:   VECTOR_SHARDS=4                     (spawns 4 shard processes on first use)
+Remote:  VECTOR_SHARD_ADDRS=host1:7001,host2:7001  VECTOR_SHARD_AUTHKEY=<shared secret>
+         python sharded_store.py serve --shard 0 --shards 2 --host 0.0.0.0 --port 7001   (on each node)
+
+Queries and replies travel as raw float32 / JSON byte frames, never pickles. Remote
+shards require VECTOR_SHARD_AUTHKEY on both sides. If any shard fails to answer within
+VECTOR_SHARD_TIMEOUT_S, the query is served by the local store and the shard is reconnected
+(a local shard process is restarted).
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import zlib
+import atexit
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import Client, Listener
+import numpy as np
+
+from vector_store import (
+    EMB_PATH, META_PATH, get_store, header_matches, _generation_key, _normalize_rows,
+)
+
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "0"))
+VECTOR_SHARD_ADDRS = [a.strip() for a in os.getenv("VECTOR_SHARD_ADDRS", "").split(",") if a.strip()]
+SHARD_AUTHKEY = os.getenv("VECTOR_SHARD_AUTHKEY", "").encode()
+SHARD_TIMEOUT_S = float(os.getenv("VECTOR_SHARD_TIMEOUT_S", "2.0"))
+SHARD_IDLE_TIMEOUT_S = float(os.getenv("VECTOR_SHARD_IDLE_TIMEOUT_S", "600"))  # remote shards drop silent coordinators
+LATENCY_WINDOW = 2048  # most recent queries kept per shard for percentiles
+
+
+def _require_authkey():
+    if not SHARD_AUTHKEY:
+        raise RuntimeError("VECTOR_SHARD_AUTHKEY must be set for remote shards")
+
+
+# ---------------- Wire format ----------------
+# query: 4-byte top_k + float32 vector; reply: JSON {"hits", "compute", "error"}; b"" closes.
+# A local shard process sends READY once its slice is loaded, before the first reply.
+READY = b"ready"
+
+def _encode_query(q_unit, top_k):
+    return int(top_k).to_bytes(4, "little") + np.asarray(q_unit, dtype="<f4").tobytes()
+
+def _decode_query(frame):
+    return np.frombuffer(frame, dtype="<f4", offset=4), int.from_bytes(frame[:4], "little")
+
+def _encode_reply(hits, compute, err):
+    return json.dumps({"hits": hits, "compute": compute, "error": err}).encode("utf-8")
+
+def _decode_reply(frame):
+    reply = json.loads(frame)
+    return [tuple(h) for h in reply["hits"]], reply["compute"], reply["error"]
+
+
+def shard_of(chunk_id, n_shards):
+    """Stable shard for a chunk: same answer in every process and across restarts."""
+    return zlib.crc32(str(chunk_id).encode("utf-8")) % n_shards
+
+
+# ---------------- Shard side ----------------
+class IndexShard:
+    """One partition of the index: the rows whose chunk_id hashes to `shard`."""
+
+    def __init__(self, shard, n_shards, emb_path=EMB_PATH, meta_path=META_PATH):
+        self.shard = shard
+        self.n_shards = n_shards
+        self.emb_path = emb_path
+        self.meta_path = meta_path
+        self._key = object()  # forces the first load
+        self.rows = np.zeros(0, dtype="int64")
+        self.unit = np.zeros((0, 0), dtype="float32")
+        self.meta = []
+
+    def refresh(self):
+        """Reloads this shard's slice when the index generation has moved on."""
+        key = _generation_key(self.emb_path)
+        if key == self._key:
+            return
+        if not os.path.exists(self.emb_path) or not os.path.exists(self.meta_path):
+            self.rows, self.unit, self.meta = np.zeros(0, dtype="int64"), np.zeros((0, 0), dtype="float32"), []
+            self._key = key
+            return
+        emb = np.load(self.emb_path, mmap_mode="r")
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if emb.ndim != 2 or len(emb) != len(meta):
+            # caught between a writer's two renames; keep serving the old slice
+            print(f"[WARN] Shard {self.shard}: index files out of step (emb={emb.shape}, meta={len(meta)}), retrying next query.")
+            return
+        rows = [i for i, m in enumerate(meta) if shard_of(m.get("chunk_id"), self.n_shards) == self.shard]
+        self.rows = np.asarray(rows, dtype="int64")
+        # a private, pre-normalized copy: the scan is one GEMV over this shard's rows only
+        self.unit = _normalize_rows(np.asarray(emb[self.rows], dtype="float32")) if rows else np.zeros((0, emb.shape[1]), dtype="float32")
+        self.meta = [meta[i] for i in rows]
+        self._key = key
+
+    def search(self, q_unit, top_k):
+        """Returns [(score, global_idx, meta), ...] best first."""
+        self.refresh()
+        n = len(self.rows)
+        if n == 0 or self.unit.shape[1] != len(q_unit):
+            return []
+        scores = self.unit @ q_unit
+        k = min(top_k, n)
+        top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[j]), int(self.rows[j]), self.meta[j]) for j in top]
+
+
+def _serve(conn, shard, idle_timeout=None):
+    """Request loop shared by local shard processes and remote shard servers."""
+    while True:
+        try:
+            if idle_timeout is not None and not conn.poll(idle_timeout):
+                # a coordinator that vanished without closing would otherwise pin this thread forever
+                conn.close()
+                return
+            frame = conn.recv_bytes()
+        except (EOFError, OSError):
+            return
+        if not frame:
+            return
+        t0 = time.perf_counter()
+        try:
+            q_unit, top_k = _decode_query(frame)
+            hits = shard.search(q_unit, top_k)
+            reply = _encode_reply(hits, time.perf_counter() - t0, None)
+        except Exception as e:
+            reply = _encode_reply([], time.perf_counter() - t0, repr(e))
+        try:
+            conn.send_bytes(reply)
+        except (EOFError, OSError):
+            return
+
+
+def _shard_main(conn, shard, n_shards, emb_path, meta_path):
+    shard = IndexShard(shard, n_shards, emb_path, meta_path)
+    shard.refresh()
+    try:
+        conn.send_bytes(READY)
+    except (EOFError, OSError):
+        return
+    _serve(conn, shard)
+
+
+def serve_shard(shard, n_shards, host="127.0.0.1", port=7001, emb_path=EMB_PATH, meta_path=META_PATH):
+    """Runs one shard as a network service (one coordinator connection at a time per thread)."""
+    _require_authkey()
+    index = IndexShard(shard, n_shards, emb_path, meta_path)
+    index.refresh()
+    lock = threading.Lock()  # IndexShard reloads in place; one query at a time
+
+    class _Locked:
+        def search(self, q_unit, top_k):
+            with lock:
+                return index.search(q_unit, top_k)
+
+    with Listener((host, port), authkey=SHARD_AUTHKEY) as listener:
+        print(f"[INFO] Shard {shard}/{n_shards} serving {len(index.rows)} chunks on {host}:{port}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve, args=(conn, _Locked(), SHARD_IDLE_TIMEOUT_S), daemon=True).start()
+
+
+# ---------------- Coordinator side ----------------
+class ShardedVectorStore:
+    """
+    Fans a query out to every shard and merges their top-k lists.
+    search() returns the same {idx, score, meta} hits as SimpleVectorStore.search.
+    """
+
+    def __init__(self, n_shards=None, addresses=None, emb_path=EMB_PATH, meta_path=META_PATH):
+        self.emb_path = emb_path
+        self.meta_path = meta_path
+        self.addresses = addresses if addresses is not None else VECTOR_SHARD_ADDRS
+        self.n_shards = len(self.addresses) if self.addresses else (n_shards or VECTOR_SHARDS or os.cpu_count() or 1)
+        self._locks = [threading.Lock() for _ in range(self.n_shards)]
+        self._latency = [deque(maxlen=LATENCY_WINDOW) for _ in range(self.n_shards)]
+        self._compute = [deque(maxlen=LATENCY_WINDOW) for _ in range(self.n_shards)]
+        self._errors = [0] * self.n_shards
+        if self.addresses:
+            _require_authkey()
+        self._conns = [None] * self.n_shards
+        self._procs = [None] * self.n_shards
+        self._ready = [False] * self.n_shards
+        for i in range(self.n_shards):
+            self._connect(i)
+
+    def _connect(self, i):
+        """(Re)opens shard i: a new connection to a remote shard, or a fresh local process."""
+        if self.addresses:
+            host, port = self.addresses[i].rsplit(":", 1)
+            try:
+                self._conns[i] = Client((host, int(port)), authkey=SHARD_AUTHKEY)
+                self._ready[i] = True  # a remote shard loads its slice before it listens
+            except (OSError, EOFError, mp.AuthenticationError) as e:
+                self._conns[i] = None
+                print(f"[WARN] Shard {i} at {self.addresses[i]} unreachable: {e!r}")
+            return
+        # spawn, not fork: the API process has threads (and possibly an event loop) running
+        ctx = mp.get_context("spawn")
+        old = self._procs[i]
+        if old is not None and old.is_alive():
+            old.kill()  # it may be hung; nothing in a shard needs a clean shutdown
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=_shard_main, args=(child, i, self.n_shards, self.emb_path, self.meta_path), daemon=True)
+        p.start()
+        child.close()
+        self._conns[i], self._procs[i] = parent, p
+        self._ready[i] = False
+
+    def _check_ready(self, i, timeout=0.0):
+        """True once local shard i has loaded its slice (caller holds its lock)."""
+        if self._ready[i]:
+            return True
+        conn = self._conns[i]
+        if conn is not None and conn.poll(timeout) and conn.recv_bytes() == READY:
+            self._ready[i] = True
+        return self._ready[i]
+
+    def wait_ready(self, timeout=60.0):
+        """Blocks until every shard has loaded its slice (or timeout); returns how many are ready."""
+        deadline = time.perf_counter() + timeout
+        for i, lock in enumerate(self._locks):
+            with lock:
+                try:
+                    self._check_ready(i, max(0.0, deadline - time.perf_counter()))
+                except (OSError, EOFError) as e:
+                    self._fail(i, repr(e))
+        return sum(self._ready)
+
+    def _fail(self, i, err):
+        """Counts the failure and replaces shard i's connection (caller holds its lock)."""
+        self._errors[i] += 1
+        print(f"[WARN] Shard {i} failed: {err}; reconnecting")
+        conn = self._conns[i]
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        self._connect(i)
+
+    def close(self):
+        for lock, conn in zip(self._locks, self._conns):
+            with lock:
+                try:
+                    if conn is not None:
+                        conn.send_bytes(b"")
+                        conn.close()
+                except (OSError, EOFError):
+                    pass
+        for p in self._procs:
+            if p is not None:
+                p.join(timeout=2)
+        self._conns = [None] * self.n_shards
+        self._procs = [None] * self.n_shards
+        self._ready = [False] * self.n_shards
+
+    def search(self, query_vec, top_k=5):
+        if query_vec is None:
+            return []
+        store = get_store(self.emb_path, self.meta_path)
+        if len(store.emb) == 0:
+            return []
+        q = np.asarray(query_vec, dtype="float32").reshape(-1)
+        if len(q) != store.emb.shape[1] or not header_matches(store.header):
+            # the single-process store owns the rebuild path; shards reload from its new generation
+            return store.search(query_vec, top_k=top_k)
+        norm = np.linalg.norm(q)
+        q_unit = q / norm if norm else q
+
+        # scatter: every shard starts scanning before any reply is awaited.
+        # Shard locks are taken in index order and released as each reply arrives,
+        # so concurrent queries pipeline through the shards without deadlocking.
+        # A shard that cannot answer (still loading, send or receive fails, no reply within
+        # SHARD_TIMEOUT_S, or it reports an error) would leave its rows out of the merge, so
+        # the whole query falls back to the local store.
+        frame = _encode_query(q_unit, top_k)
+        sent, failed = [], False
+        for i, lock in enumerate(self._locks):
+            lock.acquire()
+            try:
+                if self._conns[i] is None:
+                    raise ConnectionError("not connected")
+                if not self._check_ready(i):
+                    failed = True
+                    lock.release()
+                    continue
+                self._conns[i].send_bytes(frame)
+                sent.append((i, time.perf_counter()))
+            except (OSError, EOFError) as e:
+                failed = True
+                self._fail(i, repr(e))
+                lock.release()
+
+        # gather: every sent query is received, even after a failure, to keep each connection in step.
+        # One deadline covers all shards; a shard that misses it gets a fresh connection, so its late
+        # reply can never be read as the answer to the next query.
+        per_shard = []
+        deadline = time.perf_counter() + SHARD_TIMEOUT_S
+        for i, t_sent in sent:
+            try:
+                if not self._conns[i].poll(max(0.0, deadline - time.perf_counter())):
+                    raise TimeoutError(f"no reply within {SHARD_TIMEOUT_S}s")
+                hits, compute, err = _decode_reply(self._conns[i].recv_bytes())
+                self._latency[i].append(time.perf_counter() - t_sent)
+                self._compute[i].append(compute)
+                if err:
+                    failed = True
+                    self._errors[i] += 1
+                    print(f"[WARN] Shard {i} failed: {err}")
+                per_shard.append(hits)
+            except (OSError, EOFError, ValueError) as e:
+                failed = True
+                self._fail(i, repr(e))
+            finally:
+                self._locks[i].release()
+
+        if failed:
+            return store.search(query_vec, top_k=top_k)
+        merged = heapq.nlargest(top_k, (h for hits in per_shard for h in hits), key=lambda h: h[0])
+        return [{"idx": idx, "score": score, "meta": meta} for score, idx, meta in merged]
+
+    def latency_report(self):
+        """Per-shard round-trip and in-shard scan time percentiles (ms) over the recent window."""
+        rows = []
+        for i in range(self.n_shards):
+            lat = np.asarray(self._latency[i]) * 1000
+            comp = np.asarray(self._compute[i]) * 1000
+            rows.append({
+                "shard": i,
+                "queries": int(len(lat)),
+                "errors": self._errors[i],
+                "p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+                "p99_ms": float(np.percentile(lat, 99)) if len(lat) else None,
+                "scan_p50_ms": float(np.percentile(comp, 50)) if len(comp) else None,
+                "scan_p99_ms": float(np.percentile(comp, 99)) if len(comp) else None,
+            })
+        return rows
+
+
+_sharded = None
+_sharded_lock = threading.Lock()
+
+def get_sharded_store():
+    """The process-wide sharded store, started on first use; None when sharding is off."""
+    global _sharded
+    if not VECTOR_SHARDS and not VECTOR_SHARD_ADDRS:
+        return None
+    if _sharded is None:
+        with _sharded_lock:
+            if _sharded is None:
+                try:
+                    _sharded = ShardedVectorStore()
+                except RuntimeError as e:
+                    # refuse to talk to shards without a shared key; the local store serves instead
+                    print(f"[ERROR] Sharded retrieval disabled: {e}")
+                    _sharded = False
+                    return None
+                atexit.register(_sharded.close)
+    return _sharded or None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded vector retrieval")
+    sub = parser.add_subparsers(dest="cmd")
+    serve = sub.add_parser("serve", help="run one shard as a network service")
+    serve.add_argument("--shard", type=int, required=True)
+    serve.add_argument("--shards", type=int, required=True)
+    serve.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept other nodes (set VECTOR_SHARD_AUTHKEY)")
+    serve.add_argument("--port", type=int, default=7001)
+    bench = sub.add_parser("bench", help="compare single-process and sharded search")
+    bench.add_argument("--shards", type=int, default=os.cpu_count() or 2)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--top-k", type=int, default=12)
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        try:
+            serve_shard(args.shard, args.shards, args.host, args.port)
+        except RuntimeError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    args = args if args.cmd == "bench" else bench.parse_args([])
+    single = get_store()
+    if len(single.emb) == 0:
+        print("Vector store is empty.")
+        sys.exit(0)
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(args.queries, single.emb.shape[1])).astype("float32")
+
+    t0 = time.perf_counter()
+    expected = [single.search(q, top_k=args.top_k) for q in queries]
+    t_single = time.perf_counter() - t0
+
+    sharded = ShardedVectorStore(n_shards=args.shards, addresses=[])
+    sharded.wait_ready()  # shards load their slices
+    t0 = time.perf_counter()
+    got = [sharded.search(q, top_k=args.top_k) for q in queries]
+    t_sharded = time.perf_counter() - t0
+
+    agree = np.mean([[h["idx"] for h in a] == [h["idx"] for h in b] for a, b in zip(expected, got)])
+    print(f"{len(single.emb)} chunks, {args.queries} queries, top_k={args.top_k}")
+    print(f"single process : {args.queries / t_single:8.1f} q/s")
+    print(f"{args.shards} shards       : {args.queries / t_sharded:8.1f} q/s  (same ranking: {agree:.0%})")
+    for r in sharded.latency_report():
+        print(f"  shard {r['shard']}: n={r['queries']} p50={r['p50_ms']:.2f}ms p99={r['p99_ms']:.2f}ms "
+              f"scan p50={r['scan_p50_ms']:.2f}ms p99={r['scan_p99_ms']:.2f}ms errors={r['errors']}")
+    sharded.close()
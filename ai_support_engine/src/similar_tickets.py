@@ -0,0 +1,202 @@
+# src/similar_tickets.py
+"""
+Similar-ticket lookup for incoming tickets: MinHash signatures of each ticket's text
+(word unigrams + bigrams) in an LSH band index, kept current from the change feed.
+A lookup hashes one text and probes SIMILAR_BANDS buckets of at most
+SIMILAR_BUCKET_CAP ids each, so its cost does not grow with the number of tickets.
+
+Resolved matches come back with the ticket's final agent reply, so an answer that
+already solved the same problem can be reused without retrieval or an LLM call.
+"""
+import os
+import re
+import time
+import zlib
+from functools import lru_cache
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+import db
+from change_feed import FeedIndex
+
+SIMILAR_BANDS = int(os.getenv("SIMILAR_BANDS", "16"))
+SIMILAR_ROWS = int(os.getenv("SIMILAR_ROWS", "3"))       # bands x rows hash functions; ~0.4 Jaccard threshold
+SIMILAR_MIN_SCORE = float(os.getenv("SIMILAR_MIN_SCORE", "0.4"))
+SIMILAR_TOP_K = int(os.getenv("SIMILAR_TOP_K", "3"))
+SIMILAR_MAX_TICKETS = int(os.getenv("SIMILAR_MAX_TICKETS", "100000"))  # most recent tickets kept
+# newest ids kept per bucket: a very common issue cannot turn a lookup into a scan
+SIMILAR_BUCKET_CAP = int(os.getenv("SIMILAR_BUCKET_CAP", "32"))
+SIMILAR_SYNC_S = float(os.getenv("SIMILAR_SYNC_S", "1.0"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32: a*x + b stays within uint64
+
+
+@lru_cache(maxsize=1)
+def stop_words():
+    # scikit-learn is slow to import and only needed here for its word list: load it on first use
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return ENGLISH_STOP_WORDS - {"no", "not", "never", "cannot"}
+
+def shingles(text):
+    """Content words and adjacent-word pairs ("charged twice") of a ticket text."""
+    stop = stop_words()
+    words = [w for w in _TOKEN_RE.findall((text or "").lower().replace("’", "'")) if w not in stop]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+class MinHasher:
+    def __init__(self, num_perm, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, text):
+        """uint32[num_perm], or None for a text without content words."""
+        tokens = shingles(text)
+        if not tokens:
+            return None
+        x = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+        return ((self.a * x + self.b) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+class SimilarTicketIndex(FeedIndex):
+    FIELDS = ["id", "text", "status", "created_at", "updated_at"]
+    LOAD_LIMIT = SIMILAR_MAX_TICKETS
+
+    def __init__(self, bands=SIMILAR_BANDS, rows=SIMILAR_ROWS, max_tickets=SIMILAR_MAX_TICKETS,
+                 bucket_cap=SIMILAR_BUCKET_CAP, sync_interval=SIMILAR_SYNC_S):
+        super().__init__(sync_interval)
+        self.bands, self.rows, self.max_tickets, self.bucket_cap = bands, rows, max_tickets, bucket_cap
+        self.hasher = MinHasher(bands * rows)
+        self.stats.update({"lookups": 0, "lookup_us_total": 0.0, "candidates": 0})
+        self._reset()
+
+    def _reset(self):
+        self._entries = OrderedDict()        # id -> (signature, status, created_at), oldest first
+        self._buckets = defaultdict(dict)    # (band, band hash) -> {id: None}, oldest first
+
+    def _band_keys(self, sig):
+        r = self.rows
+        return [(b, sig[b * r:(b + 1) * r].tobytes()) for b in range(self.bands)]
+
+    def _apply(self, ticket):
+        entry = self._entries.get(ticket["id"])
+        if entry is not None:
+            # the text never changes after creation: only the status needs refreshing
+            self._entries[ticket["id"]] = (entry[0], ticket.get("status"), entry[2])
+            return
+        sig = self.hasher.signature(ticket.get("text"))
+        if sig is None:
+            return
+        self._entries[ticket["id"]] = (sig, ticket.get("status"), ticket.get("created_at") or 0.0)
+        for key in self._band_keys(sig):
+            ids = self._buckets[key]
+            ids[ticket["id"]] = None
+            if len(ids) > self.bucket_cap:
+                del ids[next(iter(ids))]
+        while len(self._entries) > self.max_tickets:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, ticket_id):
+        entry = self._entries.pop(ticket_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[0]):
+            ids = self._buckets.get(key)
+            if ids is not None:
+                ids.pop(ticket_id, None)
+                if not ids:
+                    del self._buckets[key]
+
+    def lookup(self, text, exclude=None, top_k=SIMILAR_TOP_K, min_score=SIMILAR_MIN_SCORE):
+        """[(ticket_id, estimated Jaccard, status)] best first; resolved tickets win ties."""
+        self.sync()
+        t0 = time.perf_counter()
+        sig = self.hasher.signature(text)
+        if sig is None:
+            return []
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(sig):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude)
+            candidates = list(candidates)
+            scored = []
+            if candidates:
+                entries = [self._entries[c] for c in candidates]
+                scores = (np.stack([e[0] for e in entries]) == sig).mean(axis=1)
+                for j in np.flatnonzero(scores >= min_score):
+                    _, status, created_at = entries[j]
+                    scored.append((float(scores[j]), status == "resolved", created_at, candidates[j], status))
+            scored.sort(reverse=True)
+            self.stats["lookups"] += 1
+            self.stats["candidates"] += len(candidates)
+            self.stats["lookup_us_total"] += (time.perf_counter() - t0) * 1e6
+        return [(ticket_id, round(score, 3), status) for score, _, _, ticket_id, status in scored[:top_k]]
+
+    def snapshot(self):
+        with self._lock:
+            out = dict(self.stats, indexed=len(self._entries), buckets=len(self._buckets))
+        out["lookup_us_avg"] = out.pop("lookup_us_total") / out["lookups"] if out["lookups"] else None
+        return out
+
+
+def final_agent_reply(ticket):
+    return next((m["content"] for m in reversed(ticket.get("messages") or []) if m.get("role") == "agent"), None)
+
+def similar_tickets(text, exclude=None, top_k=SIMILAR_TOP_K):
+    """
+    Near-duplicates of `text` among recent tickets, for the POST /tickets response.
+    Resolved matches carry the reply that closed them (one ticket read per match).
+    """
+    out = []
+    for ticket_id, score, status in index.lookup(text, exclude=exclude, top_k=top_k):
+        item = {"ticket_id": ticket_id, "similarity": score, "status": status}
+        if status == "resolved":
+            t = db.get_ticket(ticket_id)
+            if t is None:
+                continue
+            item["text"] = t.get("text")
+            item["reply"] = final_agent_reply(t)
+        out.append(item)
+    return out
+
+
+index = SimilarTicketIndex()
+db.add_listener(index.on_ticket_event)
+
+
+if __name__ == "__main__":
+    import random
+
+    # lookup latency as the index grows (in memory; nothing is written)
+    base = [
+        "I was charged twice for my order",
+        "My payment failed but I was charged",
+        "Forgot my password and cannot login to my account",
+        "Order not delivered and tracking is not updating",
+        "Please update my billing address",
+        "Refund has not arrived after two weeks",
+    ]
+    vocab = ("card app email invoice shipping delay account coupon subscription plan upgrade screen "
+             "crash android iphone website checkout cart discount warehouse courier").split()
+
+    for n in (1000, 10000, 100000):
+        idx = SimilarTicketIndex(max_tickets=n + 1)
+        idx._cursor = ""  # offline: never touch the ticket store
+        idx.sync = lambda force=False: None
+        t0 = time.perf_counter()
+        for i in range(n):
+            words = random.sample(vocab, 4)
+            text = f"{random.choice(base)} {' '.join(words)}" if i % 10 == 0 else " ".join(random.sample(vocab, 8))
+            idx._apply({"id": f"t{i}", "text": text, "status": random.choice(["open", "resolved"]), "created_at": i})
+        build = time.perf_counter() - t0
+        queries = [f"{b} please help" for b in base] * 50
+        t0 = time.perf_counter()
+        hits = [idx.lookup(q) for q in queries]
+        per = (time.perf_counter() - t0) / len(queries)
+        print(f"{n:7d} tickets: build {build:6.2f}s  lookup {per * 1e6:7.1f} us  "
+              f"hit rate {sum(bool(h) for h in hits) / len(hits):.2f}")
@@ -0,0 +1,83 @@
+# src/single_flight.py
+import copy
+import json
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+
+def normalize_text(text) -> str:
+    """Whitespace-insensitive form of a query, so a re-sent or re-typed message maps to the same key."""
+    return " ".join((text or "").split())
+
+
+def fingerprint(*parts) -> str:
+    """Stable request key from JSON-serializable parts (texts, history, parameters)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs fn, callers
+    arriving while it is in flight wait on the same Future and get a copy of its result
+    (or its exception). Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self.calls += 1
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+                self.executions += 1
+        if not leader:
+            # followers get their own copy; callers are free to mutate what they receive
+            return copy.deepcopy(fut.result())
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(copy.deepcopy(result))
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "saved": self.calls - self.executions,
+                "in_flight": len(self._inflight),
+            }
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+def flight(name: str) -> SingleFlight:
+    """Named, process-wide flight group (one per pipeline stage)."""
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(name)
+        return _flights[name]
+
+def coalescing_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-stage counters; 'saved' is the number of upstream calls that were shared instead of made."""
+    with _flights_lock:
+        groups = list(_flights.values())
+    return {g.name: g.stats() for g in groups}
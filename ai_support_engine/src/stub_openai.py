@@ -0,0 +1,164 @@
+# src/stub_openai.py
+"""
+Local OpenAI-compatible stub with fault injection, for exercising timeouts, retries,
+hedging and the circuit breaker without touching the real API.
+
+    python stub_openai.py --port 8900 --latency-ms 200 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=stub uvicorn api:app
+
+Faults can be changed at runtime: POST /_faults with a JSON body of any of
+    latency_ms, jitter_ms   base delay and uniform jitter per request
+    latency_dist            "fixed" (default), "lognormal" (latency_ms is the median,
+                            spread set by latency_sigma, default 0.5) or "exponential"
+                            (latency_ms is the mean)
+    error_rate, error_status   fraction of requests answered with an HTTP error (default 500)
+    slow_rate, slow_ms      fraction of requests delayed by slow_ms (tail latency)
+    hang_rate               fraction of requests that never answer (until the client gives up)
+POST /_faults with {} clears them; GET /_stats returns request counts.
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DEFAULT_ANSWER = {"answer": "Stub reply.", "steps": ["Check the order"], "citations": [], "confidence": 0.5}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass  # keep load tests quiet
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client gave up (timeout or lost hedge race)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            return self._send(200, dict(self.server.stats))
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        server = self.server
+        if self.path == "/_faults":
+            faults = self._read_json()
+            server.faults.clear()
+            server.faults.update(faults)
+            return self._send(200, {"faults": server.faults})
+
+        req = self._read_json()
+        server.count("requests")
+        f = dict(server.faults)
+        delay = _base_latency(f) + random.uniform(0, f.get("jitter_ms", 0))
+        if random.random() < f.get("slow_rate", 0):
+            delay += f.get("slow_ms", 0)
+            server.count("slow")
+        if random.random() < f.get("hang_rate", 0):
+            server.count("hung")
+            time.sleep(3600)
+            return
+        time.sleep(delay / 1000.0)
+        if random.random() < f.get("error_rate", 0):
+            server.count("errors")
+            status = int(f.get("error_status", 500))
+            return self._send(status, {"error": {"message": "injected fault", "type": "server_error", "code": status}})
+
+        if self.path.endswith("/chat/completions"):
+            content = json.dumps(server.answer)
+            return self._send(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        if self.path.endswith("/embeddings"):
+            texts = req.get("input") or []
+            if isinstance(texts, str):
+                texts = [texts]
+            dim = int(req.get("dimensions") or server.dim)
+            data = [{"object": "embedding", "index": i, "embedding": _fake_vector(t, dim)} for i, t in enumerate(texts)]
+            return self._send(200, {"object": "list", "data": data, "model": req.get("model", "stub"),
+                                    "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+        self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+
+def _base_latency(f):
+    base = f.get("latency_ms", 0)
+    dist = f.get("latency_dist", "fixed")
+    if not base:
+        return 0.0
+    if dist == "lognormal":
+        return base * random.lognormvariate(0, f.get("latency_sigma", 0.5))
+    if dist == "exponential":
+        return random.expovariate(1.0 / base)
+    return base
+
+def _fake_vector(text, dim):
+    """Deterministic unit vector per text, so retrieval results are repeatable."""
+    seed = int.from_bytes(hashlib.sha1(str(text).encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).normal(size=dim)
+    return (v / np.linalg.norm(v)).round(6).tolist()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, faults=None, answer=None, dim=1536):
+        super().__init__(addr, _Handler)
+        self.faults = dict(faults or {})
+        self.answer = answer or DEFAULT_ANSWER
+        self.dim = dim
+        self.stats = {"requests": 0, "errors": 0, "slow": 0, "hung": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+def start_stub_server(host="127.0.0.1", port=0, **kwargs):
+    """Starts the stub on a background thread; returns (server, base_url ending in /v1)."""
+    server = StubServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fault-injecting OpenAI stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--latency-dist", choices=["fixed", "lognormal", "exponential"], default=None)
+    parser.add_argument("--latency-sigma", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0)
+    parser.add_argument("--slow-ms", type=float, default=0)
+    parser.add_argument("--hang-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    faults = {k: v for k, v in vars(args).items() if k not in ("host", "port") and v}
+    server = StubServer((args.host, args.port), faults=faults)
+    print(f"Stub OpenAI on http://{args.host}:{args.port}/v1 faults={faults}")
+    server.serve_forever()
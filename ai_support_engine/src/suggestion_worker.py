@@ -0,0 +1,148 @@
+# src/suggestion_worker.py
+"""
+Speculative reply suggestions.
+
+Ticket creation and customer replies enqueue a background job; a small, fixed pool of
+worker threads runs the normal suggest pipeline and stores the result on the ticket,
+keyed by the conversation's message version. /suggest serves that stored result
+instantly while it is current and only runs the live pipeline when it is stale.
+"""
+import os
+import time
+import heapq
+import itertools
+import threading
+
+import db
+import retrieval_context
+from rag_chain import rag_answer_openai
+
+# Background workers; kept small so precomputation never competes with interactive requests
+SUGGEST_PRECOMPUTE = os.getenv("SUGGEST_PRECOMPUTE", "1") == "1"
+SUGGEST_WORKERS = int(os.getenv("SUGGEST_WORKERS", "2"))
+SUGGEST_QUEUE_MAX = int(os.getenv("SUGGEST_QUEUE_MAX", "256"))
+
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+
+def message_version(messages) -> str:
+    """Changes whenever a message is appended; stored suggestions are valid for one version."""
+    messages = messages or []
+    return f"{len(messages)}:{messages[-1].get('ts', '') if messages else ''}"
+
+def last_customer_message(messages):
+    return next((m["content"] for m in reversed(messages or []) if m.get("role") == "customer"), None)
+
+def generate_suggestion(ticket, store=True):
+    """
+    Runs retrieval + generation for the ticket's latest customer message and (optionally)
+    stores the result on the ticket. Returns the suggestion dict, or None if there is
+    no customer message.
+    """
+    messages = ticket.get("messages", [])
+    query = last_customer_message(messages)
+    if not query:
+        return None
+    ctx = retrieval_context.for_ticket(ticket["id"], messages)
+    resp = rag_answer_openai(query, history=messages, top_k_chunks=5, context=ctx)
+    suggestion = {
+        "version": message_version(messages),
+        "answer": resp.get("answer"),
+        "citations": resp.get("citations", []),
+        "confidence": resp.get("confidence"),
+        "note": resp.get("note"),
+        "computed_at": time.time(),
+    }
+    # a retrieval-only fallback is not worth keeping: the next request should retry generation
+    if store and suggestion["answer"] is not None and not resp.get("error"):
+        # only while the ticket is still at this version: a slower job for older messages loses
+        db.set_suggestion(ticket["id"], suggestion,
+                          if_current=lambda t: message_version(t.get("messages")) == suggestion["version"])
+    return suggestion
+
+def fresh_suggestion(ticket):
+    """The stored suggestion if it was computed for the ticket's current messages, else None."""
+    s = ticket.get("suggestion")
+    if s and s.get("version") == message_version(ticket.get("messages")):
+        return s
+    return None
+
+
+class SuggestionQueue:
+    """
+    Priority queue of ticket ids (high > medium > low, then FIFO) drained by a fixed
+    number of daemon threads. A ticket is queued at most once; when the queue is full
+    the lowest-priority, newest job is dropped.
+    """
+
+    def __init__(self, workers=SUGGEST_WORKERS, max_size=SUGGEST_QUEUE_MAX):
+        self.workers = workers
+        self.max_size = max_size
+        self._heap = []
+        self._queued = {}        # ticket_id -> heap entry
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self.stats = {"enqueued": 0, "computed": 0, "skipped_fresh": 0, "dropped": 0, "failed": 0}
+
+    def enqueue(self, ticket_id, priority="medium"):
+        if not SUGGEST_PRECOMPUTE or self.workers <= 0:
+            return
+        rank = PRIORITY_RANK.get(priority, 1)
+        with self._cond:
+            entry = self._queued.get(ticket_id)
+            if entry is not None:
+                if rank >= entry[0]:
+                    return  # already queued at the same or higher priority; the job reads the latest ticket
+                entry[2] = None  # re-queue at the higher priority
+            entry = [rank, next(self._seq), ticket_id]
+            heapq.heappush(self._heap, entry)
+            self._queued[ticket_id] = entry
+            self.stats["enqueued"] += 1
+            if len(self._queued) > self.max_size:
+                worst = max((e for e in self._heap if e[2] is not None), key=lambda e: (e[0], e[1]))
+                del self._queued[worst[2]]
+                worst[2] = None
+                self.stats["dropped"] += 1
+            self._start()
+            self._cond.notify()
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"suggest-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2] is None:
+                    heapq.heappop(self._heap)  # cancelled entries
+                if self._heap:
+                    entry = heapq.heappop(self._heap)
+                    del self._queued[entry[2]]
+                    return entry[2]
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            ticket_id = self._next()
+            try:
+                ticket = db.get_ticket(ticket_id, fresh=True)
+                if ticket is None:
+                    continue
+                if fresh_suggestion(ticket) is not None:
+                    self.stats["skipped_fresh"] += 1
+                    continue
+                if generate_suggestion(ticket) is not None:
+                    self.stats["computed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"[WARN] Suggestion precompute failed for {ticket_id}: {e}")
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, queued=len(self._queued), workers=len(self._threads))
+
+
+queue = SuggestionQueue()
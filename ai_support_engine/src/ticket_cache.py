@@ -0,0 +1,61 @@
+# src/ticket_cache.py
+import copy
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+
+class TicketCache:
+    """
+    Bounded LRU + TTL cache of ticket documents, kept write-through by db.py.
+    Entries are deep-copied in and out so callers can't mutate cached state.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # ticket_id -> (expires_at, doc)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(ticket_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[ticket_id]
+                self.misses += 1
+                return None
+            self._data.move_to_end(ticket_id)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, ticket_id: str, doc: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[ticket_id] = (time.monotonic() + self.ttl, copy.deepcopy(doc))
+            self._data.move_to_end(ticket_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def update(self, ticket_id: str, fn: Callable[[Dict[str, Any]], None]):
+        """Applies a local write to the cached copy (if any) without resetting its TTL."""
+        with self._lock:
+            entry = self._data.get(ticket_id)
+            if entry is not None:
+                fn(entry[1])
+
+    def invalidate(self, ticket_id: str):
+        with self._lock:
+            self._data.pop(ticket_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
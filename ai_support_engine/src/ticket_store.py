@@ -0,0 +1,336 @@
+# src/ticket_store.py
+import os
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+DB_PATH = os.path.join(ROOT, "data", "tickets.db")
+
+# Fields that live in their own column; anything else set through
+# update_fields() is kept in the JSON "extra" column.
+COLUMNS = ["id", "customer_id", "text", "tags", "sentiment", "priority", "status", "created_at", "updated_at"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    customer_id TEXT,
+    text TEXT,
+    tags TEXT,
+    sentiment TEXT,
+    priority TEXT,
+    status TEXT,
+    created_at REAL,
+    updated_at REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_status_created ON tickets (status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_customer_created ON tickets (customer_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_updated ON tickets (updated_at, id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    ticket_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT,
+    content TEXT,
+    ts REAL,
+    PRIMARY KEY (ticket_id, seq)
+) WITHOUT ROWID;
+
+-- tombstones so the change feed can report deletions
+CREATE TABLE IF NOT EXISTS deletions (
+    ticket_id TEXT PRIMARY KEY,
+    customer_id TEXT,
+    deleted_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_deletions_deleted ON deletions (deleted_at);
+"""
+
+
+class SqliteTicketStore:
+    """
+    Embedded persistent ticket store (sqlite in WAL mode).
+    Tickets and messages are kept in separate tables so that listing tickets
+    never has to rewrite or re-read a growing messages blob.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # autocommit mode; transactions are opened explicitly in _write()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across app crashes in WAL mode and avoids an fsync per commit
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    # ---------------- Transactions ----------------
+    @contextmanager
+    def _write(self):
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.conn
+            except Exception:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+
+    def batch(self):
+        """
+        Groups every write made inside the block into a single transaction:
+            with store.batch():
+                for t in tickets: store.insert_ticket(t)
+        """
+        return self._write()
+
+    # ---------------- Row helpers ----------------
+    def _row_to_ticket(self, row) -> Dict[str, Any]:
+        t = {k: row[k] for k in COLUMNS}
+        t["tags"] = json.loads(row["tags"]) if row["tags"] else []
+        if row["extra"]:
+            t.update(json.loads(row["extra"]))
+        return t
+
+    def _message_rows(self, ticket_id):
+        return self.conn.execute(
+            "SELECT role, content, ts FROM messages WHERE ticket_id = ? ORDER BY seq",
+            (ticket_id,)
+        ).fetchall()
+
+    @staticmethod
+    def _ticket_row(ticket: Dict[str, Any]) -> tuple:
+        extra = {k: v for k, v in ticket.items() if k not in COLUMNS and k != "messages"}
+        return (ticket["id"], ticket.get("customer_id"), ticket.get("text"), json.dumps(ticket.get("tags", [])),
+                ticket.get("sentiment"), ticket.get("priority"), ticket.get("status"),
+                ticket.get("created_at"), ticket.get("updated_at"), json.dumps(extra) if extra else None)
+
+    # ---------------- Writes ----------------
+    def insert_ticket(self, ticket: Dict[str, Any]):
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO tickets (id, customer_id, text, tags, sentiment, priority, status, created_at, updated_at, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._ticket_row(ticket)
+            )
+            conn.executemany(
+                "INSERT INTO messages (ticket_id, seq, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+                [(ticket["id"], i, m.get("role"), m.get("content"), m.get("ts"))
+                 for i, m in enumerate(ticket.get("messages", []))]
+            )
+
+    def insert_tickets(self, tickets: List[Dict[str, Any]]) -> int:
+        """
+        Bulk insert in one transaction. Existing ids are left untouched, so replaying a
+        batch (e.g. a resumed import) is a no-op. Returns the number of new tickets.
+        """
+        with self._write() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tickets (id, customer_id, text, tags, sentiment, priority, status, created_at, updated_at, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._ticket_row(t) for t in tickets]
+            )
+            inserted = conn.total_changes - before
+            conn.executemany(
+                "INSERT OR IGNORE INTO messages (ticket_id, seq, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+                [(t["id"], i, m.get("role"), m.get("content"), m.get("ts"))
+                 for t in tickets for i, m in enumerate(t.get("messages", []))]
+            )
+        return inserted
+
+    def append_message(self, ticket_id: str, msg: Dict[str, Any], updated_at: float) -> bool:
+        with self._write() as conn:
+            cur = conn.execute("UPDATE tickets SET updated_at = ? WHERE id = ?", (updated_at, ticket_id))
+            if cur.rowcount == 0:
+                return False
+            conn.execute(
+                "INSERT INTO messages (ticket_id, seq, role, content, ts) "
+                "SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ?, ? FROM messages WHERE ticket_id = ?",
+                (ticket_id, msg.get("role"), msg.get("content"), msg.get("ts"), ticket_id)
+            )
+            return True
+
+    def update_fields(self, ticket_id: str, updates: Dict[str, Any]) -> bool:
+        cols = {k: v for k, v in updates.items() if k in COLUMNS and k != "id"}
+        extra = {k: v for k, v in updates.items() if k not in COLUMNS and k != "messages"}
+        if "tags" in cols:
+            cols["tags"] = json.dumps(cols["tags"])
+        with self._write() as conn:
+            row = conn.execute("SELECT extra FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+            if row is None:
+                return False
+            if extra:
+                merged = json.loads(row["extra"]) if row["extra"] else {}
+                merged.update(extra)
+                cols["extra"] = json.dumps(merged)
+            if cols:
+                assignments = ", ".join(f"{k} = ?" for k in cols)
+                conn.execute(f"UPDATE tickets SET {assignments} WHERE id = ?", (*cols.values(), ticket_id))
+            return True
+
+    def delete_ticket(self, ticket_id: str, deleted_at: Optional[float] = None):
+        with self._write() as conn:
+            row = conn.execute("SELECT customer_id FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+            if row is None:
+                return
+            conn.execute("DELETE FROM messages WHERE ticket_id = ?", (ticket_id,))
+            conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO deletions (ticket_id, customer_id, deleted_at) VALUES (?, ?, ?)",
+                (ticket_id, row["customer_id"], deleted_at or time.time())
+            )
+
+    # ---------------- Reads ----------------
+    def get_ticket(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM tickets WHERE id = ?", (ticket_id,)).fetchone()
+            if row is None:
+                return None
+            t = self._row_to_ticket(row)
+            t["messages"] = [dict(m) for m in self._message_rows(ticket_id)]
+            return t
+
+    def list_tickets(self, status: Optional[str] = None, customer_id: Optional[str] = None,
+                     limit: Optional[int] = None, after: Optional[tuple] = None,
+                     with_messages: bool = True) -> List[Dict[str, Any]]:
+        """
+        Tickets newest first, ordered by (created_at, id).
+        after: (created_at, id) keyset cursor; only tickets strictly older are returned.
+        """
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if customer_id:
+            where.append("customer_id = ?")
+            params.append(customer_id)
+        if after is not None:
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        limit_clause = f"LIMIT {int(limit)}" if limit is not None else ""
+
+        with self._lock:
+            # served by idx_tickets_status_created / idx_tickets_customer_created
+            rows = self.conn.execute(
+                f"SELECT * FROM tickets {clause} ORDER BY created_at DESC, id DESC {limit_clause}", params
+            ).fetchall()
+            tickets = [self._row_to_ticket(r) for r in rows]
+            if not with_messages or not tickets:
+                return tickets
+
+            if limit is None:
+                # one pass over messages for the whole result set instead of one query per ticket
+                msg_rows = self.conn.execute(
+                    f"SELECT m.ticket_id, m.role, m.content, m.ts FROM messages m "
+                    f"JOIN tickets ON tickets.id = m.ticket_id {clause} ORDER BY m.ticket_id, m.seq",
+                    params
+                ).fetchall()
+                self._fill_messages(tickets, msg_rows)
+            else:
+                self._attach_messages(tickets)
+        return tickets
+
+    def list_changes(self, since: Optional[float] = None, customer_id: Optional[str] = None,
+                     limit: Optional[int] = None, with_messages: bool = True) -> List[Dict[str, Any]]:
+        """
+        Tickets with updated_at >= since, oldest change first (ordered by (updated_at, id)).
+        """
+        where, params = [], []
+        if customer_id:
+            where.append("customer_id = ?")
+            params.append(customer_id)
+        if since is not None:
+            where.append("updated_at >= ?")
+            params.append(since)
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        limit_clause = f"LIMIT {int(limit)}" if limit is not None else ""
+
+        with self._lock:
+            # served by idx_tickets_updated
+            rows = self.conn.execute(
+                f"SELECT * FROM tickets {clause} ORDER BY updated_at, id {limit_clause}", params
+            ).fetchall()
+            tickets = [self._row_to_ticket(r) for r in rows]
+            if with_messages and tickets:
+                self._attach_messages(tickets)
+        return tickets
+
+    def list_deletions(self, since: float = 0.0, customer_id: Optional[str] = None) -> List[tuple]:
+        """(ticket_id, deleted_at) tombstones with deleted_at >= since."""
+        sql = "SELECT ticket_id, deleted_at FROM deletions WHERE deleted_at >= ?"
+        params = [since]
+        if customer_id:
+            sql += " AND customer_id = ?"
+            params.append(customer_id)
+        with self._lock:
+            return [(r["ticket_id"], r["deleted_at"]) for r in self.conn.execute(sql, params).fetchall()]
+
+    def prune_deletions(self, before: float) -> int:
+        """Drops tombstones older than `before`; returns how many were removed."""
+        with self._write() as conn:
+            return conn.execute("DELETE FROM deletions WHERE deleted_at < ?", (before,)).rowcount
+
+    def change_marker(self) -> tuple:
+        """(latest updated_at, latest deleted_at); both are index lookups."""
+        with self._lock:
+            updated = self.conn.execute("SELECT MAX(updated_at) FROM tickets").fetchone()[0]
+            deleted = self.conn.execute("SELECT MAX(deleted_at) FROM deletions").fetchone()[0]
+        return (updated or 0.0, deleted or 0.0)
+
+    def _attach_messages(self, tickets):
+        ids = [t["id"] for t in tickets]
+        msg_rows = []
+        for i in range(0, len(ids), 500):
+            part = ids[i:i+500]
+            msg_rows.extend(self.conn.execute(
+                f"SELECT ticket_id, role, content, ts FROM messages "
+                f"WHERE ticket_id IN ({', '.join('?' * len(part))}) ORDER BY ticket_id, seq",
+                part
+            ).fetchall())
+        self._fill_messages(tickets, msg_rows)
+
+    def _fill_messages(self, tickets, msg_rows):
+        by_id = {t["id"]: t for t in tickets}
+        for t in tickets:
+            t["messages"] = []
+        for m in msg_rows:
+            by_id[m["ticket_id"]]["messages"].append({"role": m["role"], "content": m["content"], "ts": m["ts"]})
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    # quick smoke test against a throwaway in-memory database
+    import time
+    store = SqliteTicketStore(":memory:")
+    t0 = time.time()
+    with store.batch():
+        for i in range(10000):
+            now = time.time()
+            store.insert_ticket({
+                "id": f"t{i}", "customer_id": f"c{i % 50}", "text": "hello", "tags": ["general"],
+                "sentiment": "neutral", "priority": "medium", "status": "open" if i % 3 else "resolved",
+                "created_at": now, "updated_at": now,
+                "messages": [{"role": "customer", "content": "hello", "ts": now}]
+            })
+    print("Inserted 10000 tickets in %.3fs" % (time.time() - t0))
+    t0 = time.time()
+    open_tickets = store.list_tickets(status="open", customer_id="c7")
+    print("Listed %d open tickets for c7 in %.4fs" % (len(open_tickets), time.time() - t0))
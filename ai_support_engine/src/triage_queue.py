@@ -0,0 +1,200 @@
+# src/triage_queue.py
+"""
+Priority-ordered triage queue of open tickets: high before medium before low, then
+negative before neutral before positive sentiment, then oldest first.
+
+An in-process indexed heap kept current from the ticket change feed (see
+change_feed.FeedIndex): creates, status changes and metadata updates cost O(log n)
+each, including those made by other workers. Reading the top k is O(k log k).
+"""
+import os
+import time
+import heapq
+
+import db
+from change_feed import FeedIndex
+
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+SENTIMENT_RANK = {"negative": 0, "neutral": 1, "positive": 2}
+QUEUE_FIELDS = ["id", "customer_id", "text", "tags", "sentiment", "priority", "status", "created_at", "updated_at"]
+
+# Minimum seconds between change-feed polls when nothing changed in this process
+TRIAGE_SYNC_S = float(os.getenv("TRIAGE_SYNC_S", "1.0"))
+
+
+def triage_key(ticket):
+    return (
+        PRIORITY_RANK.get(ticket.get("priority"), 1),
+        SENTIMENT_RANK.get(ticket.get("sentiment"), 1),
+        ticket.get("created_at") or 0.0,
+        ticket["id"],
+    )
+
+
+class IndexedHeap:
+    """
+    Binary min-heap of (key, item_id) with a position index, so an item's key can be
+    changed or the item removed in O(log n) without a linear search.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._pos = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item_id):
+        return item_id in self._pos
+
+    def _swap(self, i, j):
+        h = self._heap
+        h[i], h[j] = h[j], h[i]
+        self._pos[h[i][1]] = i
+        self._pos[h[j][1]] = j
+
+    def _up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._heap[i][0] >= self._heap[parent][0]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _down(self, i):
+        n = len(self._heap)
+        while True:
+            smallest, left, right = i, 2 * i + 1, 2 * i + 2
+            if left < n and self._heap[left][0] < self._heap[smallest][0]:
+                smallest = left
+            if right < n and self._heap[right][0] < self._heap[smallest][0]:
+                smallest = right
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def push(self, item_id, key):
+        """Inserts the item, or moves it if it is already present."""
+        i = self._pos.get(item_id)
+        if i is None:
+            self._heap.append((key, item_id))
+            self._pos[item_id] = len(self._heap) - 1
+            self._up(len(self._heap) - 1)
+            return
+        old = self._heap[i][0]
+        self._heap[i] = (key, item_id)
+        if key < old:
+            self._up(i)
+        else:
+            self._down(i)
+
+    def remove(self, item_id):
+        i = self._pos.pop(item_id, None)
+        if i is None:
+            return False
+        last = self._heap.pop()
+        if i < len(self._heap):
+            self._heap[i] = last
+            self._pos[last[1]] = i
+            self._up(i)
+            self._down(self._pos[last[1]])
+        return True
+
+    def peek(self):
+        return self._heap[0][1] if self._heap else None
+
+    def smallest(self, k):
+        """The k smallest item ids in order, walking the heap from the root (O(k log k))."""
+        h = self._heap
+        out = []
+        frontier = [(h[0][0], 0)] if h else []
+        while frontier and len(out) < k:
+            _, i = heapq.heappop(frontier)
+            out.append(h[i][1])
+            for c in (2 * i + 1, 2 * i + 2):
+                if c < len(h):
+                    heapq.heappush(frontier, (h[c][0], c))
+        return out
+
+
+class TriageQueue(FeedIndex):
+    FIELDS = QUEUE_FIELDS
+    LOAD_STATUS = "open"
+
+    def __init__(self, sync_interval=TRIAGE_SYNC_S):
+        super().__init__(sync_interval)
+        self._reset()
+
+    def _reset(self):
+        self._heap = IndexedHeap()
+        self._tickets = {}       # id -> projected ticket (QUEUE_FIELDS)
+
+    def _apply(self, ticket):
+        if ticket.get("status") == "open":
+            self._tickets[ticket["id"]] = ticket
+            self._heap.push(ticket["id"], triage_key(ticket))
+        else:
+            self._drop(ticket["id"])
+
+    def _drop(self, ticket_id):
+        self._tickets.pop(ticket_id, None)
+        self._heap.remove(ticket_id)
+
+    def next(self):
+        self.sync()
+        with self._lock:
+            ticket_id = self._heap.peek()
+            return dict(self._tickets[ticket_id]) if ticket_id else None
+
+    def top(self, limit=20):
+        self.sync()
+        with self._lock:
+            return [dict(self._tickets[i]) for i in self._heap.smallest(limit)], len(self._heap)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, open=len(self._heap))
+
+
+queue = TriageQueue()
+db.add_listener(queue.on_ticket_event)
+
+
+if __name__ == "__main__":
+    import random
+
+    # correctness against a full sort, then the cost of maintaining vs re-sorting
+    h, ref = IndexedHeap(), {}
+    for step in range(20000):
+        tid = f"t{random.randrange(2000)}"
+        if random.random() < 0.2:
+            h.remove(tid)
+            ref.pop(tid, None)
+        else:
+            key = (random.randrange(3), random.randrange(3), random.random(), tid)
+            h.push(tid, key)
+            ref[tid] = key
+    assert h.smallest(50) == [t for _, t in sorted((k, t) for t, k in ref.items())[:50]]
+
+    n = 100000
+    tickets = [{"id": f"t{i}", "priority": random.choice(list(PRIORITY_RANK)),
+                "sentiment": random.choice(list(SENTIMENT_RANK)), "created_at": time.time() - i} for i in range(n)]
+    h = IndexedHeap()
+    for t in tickets:
+        h.push(t["id"], triage_key(t))
+
+    t0 = time.perf_counter()
+    for t in random.sample(tickets, 1000):
+        t["priority"] = random.choice(list(PRIORITY_RANK))
+        h.push(t["id"], triage_key(t))
+        h.smallest(20)
+    t_heap = (time.perf_counter() - t0) / 1000
+
+    t0 = time.perf_counter()
+    for _ in range(20):
+        sorted(tickets, key=triage_key)[:20]
+    t_sort = (time.perf_counter() - t0) / 20
+    print(f"{n} open tickets")
+    print(f"update + top 20 (indexed heap): {t_heap * 1e6:8.1f} us")
+    print(f"re-sort everything            : {t_sort * 1e6:8.1f} us")
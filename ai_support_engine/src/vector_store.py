@@ -1,27 +1,416 @@
 # src/vector_store.py
 import os
 import json
+import mmap
+import time
+import zlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from collections.abc import Mapping, Sequence
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 ROOT = os.path.join(os.path.dirname(__file__), "..")
-EMB_PATH = os.path.join(ROOT, "models", "chunk_embeddings.npy")
-META_PATH = os.path.join(ROOT, "models", "chunk_meta.json")
+# Where the chunk index lives; point it elsewhere to run against a scratch copy (e.g. loadtest.py)
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(ROOT, "models"))
+EMB_PATH = os.path.join(INDEX_DIR, "chunk_embeddings.npy")
+META_PATH = os.path.join(INDEX_DIR, "chunk_meta.json")
+HEADER_PATH = os.path.join(INDEX_DIR, "index_header.json")
+
+# Rebuild the index when its header or dimension disagrees with the current embedding settings
+INDEX_AUTO_REBUILD = os.getenv("INDEX_AUTO_REBUILD", "1") == "1"
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking degrades to in-process only
+    fcntl = None
+
+# "none" (float32 scan), "float16" or "int8" (per-dimension scale).
+# Quantized modes scan a compact copy and rescore the best candidates in float32.
+VECTOR_QUANT = os.getenv("VECTOR_QUANT", "none")
+QUANT_MODES = ("none", "float16", "int8")
+SCAN_BLOCK = 65536  # rows converted to float32 at a time during a quantized scan
+
+def _sidecar(emb_path, suffix):
+    return emb_path[:-len(".npy")] + suffix if emb_path.endswith(".npy") else emb_path + suffix
+
+@contextmanager
+def _replacing(path, mode="wb", **kwargs):
+    """
+    Opens a uniquely named temp file next to `path` and moves it over `path` when the block
+    succeeds, so concurrent writers never share a temp file and readers never see a partial one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def atomic_save(path, arr):
+    """np.save via write-then-rename, so readers (and mmaps in other workers) never see a truncated file."""
+    with _replacing(path) as f:
+        np.save(f, arr)
+
+def atomic_write_json(path, obj, **kwargs):
+    with _replacing(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, **kwargs)
+
+def save_meta(meta, meta_path=META_PATH):
+    """Writes chunk metadata (JSON, the source of truth) and its snapshot."""
+    atomic_write_json(meta_path, meta, ensure_ascii=False, indent=2)
+    write_meta_snapshot(meta, meta_path)
+
+def _normalize_rows(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+def quantize(emb, mode):
+    """
+    Quantizes row-normalized embeddings.
+    Returns (codes, scale); scale is None for float16 and a (D,) float32 array for int8.
+    """
+    unit = _normalize_rows(np.asarray(emb, dtype="float32"))
+    if mode == "float16":
+        return unit.astype("float16"), None
+    if mode == "int8":
+        scale = np.abs(unit).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.clip(np.rint(unit / scale), -127, 127).astype("int8")
+        return codes, scale.astype("float32")
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+def header_path_for(emb_path):
+    return os.path.join(os.path.dirname(emb_path), "index_header.json")
+
+def read_header(emb_path=EMB_PATH):
+    path = header_path_for(emb_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_header(emb, emb_path=EMB_PATH, config=None):
+    """
+    Records how the index was embedded (model, requested dim, projection) plus its
+    actual shape, so queries can be checked against it.
+    """
+    from model_engine import embedding_config
+    header = dict(config or embedding_config())
+    header["vector_dim"] = int(emb.shape[1]) if getattr(emb, "ndim", 0) == 2 else 0
+    header["count"] = int(len(emb))
+    header["written_at"] = time.time()
+    atomic_write_json(header_path_for(emb_path), header, indent=2)
+    return header
+
+# headers written before a setting existed imply its historical value
+LEGACY_HEADER_DEFAULTS = {"backend": "openai"}
+
+def header_matches(header):
+    """True if the index was built with the current embedding settings (legacy indexes without a header pass)."""
+    if header is None:
+        return True
+    from model_engine import embedding_config
+    current = embedding_config()
+    return all(header.get(k, LEGACY_HEADER_DEFAULTS.get(k)) == v for k, v in current.items())
+
+# ---------------- Metadata snapshot ----------------
+# chunk_meta.json stays the source of truth. Next to it, chunk_meta.snapshot holds the
+# same rows as separately encoded JSON records behind an offset table, mapped read-only:
+# opening it is a few header checks (plus a CRC of the payload) instead of parsing every
+# chunk, and a row is decoded only when it is used.
+#   magic (8) | header length (uint32) | header JSON | pad to 8 | offsets int64[n+1] | ids JSON | rows
+SNAPSHOT_MAGIC = b"KBSNAP\x00\x01"
+SNAPSHOT_VERIFY = os.getenv("INDEX_SNAPSHOT_VERIFY", "1") == "1"
+
+def snapshot_path_for(meta_path):
+    return os.path.splitext(meta_path)[0] + ".snapshot"
+
+def _file_signature(path):
+    # os.replace gives every rewrite a new inode
+    st = os.stat(path)
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+def write_meta_snapshot(meta, meta_path=META_PATH, source=None):
+    """Snapshot of `meta`, which must be what meta_path currently holds (source: its signature)."""
+    rows = [json.dumps(m, ensure_ascii=False).encode("utf-8") for m in meta]
+    ids = json.dumps([m.get("chunk_id") for m in meta], ensure_ascii=False).encode("utf-8")
+    offsets = np.zeros(len(rows) + 1, dtype="<i8")
+    np.cumsum([len(r) for r in rows], out=offsets[1:])
+    payload = [offsets.tobytes(), ids, *rows]
+    crc = 0
+    for part in payload:
+        crc = zlib.crc32(part, crc)
+    header = json.dumps({
+        "version": 1, "count": len(rows), "ids_bytes": len(ids), "rows_bytes": int(offsets[-1]),
+        "crc32": crc, "source": source or _file_signature(meta_path),
+    }).encode("utf-8")
+    pad = b" " * (-(len(SNAPSHOT_MAGIC) + 4 + len(header)) % 8)
+    # also written by readers (load_meta), so several workers may do this at once
+    with _replacing(snapshot_path_for(meta_path)) as f:
+        f.write(SNAPSHOT_MAGIC + len(header + pad).to_bytes(4, "little") + header + pad)
+        for part in payload:
+            f.write(part)
+
+class MetaSnapshot(Sequence):
+    """Read-only list of chunk metadata dicts backed by a mapped snapshot; rows decode on access."""
+
+    def __init__(self, path, source=None, verify=SNAPSHOT_VERIFY):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("not an index snapshot")
+        hlen = int.from_bytes(mm[8:12], "little")
+        header = json.loads(mm[12:12 + hlen])
+        if source is not None and header["source"] != source:
+            raise ValueError("metadata changed since the snapshot was written")
+        n = header["count"]
+        start = 12 + hlen
+        self._ids_at = start + 8 * (n + 1)
+        self._rows_at = self._ids_at + header["ids_bytes"]
+        if len(mm) != self._rows_at + header["rows_bytes"]:
+            raise ValueError("truncated snapshot")
+        if verify and zlib.crc32(memoryview(mm)[start:]) != header["crc32"]:
+            raise ValueError("snapshot checksum mismatch")
+        self.offsets = np.frombuffer(mm, dtype="<i8", count=n + 1, offset=start)
+        self.header = header
+        self._ids = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("chunk index out of range")
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return json.loads(self._mm[self._rows_at + a:self._rows_at + b])
+
+    def chunk_ids(self):
+        if self._ids is None:
+            self._ids = json.loads(self._mm[self._ids_at:self._rows_at])
+        return self._ids
+
+class _ChunkLookup(Mapping):
+    """chunk_id -> metadata over a MetaSnapshot, decoding only the rows looked up."""
+
+    def __init__(self, meta):
+        self._meta = meta
+        self._index = {cid: i for i, cid in enumerate(meta.chunk_ids())}
+
+    def __getitem__(self, chunk_id):
+        return self._meta[self._index[chunk_id]]
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+def load_meta(meta_path=META_PATH):
+    """
+    Chunk metadata for meta_path: its snapshot when that matches the file, otherwise the
+    parsed JSON (and the snapshot is rewritten for the next load).
+    """
+    source = _file_signature(meta_path)
+    snap = snapshot_path_for(meta_path)
+    try:
+        return MetaSnapshot(snap, source=source)
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, OSError) as e:
+        print(f"[INFO] Rebuilding index snapshot ({e})")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    try:
+        write_meta_snapshot(meta, meta_path, source)
+    except OSError as e:
+        print(f"[WARN] Could not write index snapshot {snap}: {e}")
+    return meta
+
+# ---------------- Cross-worker coordination ----------------
+# Every writer bumps a generation file next to the index; readers in any worker
+# compare its stat() to what they loaded and reload lazily when it changes.
+
+def generation_path_for(emb_path):
+    return os.path.join(os.path.dirname(emb_path), "index_generation")
+
+def read_generation(emb_path=EMB_PATH):
+    try:
+        with open(generation_path_for(emb_path), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def bump_generation(emb_path=EMB_PATH):
+    """Atomically increments the on-disk generation (call while holding index_write_lock)."""
+    path = generation_path_for(emb_path)
+    gen = read_generation(emb_path) + 1
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(gen))
+    os.replace(tmp, path)
+    return gen
+
+def _generation_key(emb_path):
+    # os.replace gives the file a new inode, so (inode, mtime) changes on every bump
+    try:
+        st = os.stat(generation_path_for(emb_path))
+        return (st.st_ino, st.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+class _IndexLock:
+    """Re-entrant lock that is exclusive across threads and (where fcntl exists) worker processes."""
+
+    def __init__(self):
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fh = None
+
+    @contextmanager
+    def hold(self, emb_path):
+        with self._rlock:
+            if self._depth == 0:
+                os.makedirs(os.path.dirname(os.path.abspath(emb_path)), exist_ok=True)
+                self._fh = open(os.path.join(os.path.dirname(emb_path), "index.lock"), "a+")
+                if fcntl is not None:
+                    fcntl.flock(self._fh, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    if fcntl is not None:
+                        fcntl.flock(self._fh, fcntl.LOCK_UN)
+                    self._fh.close()
+                    self._fh = None
+
+_index_lock = _IndexLock()
+
+def index_write_lock(emb_path=EMB_PATH):
+    """
+    Serializes index writers (upload, delete, rebuild) across workers:
+        with index_write_lock():
+            ... write files ...
+            bump_generation()
+    """
+    return _index_lock.hold(emb_path)
 
 class SimpleVectorStore:
-    def __init__(self, emb_path=EMB_PATH, meta_path=META_PATH):
+    def __init__(self, emb_path=EMB_PATH, meta_path=META_PATH, quant=None, mmap=False):
+        """
+        mmap: map the matrices read-only instead of copying them into this process,
+        so several workers share one copy through the OS page cache.
+        """
+        self.emb_path = emb_path
+        self.meta_path = meta_path
+        self.quant = quant or VECTOR_QUANT
+        if self.quant not in QUANT_MODES:
+            raise ValueError(f"quant must be one of {QUANT_MODES}")
+        self.mmap = mmap
+        self.codes = None
+        self.scale = None
+        self._by_chunk = None
+        self._norms = None
+        self._mismatch_logged = False
+        self.generation = read_generation(emb_path)
+
         if not os.path.exists(emb_path) or not os.path.exists(meta_path):
             print("[WARN] Vector store files not found. Initializing empty.")
             self.emb = np.array([])
             self.meta = []
+            # metadata alone still serves citation lookups
+            if os.path.exists(meta_path):
+                self.meta = load_meta(meta_path)
         else:
-            self.emb = np.load(emb_path)           # shape: (N, D)
-            with open(meta_path, "r", encoding="utf-8") as f:
-                self.meta = json.load(f)           # list of dicts
+            if self.quant == "none":
+                self.emb = np.load(emb_path, mmap_mode="r" if mmap else None)           # shape: (N, D)
+            else:
+                # full precision stays on disk; only rescoring candidates are paged in
+                self.emb = np.load(emb_path, mmap_mode="r")
+                self._load_quantized()
+            self.meta = load_meta(meta_path)       # sequence of dicts
+        self.header = read_header(emb_path)
+
+    # ---------------- Quantized copy ----------------
+    def _quant_paths(self):
+        return _sidecar(self.emb_path, f".{self.quant}.npy"), _sidecar(self.emb_path, f".{self.quant}_scale.npy")
+
+    def _load_quantized(self):
+        if self._open_quantized():
+            return
+        # one worker builds the sidecars while the others wait for the lock and load its files
+        with index_write_lock(self.emb_path):
+            if self._open_quantized():
+                return
+            # a writer replaced the index after this instance loaded it: don't persist sidecars
+            # derived from the old matrix (they would look fresh next to the new one)
+            self._build_quantized(persist=read_generation(self.emb_path) == self.generation)
 
-    def search(self, query_vec, top_k=5):
+    def _open_quantized(self):
+        """Loads the sidecar files if they are at least as new as the float32 matrix and match it."""
+        codes_path, scale_path = self._quant_paths()
+        fresh = os.path.exists(codes_path) and os.path.getmtime(codes_path) >= os.path.getmtime(self.emb_path)
+        if self.quant == "int8":
+            fresh = fresh and os.path.exists(scale_path)
+        if not fresh:
+            return False
+        self.codes = np.load(codes_path, mmap_mode="r" if self.mmap else None)
+        self.scale = np.load(scale_path) if self.quant == "int8" else None
+        return self.codes.shape == self.emb.shape
+
+    def _build_quantized(self, persist=True):
+        """(Re)builds the quantized copy from the float32 matrix; persist writes the sidecars (hold index_write_lock)."""
+        if len(self.emb) == 0:
+            self.codes, self.scale = None, None
+            return
+        self.codes, self.scale = quantize(self.emb, self.quant)
+        if not persist:
+            return
+        codes_path, scale_path = self._quant_paths()
+        if self.scale is not None:
+            atomic_save(scale_path, self.scale)
+        # codes last: their mtime is what marks the sidecars fresh
+        atomic_save(codes_path, self.codes)
+
+    def _quantized_scores(self, q_unit):
+        """Approximate cosine scores against every row, scanning in bounded blocks."""
+        q = q_unit * self.scale if self.scale is not None else q_unit
+        scores = np.empty(len(self.codes), dtype="float32")
+        for start in range(0, len(self.codes), SCAN_BLOCK):
+            block = self.codes[start:start + SCAN_BLOCK]
+            scores[start:start + SCAN_BLOCK] = block.astype("float32") @ q
+        return scores
+
+    def memory_bytes(self):
+        """Resident bytes used by the scan copy (the mmap'd float32 matrix is excluded when quantized)."""
+        if self.quant == "none":
+            return int(self.emb.nbytes) if len(self.emb) else 0
+        total = int(self.codes.nbytes) if self.codes is not None else 0
+        return total + (int(self.scale.nbytes) if self.scale is not None else 0)
+
+    # ---------------- Search ----------------
+    def search(self, query_vec, top_k=5, rescore_k=None):
         """
         query_vec: 1D numpy array shape (D,)
+        rescore_k: quantized modes only; number of candidates rescored exactly (default max(4*top_k, 50))
         returns list of hits: {idx, score, meta}
         """
         if query_vec is None:
@@ -30,59 +419,225 @@ class SimpleVectorStore:
             return []
         # Ensure shape
         q = query_vec.reshape(1, -1)
-        # Verify Dims (Simple check)
-        if q.shape[1] != self.emb.shape[1]:
-             print(f"[ERROR] Dim mismatch! Query={q.shape[1]}, Store={self.emb.shape[1]}. Resetting store recommended.")
-             return []
+        # Verify Dims / header against the current embedding settings
+        if q.shape[1] != self.emb.shape[1] or not header_matches(self.header):
+            # never re-embed inside a request: a background job rebuilds the files and the
+            # next get_store() after its generation bump serves the new index
+            if not self._mismatch_logged:
+                print(f"[WARN] Index does not match embedding settings (query dim={q.shape[1]}, store dim={self.emb.shape[1]}, header={self.header}); "
+                      + ("rebuilding in the background." if INDEX_AUTO_REBUILD else "run embed_chunks.py to rebuild."))
+                self._mismatch_logged = True
+            if INDEX_AUTO_REBUILD:
+                request_rebuild(self.emb_path, self.meta_path)
+            return []
+
+        if self.quant == "none":
+            sims = self._cosine_scores(q[0])   # (N,)
+            idxs = sims.argsort()[-top_k:][::-1]
+            scored = [(int(i), float(sims[i])) for i in idxs]
+        else:
+            scored = self._search_quantized(q[0].astype("float32"), top_k, rescore_k)
 
-        sims = cosine_similarity(q, self.emb)[0]   # (N,)
-        idxs = sims.argsort()[-top_k:][::-1]
         hits = []
-        for i in idxs:
+        for i, s in scored:
             hits.append({
-                "idx": int(i),
-                "score": float(sims[i]),
+                "idx": i,
+                "score": s,
                 "meta": self.meta[i]
             })
         return hits
 
+    def _cosine_scores(self, q):
+        """Cosine similarity of q with every row; row norms are computed once per load."""
+        if self._norms is None:
+            norms = np.linalg.norm(self.emb, axis=1)
+            norms[norms == 0] = 1.0
+            self._norms = norms
+        q = np.asarray(q, dtype=self.emb.dtype)
+        return (self.emb @ q) / (self._norms * (np.linalg.norm(q) or 1.0))
+
+    def prime(self):
+        """Pages in the matrix and builds the lazy structures a first query would otherwise pay for."""
+        if len(self.emb):
+            if self.quant == "none":
+                self._cosine_scores(np.zeros(self.emb.shape[1], dtype=self.emb.dtype))
+            else:
+                self._quantized_scores(np.zeros(self.emb.shape[1], dtype="float32"))
+        return len(self.by_chunk)
+
+    def _search_quantized(self, q, top_k, rescore_k=None):
+        n = len(self.codes)
+        q_norm = np.linalg.norm(q)
+        q_unit = q / q_norm if q_norm else q
+        approx = self._quantized_scores(q_unit)
+
+        k = min(n, max(rescore_k or max(4 * top_k, 50), top_k))
+        cand = np.argpartition(-approx, k - 1)[:k] if k < n else np.arange(n)
+        cand.sort()  # sequential reads from the mmap
+
+        # exact float32 cosine for the candidates only
+        full = np.asarray(self.emb[cand], dtype="float32")
+        exact = _normalize_rows(full) @ q_unit
+        order = np.argsort(-exact)[:top_k]
+        return [(int(cand[j]), float(exact[j])) for j in order]
+
+    def rebuild(self):
+        """
+        Re-embeds every chunk in the metadata with the current embedding settings and
+        reloads. Serialized across workers; a rebuild finished by another caller is reused.
+        Reinitializes this instance, so call it on a private store (see request_rebuild),
+        never on the shared get_store() one.
+        """
+        with index_write_lock(self.emb_path):
+            header = read_header(self.emb_path)
+            # a reader can see a mismatch just while a writer swaps the projection and the
+            # matrix; whatever is on disk now is what counts
+            if header is not None and header_matches(header):
+                print("[INFO] Index already matches the embedding settings; reloading.")
+            else:
+                from embed_chunks import rebuild_index
+                if read_generation(self.emb_path) != self.generation and os.path.exists(self.meta_path):
+                    with open(self.meta_path, "r", encoding="utf-8") as f:
+                        self.meta = json.load(f)
+                print(f"[INFO] Rebuilding index for {len(self.meta)} chunks...")
+                if not rebuild_index(self.meta, self.emb_path, self.meta_path):
+                    return False
+        self.__init__(self.emb_path, self.meta_path, self.quant, self.mmap)
+        return True
+
     def get_all_chunks(self):
         """Returns all chunks with their metadata."""
-        return self.meta
+        return list(self.meta)
+
+    @property
+    def by_chunk(self):
+        """chunk_id -> metadata, built on first use."""
+        if self._by_chunk is None:
+            if isinstance(self.meta, MetaSnapshot):
+                self._by_chunk = _ChunkLookup(self.meta)
+            else:
+                self._by_chunk = {m["chunk_id"]: m for m in self.meta}
+        return self._by_chunk
 
     def delete_chunk(self, chunk_id):
         """Deletes a chunk by its chunk_id."""
-        # Find index
-        idx_to_remove = -1
-        for i, m in enumerate(self.meta):
-            if m.get("chunk_id") == chunk_id:
-                idx_to_remove = i
-                break
-        
-        if idx_to_remove == -1:
-            return False # Not found
-
-        # Remove from meta
-        self.meta.pop(idx_to_remove)
-        
-        # Remove from emb
-        self.emb = np.delete(self.emb, idx_to_remove, axis=0)
-
-        # Save to disk
-        self._save()
-        return True
+        with index_write_lock(self.emb_path):
+            # another worker may have written since this instance was loaded
+            if read_generation(self.emb_path) != self.generation:
+                self.__init__(self.emb_path, self.meta_path, self.quant, self.mmap)
+            self.meta = list(self.meta)
+
+            # Find index
+            idx_to_remove = -1
+            for i, m in enumerate(self.meta):
+                if m.get("chunk_id") == chunk_id:
+                    idx_to_remove = i
+                    break
+
+            if idx_to_remove == -1:
+                return False # Not found
+
+            # Remove from meta
+            self.meta.pop(idx_to_remove)
+            self._by_chunk = None
+
+            # Remove from emb
+            if idx_to_remove < len(self.emb):
+                self.emb = np.delete(self.emb, idx_to_remove, axis=0)
+                self._norms = None
+
+            # Save to disk
+            self._save()
+            return True
 
     def _save(self):
         """Saves current embeddings and metadata to disk."""
-        np.save(EMB_PATH, self.emb)
-        with open(META_PATH, "w", encoding="utf-8") as f:
-            json.dump(self.meta, f, indent=2)
+        atomic_save(self.emb_path, self.emb)
+        save_meta(self.meta, self.meta_path)
+        self.header = write_header(self.emb, self.emb_path, config=self.header and {
+            k: self.header.get(k, LEGACY_HEADER_DEFAULTS.get(k)) for k in ("backend", "model", "dim", "projection")
+        })
+        if self.quant != "none":
+            self._build_quantized()
+        self.generation = bump_generation(self.emb_path)
+
+# ---------------- Shared per-process store ----------------
+_shared = None
+_shared_key = None
+_shared_lock = threading.Lock()
+_rebuild_job = None
+_rebuild_failed_at = 0.0
+REBUILD_RETRY_S = 60.0
+
+def _rebuild_in_background(emb_path, meta_path):
+    global _rebuild_job, _rebuild_failed_at
+    ok = False
+    try:
+        ok = SimpleVectorStore(emb_path, meta_path, mmap=True).rebuild()
+    except Exception as e:
+        print(f"[ERROR] Background index rebuild failed: {e}")
+    finally:
+        with _shared_lock:
+            _rebuild_job = None
+            if not ok:
+                _rebuild_failed_at = time.monotonic()
+
+def request_rebuild(emb_path=EMB_PATH, meta_path=META_PATH):
+    """Starts one background rebuild per process (no-op while one runs); readers pick it up via the generation."""
+    global _rebuild_job
+    with _shared_lock:
+        if _rebuild_job is not None or time.monotonic() - _rebuild_failed_at < REBUILD_RETRY_S:
+            return
+        _rebuild_job = threading.Thread(target=_rebuild_in_background, args=(emb_path, meta_path),
+                                        name="index-rebuild", daemon=True)
+        _rebuild_job.start()
+
+def get_store(emb_path=EMB_PATH, meta_path=META_PATH):
+    """
+    The process-wide store, reloaded lazily when another worker (or this one) bumps
+    the index generation. The check is one stat() per call.
+    """
+    global _shared, _shared_key
+    key = _generation_key(emb_path)
+    store = _shared
+    if store is None or key != _shared_key or store.emb_path != emb_path:
+        with _shared_lock:
+            if _shared is None or key != _shared_key or _shared.emb_path != emb_path:
+                _shared = SimpleVectorStore(emb_path, meta_path, mmap=True)
+                _shared_key = key
+            store = _shared
+    return store
+
+def quantization_report(emb_path=EMB_PATH, meta_path=META_PATH, n_queries=200, top_k=5, seed=0):
+    """
+    Recall@k of each quantized mode against the exact float32 scan, using the
+    store's own vectors (plus a little noise) as queries.
+    """
+    exact = SimpleVectorStore(emb_path, meta_path, quant="none")
+    if len(exact.emb) == 0:
+        print("Vector store is empty.")
+        return []
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(exact.emb), size=min(n_queries, len(exact.emb)), replace=False)
+    queries = exact.emb[picks] + rng.normal(0, 0.01, size=(len(picks), exact.emb.shape[1])).astype("float32")
+    truth = [{h["idx"] for h in exact.search(q, top_k=top_k)} for q in queries]
+
+    rows = [{"mode": "none", "bytes": exact.memory_bytes(), "recall": 1.0}]
+    for mode in ("float16", "int8"):
+        vs = SimpleVectorStore(emb_path, meta_path, quant=mode)
+        found = [{h["idx"] for h in vs.search(q, top_k=top_k)} for q in queries]
+        recall = float(np.mean([len(f & t) / len(t) for f, t in zip(found, truth)]))
+        rows.append({"mode": mode, "bytes": vs.memory_bytes(), "recall": recall})
+    for r in rows:
+        print(f"{r['mode']:8s} scan memory={r['bytes'] / 1e6:8.2f} MB  recall@{top_k}={r['recall']:.4f}")
+    return rows
 
 if __name__ == "__main__":
     # quick smoke test
     vs = SimpleVectorStore()
     print("Loaded vector store. Embeddings shape:", vs.emb.shape, "meta len:", len(vs.meta))
-    # dummy zero vector test (will return top arbitrary chunks)
-    import numpy as np
-    q = np.zeros(vs.emb.shape[1], dtype="float32")
-    print("Top hits for zero vector:", vs.search(q, top_k=3))
+    if len(vs.emb):
+        # dummy zero vector test (will return top arbitrary chunks)
+        q = np.zeros(vs.emb.shape[1], dtype="float32")
+        print("Top hits for zero vector:", vs.search(q, top_k=3))
+        quantization_report()
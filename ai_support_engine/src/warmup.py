@@ -0,0 +1,178 @@
+# src/warmup.py
+"""
+Startup warm-up: loads what the first requests would otherwise pay for, then marks the
+process ready (GET /health answers 503 until then).
+
+    index     chunk metadata snapshot, embedding matrix pages and row norms, chunk-id lookup
+    knowledge browse/search index behind GET /knowledge
+    tickets   first ticket store round-trip (opens the Firestore channel / sqlite connection)
+    feeds     triage queue and similar-ticket index, loaded from the store
+    clients   OpenAI chat and embedding clients; WARMUP_PING=1 also sends one embedding
+              request so a pooled connection is open before traffic arrives
+    text      token encoder and stop-word list
+
+A failed step is reported in /health and logged, but does not hold readiness back: the
+affected path loads (or fails) on first use, as it would without warm-up. WARMUP=0
+skips all of it and reports ready at once.
+
+    python warmup.py        # startup benchmark
+"""
+import os
+import time
+import threading
+
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_PING = os.getenv("WARMUP_PING", "0") == "1"
+
+_state = {"ready": not WARMUP, "started_at": None, "finished_at": None, "steps": {}, "errors": {}}
+_lock = threading.Lock()
+_thread = None
+
+
+def _index():
+    from vector_store import get_store
+    store = get_store()
+    store.prime()
+    return f"{len(store.meta)} chunks"
+
+def _knowledge():
+    import knowledge_index
+    idx = knowledge_index.get_index()
+    return f"{len(idx)} chunks, {len(idx.vocab)} words"
+
+def _tickets():
+    import db
+    db.get_change_marker()
+
+def _feeds():
+    from triage_queue import queue as triage
+    from similar_tickets import index as similar_index
+    triage.sync(force=True)
+    similar_index.sync(force=True)
+    return f"{len(triage._heap)} open, {len(similar_index._entries)} indexed"
+
+def _clients():
+    from rag_chain import get_client
+    from model_engine import load_embedding_model
+    load_embedding_model()
+    get_client()
+    if WARMUP_PING:
+        from recommender import embed_query
+        if embed_query("warm up") is None:
+            raise RuntimeError("embedding ping failed")
+
+def _text():
+    from prompt_builder import count_tokens
+    from similar_tickets import stop_words
+    count_tokens("warm up")
+    stop_words()
+
+STEPS = [("index", _index), ("knowledge", _knowledge), ("tickets", _tickets), ("feeds", _feeds), ("clients", _clients), ("text", _text)]
+
+
+def run():
+    """Runs every step in order (in the calling thread) and marks the process ready."""
+    with _lock:
+        _state.update(ready=False, started_at=time.time(), finished_at=None, steps={}, errors={})
+    t_start = time.perf_counter()
+    for name, fn in STEPS:
+        t0 = time.perf_counter()
+        try:
+            detail = fn()
+        except Exception as e:
+            detail = None
+            with _lock:
+                _state["errors"][name] = str(e)
+            print(f"[WARN] Warm-up step {name} failed: {e}")
+        with _lock:
+            _state["steps"][name] = {"ms": round((time.perf_counter() - t0) * 1000, 1), "detail": detail}
+    with _lock:
+        _state.update(ready=True, finished_at=time.time())
+    print(f"[INFO] Warm-up finished in {time.perf_counter() - t_start:.2f}s; ready")
+    return status()
+
+def start():
+    """Starts the warm-up on a background thread (once per process); a no-op with WARMUP=0."""
+    global _thread
+    if not WARMUP:
+        return
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=run, name="warmup", daemon=True)
+    _thread.start()
+
+def is_ready():
+    return _state["ready"]
+
+def status():
+    with _lock:
+        return {**_state, "steps": dict(_state["steps"]), "errors": dict(_state["errors"])}
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+    import shutil
+    import random
+    import tempfile
+    import subprocess
+
+    def timed_subprocess(code, repeat=3):
+        # best of `repeat` fresh interpreters: what a cold worker pays
+        best = None
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+            if out.returncode != 0:
+                return None
+            t = float(out.stdout.strip().splitlines()[-1])
+            best = t if best is None else min(best, t)
+        return best
+
+    print("Cold import (best of 3 fresh processes):")
+    probe = "import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)"
+    for label, mod in [("api (lazy heavy deps)", "api"),
+                       ("  deferred: sklearn", "sklearn.metrics.pairwise"),
+                       ("  deferred: openai", "openai"),
+                       ("  deferred: google-cloud-firestore", "google.cloud.firestore"),
+                       ("  deferred: pypdf", "pypdf")]:
+        t = timed_subprocess(probe.format(mod))
+        print(f"  {label:36s} {t * 1000:8.1f} ms" if t is not None else f"  {label:36s} unavailable")
+
+    # metadata load: JSON parse vs snapshot open, on a synthetic 100k-chunk KB
+    from vector_store import load_meta, save_meta, MetaSnapshot, snapshot_path_for
+    tmp = tempfile.mkdtemp(prefix="warmup-bench-")
+    try:
+        words = "order refund password login tracking account charged delivery invoice card".split()
+        meta = [{"chunk_id": f"doc_{i // 20}_{i % 20}", "article_id": f"doc_{i // 20}", "title": f"Article {i // 20}",
+                 "chunk_text": " ".join(random.choices(words, k=60))} for i in range(100000)]
+        path = os.path.join(tmp, "chunk_meta.json")
+        save_meta(meta, path)
+        t0 = time.perf_counter()
+        with open(path, encoding="utf-8") as f:
+            json.load(f)
+        t_json = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        snap = load_meta(path)
+        t_snap = time.perf_counter() - t0
+        assert isinstance(snap, MetaSnapshot) and snap[12345] == meta[12345]
+        t0 = time.perf_counter()
+        MetaSnapshot(snapshot_path_for(path), verify=False)
+        t_noverify = time.perf_counter() - t0
+        print(f"\nChunk metadata, {len(meta)} chunks ({os.path.getsize(path) / 1e6:.1f} MB JSON):")
+        print(f"  json.load                            {t_json * 1000:8.1f} ms")
+        print(f"  snapshot open + CRC check            {t_snap * 1000:8.1f} ms")
+        print(f"  snapshot open (INDEX_SNAPSHOT_VERIFY=0) {t_noverify * 1000:5.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    t0 = time.perf_counter()
+    import api  # noqa: F401  (what the server imports before warm-up starts)
+    t_import = time.perf_counter() - t0
+    report = run()
+    print(f"\nWarm-up in this process (after a {t_import * 1000:.0f} ms import):")
+    for name, step in report["steps"].items():
+        err = report["errors"].get(name)
+        print(f"  {name:10s} {step['ms']:8.1f} ms  {err or step['detail'] or ''}")
+    print(f"  ready after {(report['finished_at'] - report['started_at']) * 1000:.0f} ms of warm-up")
@@ -273,7 +273,8 @@ const AgentTab = ({ addToast }) => {
 
     const fetchTickets = async () => {
         try {
-            const res = await fetch(`${API_BASE}/tickets?status=open`);
+            // List view only needs summary fields; full messages are loaded in loadTicket
+            const res = await fetch(`${API_BASE}/tickets?status=open&fields=text,tags,sentiment,priority,status,customer_id`);
             const data = await res.json();
             setTickets(data);
         } catch (err) {
@@ -288,7 +289,7 @@ const AgentTab = ({ addToast }) => {
     }, []);
 
     const loadTicket = async (t) => {
-        setActiveTicket(t);
+        setActiveTicket({ ...t, messages: [] });
         setSuggestion(null);
         setSummary(null);
         setReplyText('');
@@ -301,11 +302,15 @@ const AgentTab = ({ addToast }) => {
         if (!activeTicket) return;
         setLoadingSuggestion(true);
         try {
-            const res = await fetch(`${API_BASE}/tickets/${activeTicket.id}/suggest`, { method: 'POST' });
+            const res = await fetch(`${API_BASE}/tickets/${activeTicket.id}/suggest?evidence=ref`, { method: 'POST' });
             const data = await res.json();
             setSuggestion(data);
             setReplyText(data.answer || '');
             addToast('AI Suggestion generated', 'info');
+            // evidence comes by reference; the browser keeps each chunk and revalidates it (304 when unchanged)
+            const chunks = await Promise.all((data.evidence || []).map(e => e.missing ? null :
+                fetch(`${API_BASE}/knowledge/${encodeURIComponent(e.chunk_id)}`).then(r => r.ok ? r.json() : null).catch(() => null)));
+            setSuggestion({ ...data, evidence: (data.evidence || []).map((e, i) => ({ ...e, chunk_text: chunks[i]?.chunk_text })) });
         } catch (err) {
             console.error(err);
             addToast('Failed to generate suggestion', 'error');
@@ -732,13 +737,21 @@ const KnowledgeBaseEditor = ({ addToast }) => {
     const [chunks, setChunks] = useState([]);
     const [loading, setLoading] = useState(true);
     const [searchTerm, setSearchTerm] = useState('');
+    const [nextCursor, setNextCursor] = useState(null);
+    const [total, setTotal] = useState(null);
 
-    const fetchChunks = async () => {
+    // one page at a time, searched on the server; texts come truncated for the preview
+    const fetchChunks = async (cursor = null) => {
         setLoading(true);
         try {
-            const res = await fetch(`${API_BASE}/knowledge`);
+            const params = new URLSearchParams({ limit: '50', text_chars: '200' });
+            if (searchTerm.trim()) params.set('q', searchTerm.trim());
+            if (cursor) params.set('cursor', cursor);
+            const res = await fetch(`${API_BASE}/knowledge?${params}`);
             const data = await res.json();
-            setChunks(data);
+            setChunks(prev => cursor ? [...prev, ...data.chunks] : data.chunks);
+            setNextCursor(data.next_cursor);
+            setTotal(data.total);
         } catch (err) {
             addToast('Failed to load knowledge base', 'error');
         } finally {
@@ -747,25 +760,22 @@ const KnowledgeBaseEditor = ({ addToast }) => {
     };
 
     useEffect(() => {
-        fetchChunks();
-    }, []);
+        const timer = setTimeout(() => fetchChunks(), 300);
+        return () => clearTimeout(timer);
+    }, [searchTerm]);
 
     const deleteChunk = async (id) => {
         if (!confirm("Are you sure you want to delete this knowledge chunk?")) return;
         try {
             await fetch(`${API_BASE}/knowledge/${id}`, { method: 'DELETE' });
             setChunks(prev => prev.filter(c => c.chunk_id !== id));
+            setTotal(prev => prev === null ? prev : prev - 1);
             addToast('Chunk deleted', 'success');
         } catch (err) {
             addToast('Failed to delete chunk', 'error');
         }
     };
 
-    const filteredChunks = chunks.filter(c =>
-        c.chunk_text.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        c.title.toLowerCase().includes(searchTerm.toLowerCase())
-    );
-
     return (
         <div className="flex-1 flex flex-col overflow-hidden">
             <div className="p-4 bg-gray-50 dark:bg-gray-900 border-b dark:border-gray-700 flex gap-4">
@@ -779,14 +789,14 @@ const KnowledgeBaseEditor = ({ addToast }) => {
                     />
                 </div>
                 <div className="flex items-center gap-2">
-                    <span className="text-sm text-gray-500">{filteredChunks.length} chunks</span>
+                    <span className="text-sm text-gray-500">{total ?? chunks.length}{total === null && nextCursor ? '+' : ''} chunks</span>
                 </div>
             </div>
             <div className="flex-1 overflow-y-auto p-4 space-y-3 custom-scrollbar">
-                {loading ? (
+                {loading && chunks.length === 0 ? (
                     <div className="text-center py-10 text-gray-500">Loading knowledge base...</div>
                 ) : (
-                    filteredChunks.map(c => (
+                    chunks.map(c => (
                         <div key={c.chunk_id} className="p-4 bg-white dark:bg-gray-700/50 border dark:border-gray-600 rounded-xl flex gap-4 group hover:shadow-md transition-all">
                             <div className="flex-1">
                                 <div className="font-bold text-sm text-blue-600 dark:text-blue-400 mb-1">{c.title}</div>
@@ -803,6 +813,15 @@ const KnowledgeBaseEditor = ({ addToast }) => {
                         </div>
                     ))
                 )}
+                {nextCursor && (
+                    <button
+                        onClick={() => fetchChunks(nextCursor)}
+                        disabled={loading}
+                        className="w-full py-2 text-sm text-blue-600 dark:text-blue-400 hover:bg-blue-50 dark:hover:bg-gray-700 rounded-lg disabled:opacity-50"
+                    >
+                        {loading ? 'Loading...' : 'Load more'}
+                    </button>
+                )}
             </div>
         </div>
     );